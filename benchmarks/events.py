@@ -0,0 +1,67 @@
+""" Compare the cost of ``registry.notify`` with and without the event
+dispatch table installed by ``load_zcml(..., compile_events=True)``.
+
+For each number of subscribers, that many handlers are subscribed to
+``NewRequest``, and ``NewRequest``, ``ContextFound`` (which has no
+subscribers) and ``NewResponse`` events are sent the way Pyramid sends
+them for every request.  The time per notification is reported for the
+adapter registry lookup Pyramid normally performs (``lookup``) and for
+the dispatch table (``table``).  For example::
+
+    python benchmarks/events.py --subscribers 0,1,5,20
+
+Run it with ``python benchmarks/events.py --help``.
+"""
+import argparse
+import sys
+import timeit
+
+def make_registry(subscribers, compile_events):
+    from pyramid.config import Configurator
+    from pyramid.events import NewRequest
+    from pyramid_zcml import dispatch_table
+    config = Configurator()
+    for i in range(subscribers):
+        config.add_subscriber(lambda event: None, NewRequest)
+    config.commit()
+    if compile_events:
+        dispatch_table(config.registry).compile()
+    return config.registry
+
+def measure(registry, number):
+    from pyramid.events import ContextFound
+    from pyramid.events import NewRequest
+    from pyramid.events import NewResponse
+    from pyramid.request import Request
+    request = Request.blank('/')
+    events = [NewRequest(request), ContextFound(request),
+              NewResponse(request, None)]
+    notify = registry.notify
+    def run():
+        for event in events:
+            notify(event)
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / number / len(events)
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', default='0,1,5,20',
+                        help='Comma separated numbers of NewRequest '
+                             'subscribers.')
+    parser.add_argument('--number', type=int, default=20000,
+                        help='Notifications of each event per run.')
+    args = parser.parse_args(argv[1:])
+
+    print('%11s  %10s  %10s  %7s' % ('subscribers', 'lookup', 'table',
+                                      'speedup'))
+    for subscribers in [int(s) for s in args.subscribers.split(',')]:
+        lookup = measure(make_registry(subscribers, False), args.number)
+        table = measure(make_registry(subscribers, True), args.number)
+        print('%11d  %8.3fus  %8.3fus  %6.2fx' % (
+            subscribers, lookup * 1e6, table * 1e6, lookup / table))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+""" Measure how the commit time of ZCML adapter and utility registrations
+scales with their number, with and without ``bulk_registration``.
+
+For every size, a corpus of ``adapter`` directives and ``utility``
+directives with a ``factory`` is generated (see ``startup.py``) and loaded
+into a fresh configurator, once registering each component separately and
+once with
+``load_zcml(..., bulk_registration=True)``.  Only ``config.commit`` is
+timed.  The ``growth`` columns give the ratio of the commit time to that
+of the previous size, which stays close to the size ratio when commit
+time grows linearly.  For example::
+
+    python benchmarks/registration.py --sizes 1000,2000,4000,8000,16000
+
+Run it with ``python benchmarks/registration.py --help``.
+"""
+import argparse
+import gc
+import shutil
+import sys
+import tempfile
+import time
+
+from startup import generate
+
+KINDS = ('adapter', 'factory')
+
+def measure(package, bulk_registration):
+    from pyramid.config import Configurator
+    config = Configurator()
+    config.include('pyramid_zcml')
+    config.load_zcml('%s:configure.zcml' % package,
+                     bulk_registration=bulk_registration)
+    gc.collect()
+    start = time.perf_counter()
+    config.commit()
+    return time.perf_counter() - start
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,2000,4000,8000,16000',
+                        help='Comma separated numbers of registrations.')
+    parser.add_argument('--per-file', type=int, default=500,
+                        help='Directives per leaf ZCML file.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Report the best of this many runs.')
+    args = parser.parse_args(argv[1:])
+
+    root = tempfile.mkdtemp()
+    sys.path.insert(0, root)
+    print('%7s  %10s %7s  %10s %7s  %7s' % (
+        'size', 'single', 'growth', 'bulk', 'growth', 'speedup'))
+    previous = None
+    try:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            package = 'zcmlregbench%d' % size
+            generate(root, package, size, 1, 1, args.per_file, KINDS)
+            single = min([measure(package, False)
+                          for i in range(args.repeat)])
+            bulk = min([measure(package, True) for i in range(args.repeat)])
+            if previous is None:
+                growth = ('%7s' % '-',) * 2
+            else:
+                growth = ('%6.2fx' % (single / previous[0]),
+                          '%6.2fx' % (bulk / previous[1]))
+            print('%7d  %9.3fs %s  %9.3fs %s  %6.2fx' % (
+                size, single, growth[0], bulk, growth[1], single / bulk))
+            previous = (single, bulk)
+    finally:
+        shutil.rmtree(root)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
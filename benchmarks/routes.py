@@ -0,0 +1,120 @@
+""" Compare the cost of matching a request to a route with Pyramid's routes
+mapper, which tries the routes one by one, and with the mapper installed
+by the ``combinedroutes`` directive.
+
+For each number of routes, routes with static, parameterized, regular
+expression and star patterns are added by ``route`` directives, some of
+them with a ``request_method`` predicate, and paths matching the first,
+middle and last routes as well as paths matching no route are looked up.
+Both mappers must find the same route for every path.  The average time
+per lookup is reported for Pyramid's mapper (``linear``) and for the
+combined one (``combined``), along with the time the combined mapper
+takes to build its trie on the first request.  For example::
+
+    python benchmarks/routes.py --routes 100,1000,5000
+
+Run it with ``python benchmarks/routes.py --help``.
+"""
+import argparse
+import sys
+import timeit
+
+TEMPLATES = (
+    '/section%d',
+    '/section%d/items/{id}',
+    '/section%d/items/{id:\\d+}/edit',
+    '/api/v1/resource%d/{id}',
+    '/files%d/*subpath',
+    )
+
+def make_zcml(routes):
+    lines = ['<configure xmlns="http://pylonshq.com/pyramid">',
+             '<include package="pyramid_zcml" />']
+    for i in range(routes):
+        pattern = TEMPLATES[i % len(TEMPLATES)] % (i // len(TEMPLATES))
+        method = ' request_method="POST"' if i % 7 == 3 else ''
+        lines.append('<route name="r%d" pattern="%s"%s />' % (
+            i, pattern, method))
+    lines.append('</configure>')
+    return '\n'.join(lines)
+
+def make_mapper(filename, combined):
+    from pyramid.config import Configurator
+    from pyramid.interfaces import IRoutesMapper
+    from pyramid_zcml import combined_routes_mapper
+    config = Configurator()
+    config.include('pyramid_zcml')
+    if combined:
+        combined_routes_mapper(config.registry)
+    config.load_zcml(filename)
+    config.commit()
+    return config.registry.getUtility(IRoutesMapper)
+
+def make_paths(routes):
+    sections = routes // len(TEMPLATES)
+    paths = []
+    for section in (0, sections // 2, max(sections - 1, 0)):
+        paths.extend([
+            '/section%d' % section,
+            '/section%d/items/abc' % section,
+            '/section%d/items/42/edit' % section,
+            '/api/v1/resource%d/7' % section,
+            '/files%d/a/b/c.txt' % section,
+            ])
+    paths.extend(['/', '/missing', '/section0/items/abc/def',
+                  '/api/v2/resource0/7'])
+    return paths
+
+def measure(mapper, requests, number):
+    def run():
+        for request in requests:
+            mapper(request)
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / number / len(requests)
+
+def main(argv=sys.argv):
+    import os
+    import tempfile
+    from pyramid.request import Request
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', default='100,1000,5000',
+                        help='Comma separated numbers of routes.')
+    parser.add_argument('--number', type=int, default=20,
+                        help='Lookups of each path per run.')
+    args = parser.parse_args(argv[1:])
+
+    print('%6s  %10s  %10s  %7s  %8s' % ('routes', 'linear', 'combined',
+                                          'speedup', 'compile'))
+    for routes in [int(s) for s in args.routes.split(',')]:
+        fd, filename = tempfile.mkstemp(suffix='.zcml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(make_zcml(routes))
+        try:
+            linear = make_mapper(filename, False)
+            combined = make_mapper(filename, True)
+        finally:
+            os.unlink(filename)
+        requests = []
+        for path in make_paths(routes):
+            for method in ('GET', 'POST'):
+                requests.append(Request.blank(path, method=method))
+        compile = timeit.timeit(combined.compile, number=1)
+        for request in requests:
+            expected = linear(request)
+            found = combined(request)
+            if (getattr(found['route'], 'name', None) !=
+                    getattr(expected['route'], 'name', None) or
+                    found['match'] != expected['match']):
+                raise AssertionError('%s %s: %r != %r' % (
+                    request.method, request.path_info, found, expected))
+        linear_time = measure(linear, requests, args.number)
+        combined_time = measure(combined, requests, args.number)
+        print('%6d  %8.2fus  %8.2fus  %6.2fx  %6.1fms' % (
+            routes, linear_time * 1e6, combined_time * 1e6,
+            linear_time / combined_time, compile * 1e3))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
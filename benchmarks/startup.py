@@ -0,0 +1,239 @@
+""" Measure application startup against synthetic ZCML applications of
+several sizes.
+
+Each corpus is a generated package holding the requested number of
+directives, split evenly between views, routes, adapters and utilities
+and spread over a tree of included ZCML files.  Every size is measured in
+a fresh interpreter, reporting:
+
+- ``parse``: seconds spent in ``config.load_zcml``
+- ``commit``: seconds spent in ``config.commit``
+- ``peak_rss_kb``: the peak resident set size of the process
+- ``objects``: the number of objects tracked by the garbage collector that
+  are still alive after the commit, compared to before ``load_zcml``
+
+Results are written as JSON with ``--output``; passing a previous result
+file as ``--baseline`` compares against it and exits with status 1 when
+any metric grew by more than ``--tolerance``.  For example::
+
+    python benchmarks/startup.py --sizes 100,1000,10000 --output base.json
+    # ... change things ...
+    python benchmarks/startup.py --sizes 100,1000,10000 --baseline base.json
+
+Run it with ``python benchmarks/startup.py --help``.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+KINDS = ('view', 'route', 'adapter', 'utility')
+METRICS = ('parse', 'commit', 'peak_rss_kb', 'objects')
+
+MODULE = '''\
+from zope.interface import Interface
+from zope.interface import implementer
+
+class IFoo(Interface):
+    pass
+
+class IBar(Interface):
+    pass
+
+@implementer(IFoo)
+class Utility(object):
+    pass
+
+utility = Utility()
+
+@implementer(IBar)
+class Adapter(object):
+    def __init__(self, context):
+        self.context = context
+
+def view(request):
+    return {}
+'''
+
+DIRECTIVES = {
+    'view': '  <view name="v%(n)d" view="%(pkg)s.views.view"'
+            ' renderer="json"/>',
+    'route': '  <route name="r%(n)d" path="/r%(n)d/{id}"/>',
+    'adapter': '  <adapter factory="%(pkg)s.views.Adapter"'
+               ' for="%(pkg)s.views.IFoo" provides="%(pkg)s.views.IBar"'
+               ' name="a%(n)d"/>',
+    'utility': '  <utility component="%(pkg)s.views.utility"'
+               ' provides="%(pkg)s.views.IFoo" name="u%(n)d"/>',
+    # a new component per registration, rather than one shared instance
+    'factory': '  <utility factory="%(pkg)s.views.Utility"'
+               ' provides="%(pkg)s.views.IFoo" name="f%(n)d"/>',
+    }
+
+HEAD = '<configure xmlns="http://pylonshq.com/pyramid">\n'
+TAIL = '</configure>\n'
+
+def generate(root, package, size, depth, fanout, per_file, kinds=KINDS):
+    """ Write a package named ``package`` below ``root`` whose
+    ``configure.zcml`` contains ``size`` directives, taking turns between
+    the directive ``kinds``."""
+    here = os.path.join(root, package)
+    os.makedirs(here)
+    with open(os.path.join(here, '__init__.py'), 'w') as f:
+        f.write('')
+    with open(os.path.join(here, 'views.py'), 'w') as f:
+        f.write(MODULE)
+    lines = [DIRECTIVES[kinds[n % len(kinds)]] % dict(n=n, pkg=package)
+             for n in range(size)]
+    with open(os.path.join(here, 'configure.zcml'), 'w') as f:
+        f.write(HEAD)
+        f.write('  <include package="pyramid_zcml"/>\n')
+        f.write('  <include file="tree/configure.zcml"/>\n')
+        f.write(TAIL)
+    _tree(os.path.join(here, 'tree'), lines, depth, fanout, per_file)
+
+def _tree(here, lines, depth, fanout, per_file):
+    os.makedirs(here)
+    body = []
+    if depth and len(lines) > per_file:
+        step = -(-len(lines) // fanout)
+        for i in range(0, len(lines), step):
+            name = 'n%d' % (i // step)
+            _tree(os.path.join(here, name), lines[i:i+step], depth - 1,
+                  fanout, per_file)
+            body.append('  <include file="%s/configure.zcml"/>' % name)
+    else:
+        # a leaf; split what is left over several sibling files
+        for i in range(0, len(lines), per_file):
+            name = 'directives%d.zcml' % (i // per_file)
+            with open(os.path.join(here, name), 'w') as f:
+                f.write(HEAD + '\n'.join(lines[i:i+per_file]) + '\n' + TAIL)
+            body.append('  <include file="%s"/>' % name)
+    with open(os.path.join(here, 'configure.zcml'), 'w') as f:
+        f.write(HEAD + '\n'.join(body) + '\n' + TAIL)
+
+def measure(root, package):
+    """ Load ``package`` in this process and return its metrics.  Meant to
+    be run in a fresh interpreter (see ``run``)."""
+    sys.path.insert(0, root)
+    from pyramid.config import Configurator
+    gc.collect()
+    before = len(gc.get_objects())
+    config = Configurator()
+    config.include('pyramid_zcml')
+    start = time.perf_counter()
+    config.load_zcml('%s:configure.zcml' % package)
+    parsed = time.perf_counter()
+    config.commit()
+    committed = time.perf_counter()
+    gc.collect()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # pragma: no cover
+        peak = peak // 1024 # bytes rather than kilobytes
+    return {
+        'parse': parsed - start,
+        'commit': committed - parsed,
+        'peak_rss_kb': peak,
+        'objects': len(gc.get_objects()) - before,
+        }
+
+def run(root, package, repeat):
+    # every repetition gets its own interpreter so that imports, caches
+    # and the peak RSS of earlier runs do not leak into the numbers
+    results = []
+    for i in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__),
+             '--measure', root, package])
+        results.append(json.loads(output.decode('utf-8')))
+    return dict([(name, min([r[name] for r in results]))
+                 for name in METRICS])
+
+def compare(results, baseline, tolerance):
+    """ Return a list of ``(size, metric, baseline, current)`` tuples for
+    every metric which regressed by more than ``tolerance``."""
+    regressions = []
+    for size, metrics in sorted(results['sizes'].items(), key=_size):
+        old = baseline['sizes'].get(size)
+        if old is None:
+            continue
+        for name in METRICS:
+            if name in old and metrics[name] > old[name] * (1 + tolerance):
+                regressions.append((size, name, old[name], metrics[name]))
+    return regressions
+
+def _size(item):
+    return int(item[0])
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='Comma separated corpus sizes, e.g. '
+                             '100,1000,10000,50000.')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='Maximum include depth below the root.')
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='Includes per intermediate ZCML file.')
+    parser.add_argument('--per-file', type=int, default=50,
+                        help='Directives per leaf ZCML file.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Report the best of this many runs.')
+    parser.add_argument('--output', help='Write the results to this file.')
+    parser.add_argument('--baseline',
+                        help='Compare against results stored earlier.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative growth of every metric.')
+    parser.add_argument('--measure', nargs=2, metavar=('ROOT', 'PACKAGE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv[1:])
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    root = tempfile.mkdtemp()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'depth': args.depth,
+        'fanout': args.fanout,
+        'per_file': args.per_file,
+        'sizes': {},
+        }
+    try:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            package = 'zcmlbench%d' % size
+            generate(root, package, size, args.depth, args.fanout,
+                     args.per_file)
+            metrics = run(root, package, args.repeat)
+            results['sizes'][str(size)] = metrics
+            print('%7d  parse %8.3fs  commit %8.3fs  peak %8dkB  '
+                  'objects %9d' % (size, metrics['parse'], metrics['commit'],
+                                   metrics['peak_rss_kb'],
+                                   metrics['objects']))
+    finally:
+        shutil.rmtree(root)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, name, old, new in regressions:
+            print('REGRESSION %s %s: %s -> %s' % (size, name, old, new))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
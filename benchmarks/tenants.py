@@ -0,0 +1,108 @@
+""" Configure many tenant applications from the same ZCML in a thread
+pool, comparing the per-registry lock taken by ``load_zcml`` with a single
+process-wide lock (what every ``load_zcml`` call shared before), and with
+parsing the ZCML once via ``parse_zcml`` and applying the template to every
+tenant.
+
+Parsing itself is CPU bound and holds the GIL, so on CPython the gain
+comes from the blocking parts of a load (reading ZCML files from a slow or
+network filesystem, imports); ``--file-latency`` simulates the former,
+and makes every tenant read its files, bypassing the document cache which
+would otherwise have parsed them once for the whole process.
+
+Run it with ``python benchmarks/tenants.py --help``.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pyramid.config import Configurator
+from zope.configuration import xmlconfig
+
+from pyramid_zcml import _documents
+from pyramid_zcml import includeme
+from pyramid_zcml import parse_zcml
+
+def build(spec, lock=None, template=None):
+    config = Configurator()
+    config.include(includeme)
+    if template is not None:
+        template.apply(config)
+    elif lock is None:
+        config.load_zcml(spec)
+    else:
+        config.load_zcml(spec, lock=lock)
+    config.commit()
+    return config.registry
+
+def timed(spec, tenants, threads, lock, template=False):
+    start = time.perf_counter()
+    if template:
+        # the parse is part of the cost
+        template = parse_zcml(spec)
+    else:
+        template = None
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda i: build(spec, lock, template),
+                      range(tenants)))
+    return time.perf_counter() - start
+
+def slow_open(latency):
+    original = xmlconfig.openInOrPlain
+    def openInOrPlain(filename):
+        time.sleep(latency)
+        return original(filename)
+    xmlconfig.openInOrPlain = openInOrPlain
+    # the document cache, filled by the warm up, would otherwise spare
+    # every tenant from opening the files
+    _documents.document_cache.get = _documents._parse
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        '--spec', default='pyramid_zcml.tests.hybridapp:configure.zcml',
+        help='The ZCML asset specification every tenant loads.')
+    parser.add_argument('--tenants', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Report the best of this many runs.')
+    parser.add_argument('--file-latency', type=float, default=0.0,
+                        help='Seconds added to every ZCML file open.')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON.')
+    args = parser.parse_args(argv[1:])
+
+    build(args.spec) # warm up imports
+    if args.file_latency:
+        slow_open(args.file_latency)
+    shared = threading.Lock()
+    results = {
+        'spec': args.spec,
+        'tenants': args.tenants,
+        'threads': args.threads,
+        'file_latency': args.file_latency,
+        'serial': min([timed(args.spec, args.tenants, 1, None)
+                       for i in range(args.repeat)]),
+        'shared_lock': min([timed(args.spec, args.tenants, args.threads,
+                                  shared) for i in range(args.repeat)]),
+        'per_registry_lock': min([timed(args.spec, args.tenants,
+                                        args.threads, None)
+                                  for i in range(args.repeat)]),
+        'parse_once': min([timed(args.spec, args.tenants, args.threads,
+                                 None, True) for i in range(args.repeat)]),
+        }
+    results['speedup'] = results['shared_lock'] / results['per_registry_lock']
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        for name in ('serial', 'shared_lock', 'per_registry_lock',
+                     'parse_once'):
+            print('%-18s %8.3fs' % (name, results[name]))
+        print('%-18s %8.2fx' % ('speedup', results['speedup']))
+
+if __name__ == '__main__':
+    main()
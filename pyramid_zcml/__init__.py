@@ -5,8 +5,6 @@ import threading
 from zope.configuration.fields import GlobalInterface
 from zope.configuration.fields import GlobalObject
 from zope.configuration.fields import Tokens
-from zope.configuration.xmlconfig import registerCommonDirectives
-from zope.configuration.config import ConfigurationMachine
 
 from zope.interface import Interface
 from zope.interface import implementedBy
@@ -22,13 +20,66 @@ from pyramid.authentication import RemoteUserAuthenticationPolicy
 from pyramid.authentication import RepozeWho1AuthenticationPolicy
 from pyramid.authorization import ACLAuthorizationPolicy
 from pyramid.config import Configurator
+from pyramid.events import ApplicationCreated
 from pyramid.exceptions import ConfigurationError
 from pyramid.asset import asset_spec_from_abspath, resolve_asset_spec
+from pyramid.path import caller_package
+from pyramid.settings import asbool
 from pyramid.threadlocal import get_current_registry
 
-from zope.configuration import xmlconfig
-
+from pyramid_zcml._async import AsyncDispatcher # API
+from pyramid_zcml._async import AsyncHandler
+from pyramid_zcml._async import async_dispatcher # API
+from pyramid_zcml._async import dispatcher_settings
+from pyramid_zcml._bulk import batch_registrations
 from pyramid_zcml._compat import u
+from pyramid_zcml._dispatch import DispatchTable # API
+from pyramid_zcml._dispatch import dispatch_table # API
+from pyramid_zcml._documents import document_cache # API
+from pyramid_zcml._documents import include
+from pyramid_zcml._http import conditional_response # API
+from pyramid_zcml._http import parse_http_cache
+from pyramid_zcml._lazy import LazyGlobalObject
+from pyramid_zcml._lazy import LazyObject # API
+from pyramid_zcml._lazy import register_lazy_utility
+from pyramid_zcml._lazy import resolve_lazy
+from pyramid_zcml._lazy import validate_lazy_imports # API
+from pyramid_zcml._lru import LRUCache # API
+from pyramid_zcml._machine import ZCMLMachine
+from pyramid_zcml._machine import new_machine
+from pyramid_zcml._metrics import LogExporter # API
+from pyramid_zcml._metrics import PrometheusExporter # API
+from pyramid_zcml._metrics import ViewMetrics # API
+from pyramid_zcml._metrics import source_actions
+from pyramid_zcml._metrics import view_metrics # API
+from pyramid_zcml._metrics import view_source_deriver
+from pyramid_zcml._predicates import PredicateInterner # API
+from pyramid_zcml._predicates import SharedPredicate # API
+from pyramid_zcml._predicates import predicate_interner # API
+from pyramid_zcml._profiling import ProfilingMachine
+from pyramid_zcml._profiling import ZCMLProfiler # API
+from pyramid_zcml._recording import ActionCache
+from pyramid_zcml._recording import DirectiveRecord
+from pyramid_zcml._recording import RecordingMachine
+from pyramid_zcml._recording import ZCMLTemplate # API
+from pyramid_zcml._responsecache import ResponseCache # API
+from pyramid_zcml._responsecache import response_caches # API
+from pyramid_zcml._routes import CombinedRoutesMapper # API
+from pyramid_zcml._routes import combined_routes_mapper
+from pyramid_zcml._routes import zcml_route_names
+from pyramid_zcml._scan import scan as _scan
+from pyramid_zcml._static import ContentHashCacheBuster # API
+from pyramid_zcml._static import StaticView
+from pyramid_zcml._static import add_static_view
+from pyramid_zcml._static import asset_path
+from pyramid_zcml._static import available_encodings
+from pyramid_zcml._static import build_static_manifest # API
+from pyramid_zcml._static import load_static_manifest
+from pyramid_zcml._static import precompress as _precompress
+from pyramid_zcml._static import supports_cache_busters
+from pyramid_zcml._static import supports_content_encodings
+from pyramid_zcml._warmup import warm_caches # API
+from pyramid_zcml._warmup import warm_caches_subscriber
 
 _BLANK = u('')
 
@@ -52,7 +103,7 @@ class IViewDirective(Interface):
         required=False
         )
 
-    view = GlobalObject(
+    view = LazyGlobalObject(
         title=_BLANK,
         description=u('The view function'),
         required=False,
@@ -155,6 +206,31 @@ class IViewDirective(Interface):
         value_type=GlobalObject()
         )
 
+    http_cache = TextLine(
+        title=u('HTTP caching of the responses of the view'),
+        description=u('A number of seconds and/or Cache-Control directives, '
+                      'separated by commas, e.g. "3600, public".'),
+        required=False)
+
+    conditional_response = Bool(
+        title=u('Answer requests for unchanged responses with 304'),
+        required=False)
+
+    cache_ttl = Int(
+        title=u('Seconds to keep the responses of the view in memory'),
+        required=False)
+
+    cache_key = Tokens(
+        title=u('Request parameters the responses depend on'),
+        description=u('Besides the route name, the matchdict and the view '
+                      'name, which always distinguish cached responses.'),
+        required=False,
+        value_type=TextLine())
+
+    cache_size = Int(
+        title=u('Number of responses to keep in memory'),
+        required=False)
+
 
 def view(
     _context,
@@ -180,10 +256,17 @@ def view(
     custom_predicates=(),
     context=None,
     cacheable=True, # not used, here for b/w compat < 0.8
+    http_cache=None,
+    conditional_response=False,
+    cache_ttl=None,
+    cache_key=(),
+    cache_size=1000,
     ):
 
     context = context or for_
     config = with_context(_context)
+    cache = _response_cache(config, cache_ttl, cache_key, cache_size,
+                            '%s:%s' % (route_name or '', name))
     config.add_view(
         permission=permission, context=context, view=view, name=name,
         request_type=request_type, route_name=route_name,
@@ -191,7 +274,37 @@ def view(
         containment=containment, attr=attr, renderer=renderer,
         wrapper=wrapper, xhr=xhr, accept=accept, header=header,
         path_info=path_info, custom_predicates=custom_predicates,
-        decorator=decorator, mapper=mapper)
+        decorator=_view_decorator(decorator, conditional_response, cache),
+        mapper=mapper, **_http_cache_kw(http_cache))
+
+def _view_decorator(decorator, conditional, cache=None):
+    # the response cache is outermost, so that it keeps the ETag the
+    # conditional response decorator adds
+    decorators = []
+    if cache is not None:
+        decorators.append(cache)
+    if conditional:
+        decorators.append(conditional_response)
+    if decorator is not None:
+        decorators.append(decorator)
+    if not decorators:
+        return None
+    if len(decorators) == 1:
+        return decorators[0]
+    return tuple(decorators)
+
+def _response_cache(config, ttl, params, size, label):
+    if ttl is None:
+        return None
+    cache = ResponseCache(ttl, params, size, label)
+    response_caches(config.registry).append(cache)
+    return cache
+
+def _http_cache_kw(http_cache):
+    # only passed when given, for the benefit of add_view replacements
+    if http_cache is None:
+        return {}
+    return {'http_cache': parse_http_cache(http_cache)}
 
 _view = view # for directives that take a view arg
 
@@ -199,8 +312,8 @@ class IRouteLikeDirective(Interface):
     """ The interface for the ``route`` ZCML directive
     """
     pattern = TextLine(title=u('pattern'), required=False)
-    factory = GlobalObject(title=u('context factory'), required=False)
-    view = GlobalObject(title=u('view'), required=False)
+    factory = LazyGlobalObject(title=u('context factory'), required=False)
+    view = LazyGlobalObject(title=u('view'), required=False)
 
     view_context = GlobalObject(title=u('view_context'), required=False)
     # aliases for view_context
@@ -239,6 +352,14 @@ class IRouteLikeDirective(Interface):
         )
     use_global_views = Bool(title=u('use_global_views'), required=False)
 
+    view_http_cache = TextLine(title=u('view_http_cache'), required=False)
+    view_conditional_response = Bool(title=u('view_conditional_response'),
+                                     required=False)
+    view_cache_ttl = Int(title=u('view_cache_ttl'), required=False)
+    view_cache_key = Tokens(title=u('view_cache_key'), required=False,
+                            value_type=TextLine())
+    view_cache_size = Int(title=u('view_cache_size'), required=False)
+
 class IRouteDirective(IRouteLikeDirective):
     name = TextLine(title=u('name'), required=True)
     # alias for pattern
@@ -266,7 +387,12 @@ def route(_context,
           view_context=None,
           traverse=None,
           use_global_views=False,
-          path=None):
+          path=None,
+          view_http_cache=None,
+          view_conditional_response=False,
+          view_cache_ttl=None,
+          view_cache_key=(),
+          view_cache_size=1000):
     """ Handle ``route`` ZCML directives
     """
     # the strange ordering of the request kw args above is for b/w
@@ -288,13 +414,19 @@ def route(_context,
 
     config = with_context(_context)
     if view:
+        cache = _response_cache(config, view_cache_ttl, view_cache_key,
+                                view_cache_size, '%s:' % name)
         config.add_view(
             route_name=name,
             view=view,
             permission=view_permission,
             context=view_context,
             renderer=view_renderer,
-            attr=view_attr)
+            attr=view_attr,
+            decorator=_view_decorator(None, view_conditional_response,
+                                      cache),
+            **_http_cache_kw(view_http_cache))
+    zcml_route_names(config.registry).add(name)
     config.add_route(
         name,
         pattern,
@@ -310,8 +442,75 @@ def route(_context,
         traverse=traverse,
         )
 
+class ICombinedRoutesDirective(Interface):
+    """ The interface for the ``combinedroutes`` ZCML directive
+    """
+
+def combinedroutes(_context):
+    """ Handle ``combinedroutes`` ZCML directives
+    """
+    # the routes mapper must be replaced eagerly: routes hold on to the
+    # mapper they will be connected to when they are added
+    config = with_context(_context)
+    combined_routes_mapper(config.registry)
+
+class IViewMetricsDirective(Interface):
+    """ The interface for the ``viewmetrics`` ZCML directive
+    """
+    buckets = Tokens(
+        title=u('The upper bounds of the histogram buckets, in seconds'),
+        required=False,
+        value_type=TextLine())
+    path = TextLine(
+        title=u('The path of a Prometheus text endpoint'),
+        required=False)
+    log_interval = Int(
+        title=u('Seconds between dumps of the histograms to the log'),
+        required=False)
+    exporter = GlobalObject(
+        title=u('A callable which exports the histograms'),
+        description=u('It is called with the configurator and the '
+                      'pyramid_zcml.ViewMetrics'),
+        required=False)
+
+def viewmetrics(_context, buckets=None, path=None, log_interval=None,
+                exporter=None):
+    """ Handle ``viewmetrics`` ZCML directives
+    """
+    try:
+        from pyramid.viewderivers import INGRESS
+    except ImportError: # Pyramid < 1.7
+        raise ConfigurationError(
+            'The viewmetrics directive requires Pyramid 1.7 or later')
+    if buckets:
+        try:
+            metrics = ViewMetrics([float(bound) for bound in buckets])
+        except ValueError:
+            raise ConfigurationError(
+                'The buckets of viewmetrics must be numbers, not %r' % (
+                    ' '.join(buckets),))
+    else:
+        metrics = ViewMetrics()
+    config = with_context(_context)
+    # set eagerly: the actions of the ZCML are prepared for the view
+    # deriver before they are executed
+    config.registry._pyramid_zcml_view_metrics = metrics
+    config.add_view_deriver(view_source_deriver,
+                            name='pyramid_zcml.viewmetrics',
+                            under=INGRESS)
+    config.add_tween('pyramid_zcml._metrics.view_metrics_tween_factory')
+    exporters = []
+    if path:
+        exporters.append(PrometheusExporter(path))
+    if log_interval:
+        exporters.append(LogExporter(log_interval))
+    if exporter is not None:
+        exporters.append(exporter)
+    for export in exporters:
+        export(config, metrics)
+
 class ISystemViewDirective(Interface):
-    view = GlobalObject(
+    view = LazyGlobalObject(
         title=_BLANK,
         description=u('The view function'),
         required=False,
@@ -503,14 +702,95 @@ class IStaticDirective(Interface):
         description = u('The permission string'),
         required = False)
 
+    cachebust = Bool(
+        title=u('Add the content hash of assets to their URLs'),
+        required=False,
+        default=False)
+
+    manifest = TextLine(
+        title=u('JSON file holding the content hashes of the assets'),
+        description=u(
+            'Files whose size or modification time changed since the '
+            'file was written are hashed again at configuration time.  '
+            'Implies cachebust.'),
+        required=False)
+
+    content_encodings = Tokens(
+        title=u('Encodings of precompressed variants to serve'),
+        description=u(
+            'E.g. "br gzip": a request accepting one of them is served '
+            'the smallest acceptable variant of the file, such as '
+            'app.css.br or app.css.gz, if it exists.'),
+        required=False,
+        value_type=TextLine())
+
+    precompress = Bool(
+        title=u('Write compressed variants of the assets at startup'),
+        required=False,
+        default=False)
+
+    memory_cache = Int(
+        title=u('Bytes of small files to keep in memory'),
+        required=False,
+        default=None)
+
+    memory_cache_file_size = Int(
+        title=u('Largest file kept in memory, in bytes'),
+        required=False,
+        default=None)
+
+    memory_cache_revalidate = Int(
+        title=u('Seconds between checks of a file kept in memory'),
+        required=False,
+        default=None)
+
 def static(_context, name, path, cache_max_age=3600,
            permission='__no_permission_required__',
-           renderer=None):
+           renderer=None, cachebust=False, manifest=None,
+           content_encodings=None, precompress=False, memory_cache=None,
+           memory_cache_file_size=65536, memory_cache_revalidate=5):
     """ Handle ``static`` ZCML directives
     """
+    if (cachebust or manifest) and not supports_cache_busters():
+        raise ConfigurationError(
+            'The cachebust and manifest attributes of the static directive '
+            'require Pyramid 1.6 or later')
+    if (content_encodings or precompress) and not supports_content_encodings():
+        raise ConfigurationError(
+            'The content_encodings and precompress attributes of the static '
+            'directive require Pyramid 2.0 or later')
+    if memory_cache and not supports_content_encodings():
+        # the cache finds files with the methods of the same static view
+        raise ConfigurationError(
+            'The memory_cache attribute of the static directive requires '
+            'Pyramid 2.0 or later')
     config = with_context(_context)
-    config.add_static_view(name, path, cache_max_age=cache_max_age,
-                           permission=permission, renderer=renderer)
+    kw = dict(cache_max_age=cache_max_age, permission=permission,
+              renderer=renderer)
+    if precompress:
+        if not content_encodings:
+            content_encodings = available_encodings()
+        _precompress(asset_path(config, path), content_encodings)
+    if content_encodings:
+        kw['content_encodings'] = content_encodings
+    hashes = None
+    if cachebust or manifest:
+        if manifest is not None:
+            manifest = asset_path(config, manifest)
+        hashes = load_static_manifest(asset_path(config, path), manifest)
+    cache = None
+    if memory_cache:
+        cache = LRUCache(max_bytes=memory_cache)
+    if hashes is None and cache is None and not content_encodings:
+        config.add_static_view(name, path, **kw)
+        return
+    def wrap(view):
+        return StaticView(view, hashes, memory_cache=cache,
+                          max_file_size=memory_cache_file_size,
+                          revalidate=memory_cache_revalidate)
+    add_static_view(config, name, path, wrap, **kw)
+    if hashes is not None:
+        config.add_cache_buster(path, ContentHashCacheBuster(hashes))
 
 class IScanDirective(Interface):
     package = GlobalObject(
@@ -518,9 +798,24 @@ class IScanDirective(Interface):
         required=True,
         )
 
-def scan(_context, package):
+    ignore = Tokens(
+        title=u('Modules, packages or objects not to scan'),
+        description=u('A list of dotted names; names starting with a dot '
+                      'are relative to the scanned package.'),
+        required=False,
+        value_type=TextLine(),
+        )
+
+    categories = Tokens(
+        title=u('Venusian categories to scan for'),
+        required=False,
+        value_type=TextLine(),
+        )
+
+def scan(_context, package, ignore=None, categories=None):
     config = with_context(_context)
-    config.scan(package)
+    _scan(config, package, categories=categories, ignore=ignore,
+          cache_dir=getattr(_context, 'cache_dir', None))
 
 class ITranslationDirDirective(Interface):
     dir = TextLine(
@@ -554,7 +849,7 @@ class IAdapterDirective(Interface):
             'A list of factories (usually just one) that create '
             'the adapter instance.')),
         required=True,
-        value_type=GlobalObject()
+        value_type=LazyGlobalObject()
         )
 
     provides  = GlobalInterface(
@@ -582,6 +877,10 @@ class IAdapterDirective(Interface):
         )
 
 def adapter(_context, factory, provides=None, for_=None, name=''):
+    if for_ is None or provides is None or len(factory) > 1:
+        # the factory must be inspected or rolled up
+        factory = [resolve_lazy(f) for f in factory]
+
     if for_ is None:
         if len(factory) == 1:
             for_ = getattr(factory[0], '__component_adapts__', None)
@@ -626,13 +925,13 @@ class ISubscriberDirective(Interface):
     Register a subscriber
     """
 
-    factory = GlobalObject(
+    factory = LazyGlobalObject(
         title=u('Subscriber factory'),
         description=u('A factory used to create the subscriber instance.'),
         required=False,
         )
 
-    handler = GlobalObject(
+    handler = LazyGlobalObject(
         title=u('Handler'),
         description=u('A callable object that handles events.'),
         required=False,
@@ -654,7 +953,37 @@ class ISubscriberDirective(Interface):
           ),
         )
 
-def subscriber(_context, for_=None, factory=None, handler=None, provides=None):
+    async_ = Bool(
+        title=u('Asynchronous'),
+        description=u('Call the handler on a thread of the asynchronous '
+                      'dispatcher of the registry instead of while the '
+                      'event is sent.'),
+        required=False,
+        default=False,
+        )
+
+    executor = GlobalObject(
+        title=u('Executor'),
+        description=u('An object with a ``submit(func, *args)`` method, '
+                      'e.g. a pyramid_zcml.AsyncDispatcher, which calls the '
+                      'handler instead of the asynchronous dispatcher of '
+                      'the registry.  Implies ``async``.'),
+        required=False,
+        )
+
+# zope.configuration only maps the ``async`` attribute to ``async_`` where
+# ``async`` is a keyword (Python 3.7 and later); elsewhere it is passed on
+# as an extra keyword argument, converted by the subscriber directive
+ISubscriberDirective.setTaggedValue('keyword_arguments', True)
+
+def subscriber(_context, for_=None, factory=None, handler=None, provides=None,
+               async_=False, executor=None, **kw):
+    if 'async' in kw:
+        field = ISubscriberDirective['async_'].bind(_context)
+        async_ = field.fromUnicode(kw.pop('async'))
+    if kw:
+        raise ConfigurationError(
+            'Unrecognized parameters: %s' % ', '.join(sorted(kw)))
     if factory is None:
         if handler is None:
             raise TypeError("No factory or handler provided")
@@ -668,8 +997,13 @@ def subscriber(_context, for_=None, factory=None, handler=None, provides=None):
             raise TypeError(
                 "You must specify a provided interface when registering "
                 "a factory")
+        if async_ or executor is not None:
+            raise TypeError("Only handlers can be called asynchronously")
 
     if for_ is None:
+        factory = resolve_lazy(factory)
+        if handler is not None:
+            handler = factory
         for_ = getattr(factory, '__component_adapts__', None)
         if for_ is None:
             raise TypeError("No for attribute was provided and can't "
@@ -680,6 +1014,15 @@ def subscriber(_context, for_=None, factory=None, handler=None, provides=None):
     config = with_context(_context)
 
     if handler is not None:
+        if async_ or executor is not None:
+            if executor is None:
+                # report bad settings now rather than when the first
+                # event is sent
+                try:
+                    dispatcher_settings(_context.registry.settings)
+                except ValueError as why:
+                    raise ConfigurationError(str(why))
+            handler = AsyncHandler(handler, _context.registry, executor)
         config.add_subscriber(handler, for_)
     else:
         registry = _context.registry
@@ -724,10 +1067,23 @@ class IUtilityDirective(Interface):
         required=False,
         )
 
-def utility(_context, provides=None, component=None, factory=None, name=''):
+    lazy = Bool(
+        title=u('Lazy'),
+        description=(u('If true, the ``factory`` is not called until the '
+                       'utility is first looked up.  A placeholder is '
+                       'registered until then.')),
+        required=False,
+        default=False,
+        )
+
+def utility(_context, provides=None, component=None, factory=None, name='',
+            lazy=False):
     if factory and component:
         raise TypeError("Can't specify factory and component.")
 
+    if lazy and not factory:
+        raise TypeError("A lazy utility needs a factory.")
+
     if provides is None:
         if factory:
             provides = list(implementedBy(factory))
@@ -746,6 +1102,14 @@ def utility(_context, provides=None, component=None, factory=None, name=''):
         kw = {}
 
     registry = _context.registry
+
+    if lazy:
+        _context.action(
+            discriminator = ('utility', provides, name),
+            callable = register_lazy_utility,
+            args = (registry, factory, provides, name, _context.info),
+            )
+        return
  
     _context.action(
         discriminator = ('utility', provides, name),
@@ -802,7 +1166,29 @@ def _rolledUpFactory(factories):
 
 def with_context(context):
     """Obtain a configurator with 'the right' context.  Returns a new
-    Configurator instance."""
+    Configurator instance.
+
+    When the context provides a ``configurators`` dictionary (contexts
+    created by ``load_zcml`` do), the configurator is a shallow copy of a
+    prototype shared by every directive at the same include level, which is
+    much cheaper than constructing a new one for each directive."""
+    prototypes = getattr(context, 'configurators', None)
+    if prototypes is None:
+        return _new_configurator(context)
+    key = (context.package, context.basepath, context.includepath)
+    prototype = prototypes.get(key)
+    if prototype is None:
+        prototype = prototypes[key] = _new_configurator(context)
+    cls = prototype.__class__
+    configurator = cls.__new__(cls)
+    configurator.__dict__.update(prototype.__dict__)
+    # the stack of action infos which action_method pushes to and pops
+    # from must not be shared with the other copies
+    configurator._ainfo = []
+    configurator.info = context.info
+    return configurator
+
+def _new_configurator(context):
     configurator = context.config_class(
         registry=context.registry,
         package=context.package,
@@ -815,23 +1201,230 @@ def with_context(context):
     configurator.introspection = context.introspection
     return configurator
 
-def load_zcml(self, spec='configure.zcml', lock=threading.Lock(), features=()):
+# guards the creation of per-registry locks
+_registry_locks_lock = threading.Lock()
+
+def _registry_lock(registry):
+    """ Return the lock which serializes ZCML loading into ``registry``,
+    creating it if necessary.  Loads into different registries do not
+    share a lock, so independent applications may be configured
+    concurrently."""
+    lock = getattr(registry, '_pyramid_zcml_lock', None)
+    if lock is None:
+        with _registry_locks_lock:
+            lock = getattr(registry, '_pyramid_zcml_lock', None)
+            if lock is None:
+                lock = threading.RLock()
+                registry._pyramid_zcml_lock = lock
+    return lock
+
+def load_zcml(self, spec='configure.zcml', lock=None, features=(),
+              cache_dir=None, profiler=None, lazy_imports=None,
+              bulk_registration=None, warm_caches=None, compile_events=None,
+              intern_predicates=None):
     """ Load configuration from a :term:`ZCML` file into the
     current configuration state.  The ``spec`` argument is an
     absolute filename, a relative filename, or a :term:`asset
     specification`, defaulting to ``configure.zcml`` (relative to
     the package of the method's caller).
-    
+
     The ``features`` argument can be any iterable of strings. These are useful
     for conditionally including or excluding parts of a :term:`ZCML` file.
+
+    While the ZCML is being loaded, a lock is held which belongs to the
+    configurator's registry, so loads into different registries may run
+    concurrently in separate threads.  A different lock object (anything
+    with ``acquire`` and ``release`` methods) can be passed as ``lock``.
+
+    The ``cache_dir`` argument, if given, names a directory in which the
+    result of parsing the ZCML is cached between processes, so that later
+    calls skip XML parsing and schema validation.  The cache is keyed on
+    ``spec`` and ``features`` and is invalidated whenever the content of any
+    file in the include graph changes, or a file matching the ``files``
+    pattern of an ``include`` is added or removed.  If ``cache_dir`` is not
+    given, the ``pyramid_zcml.cache_dir`` setting is used, if present.
+    Cache entries are pickles: the directory must only be writable by
+    trusted users.  ``scan`` directives also record in this directory which
+    modules of the scanned packages define decorated objects, and skip the
+    others while their source files are unchanged.
+
+    The ``profiler`` argument, if given, is a
+    :class:`pyramid_zcml.ZCMLProfiler` which records how long each
+    directive took to import its dotted names, to run its handler and,
+    once the configuration is committed, to execute its actions.  The
+    cache is not used while profiling.
+
+    If ``lazy_imports`` is true, the view, route ``factory``, adapter
+    ``factory`` and subscriber ``handler``/``factory`` attributes are not
+    imported while the ZCML is loaded; they are represented by a
+    :class:`pyramid_zcml.LazyObject` which imports the named object when it
+    is first called.  Names which cannot be imported are then only reported
+    when they are used, or by :func:`pyramid_zcml.validate_lazy_imports`.
+    If ``lazy_imports`` is not given, the ``pyramid_zcml.lazy_imports``
+    setting is used, if present.
+
+    If ``bulk_registration`` is true, consecutive ``adapter`` and
+    ``utility`` registrations are made together when the configuration is
+    committed, and the lookup caches of the registry are invalidated once
+    per group of registrations rather than once per registration.  If
+    ``bulk_registration`` is not given, the ``pyramid_zcml.bulk_registration``
+    setting is used, if present.
+
+    If ``warm_caches`` is true, :func:`pyramid_zcml.warm_caches` is called
+    with the registry when the WSGI application is created by
+    ``make_wsgi_app``, so that the lookup caches are populated before the
+    application serves its first request.  If ``warm_caches`` is not given,
+    the ``pyramid_zcml.warm_caches`` setting is used, if present.
+
+    If ``compile_events`` is true, the ``notify`` method of the registry is
+    replaced by a :class:`pyramid_zcml.DispatchTable`, which keeps the
+    event handlers of each type of event in a dictionary.  The table is
+    filled for the events Pyramid sends when the configuration is
+    committed, and emptied whenever a registration changes.  If
+    ``compile_events`` is not given, the ``pyramid_zcml.compile_events``
+    setting is used, if present.
+
+    If ``intern_predicates`` is true, the views and routes of the registry
+    share their ``path_info``, ``request_param``, ``header`` and ``accept``
+    predicates: one predicate is made for each distinct value, and it is
+    evaluated at most once per request, by the first view or route which
+    needs its result (see :class:`pyramid_zcml.PredicateInterner`).  If
+    ``intern_predicates`` is not given, the
+    ``pyramid_zcml.intern_predicates`` setting is used, if present.
     """
-    package_name, filename = resolve_asset_spec(spec, self.package_name)
+    package, filename = _resolve_spec(self, spec)
+
+    settings = self.registry.settings or {}
+    if cache_dir is None:
+        cache_dir = settings.get('pyramid_zcml.cache_dir')
+    if lazy_imports is None:
+        lazy_imports = asbool(settings.get('pyramid_zcml.lazy_imports'))
+    cache = template = None
+    if cache_dir and profiler is None:
+        cache = ActionCache(cache_dir, lazy_imports)
+        template = cache.load(package.__name__, filename, features)
+
+    if profiler is not None:
+        context = _zcml_context(self, package, features, ProfilingMachine,
+                                lazy_imports)
+        context.profiler = profiler
+        _process(self, context, _parser(filename, package), lock)
+    elif template is not None:
+        context = _zcml_context(self, package, features,
+                                cache_dir=cache_dir)
+        _process(self, context, template.replay, lock)
+    elif cache is not None:
+        context = _zcml_context(self, package, features, RecordingMachine,
+                                lazy_imports, cache_dir)
+        _process(self, context, _parser(filename, package), lock)
+        template = context.template()
+        if template is not None:
+            cache.store(package.__name__, filename, features,
+                        context._seen_files, template,
+                        context._include_globs)
+    else:
+        context = _zcml_context(self, package, features,
+                                lazy_imports=lazy_imports)
+        _process(self, context, _parser(filename, package), lock)
+
+    if warm_caches is None:
+        warm_caches = asbool(settings.get('pyramid_zcml.warm_caches'))
+    if warm_caches and not getattr(self.registry, '_pyramid_zcml_warm_caches',
+                                   False):
+        self.registry._pyramid_zcml_warm_caches = True
+        self.add_subscriber(warm_caches_subscriber, ApplicationCreated)
+    if compile_events is None:
+        compile_events = asbool(settings.get('pyramid_zcml.compile_events'))
+    if compile_events:
+        context.action(None, dispatch_table(self.registry).compile)
+    if intern_predicates is None:
+        intern_predicates = asbool(
+            settings.get('pyramid_zcml.intern_predicates'))
+    if intern_predicates:
+        predicate_interner(self.registry).install(self)
+    _add_actions(self, context, bulk_registration)
+    return self.registry
+
+def load_compiled_zcml(config, directives, lock=None):
+    """ Add the directives of a module generated by the ``pzcml-compile``
+    script to the configuration state of the :term:`Configurator`
+    ``config``, as if the ZCML the module was generated from had been
+    loaded with :func:`pyramid_zcml.load_zcml`.  Generated modules call
+    this function from their ``includeme``; it is not usually called
+    directly."""
+    records = [DirectiveRecord(*directive) for directive in directives]
+    _apply_template(config, ZCMLTemplate(records), lock)
+
+def parse_zcml(spec='configure.zcml', package=None, features=(),
+               lazy_imports=False):
+    """ Parse a :term:`ZCML` file once and return a
+    :class:`pyramid_zcml.ZCMLTemplate` which does not depend on any
+    registry.  ``template.apply(config)`` then adds the configuration to a
+    :term:`Configurator` like ``config.load_zcml(spec)`` would, without
+    parsing or validating any XML, so one template can be applied to many
+    configurators (e.g. one per tenant of a multi-tenant application).
+
+    ``spec`` is an absolute filename, a filename relative to ``package``
+    or an :term:`asset specification`; ``package`` defaults to the package
+    of the caller.  ``features`` and ``lazy_imports`` have the same meaning
+    as for :func:`pyramid_zcml.load_zcml`.  A
+    :exc:`pyramid.exceptions.ConfigurationError` is raised if the ZCML
+    uses directives which cannot be replayed."""
+    if package is None:
+        package = caller_package()
+    config = Configurator(package=package)
+    return _record_zcml(config, spec, features, lazy_imports)
+
+def _apply_template(config, template, lock=None):
+    context = _zcml_context(config, config.package)
+    _process(config, context, template.replay, lock)
+    _add_actions(config, context)
+
+def _add_actions(config, context, bulk_registration=None):
+    actions = context.actions
+    if bulk_registration is None:
+        settings = config.registry.settings or {}
+        bulk_registration = asbool(
+            settings.get('pyramid_zcml.bulk_registration'))
+    if bulk_registration:
+        actions = batch_registrations(config.registry, actions)
+    if view_metrics(config.registry) is not None:
+        actions = source_actions(actions)
+    config._ctx.actions.extend(actions)
+    if config.autocommit:
+        config.commit()
+
+def _record_zcml(config, spec='configure.zcml', features=(),
+                 lazy_imports=False):
+    # parse the ZCML without adding its actions to ``config``, returning
+    # a template of the directives it contains
+    package, filename = _resolve_spec(config, spec)
+    context = _zcml_context(config, package, features, RecordingMachine,
+                            lazy_imports)
+    _process(config, context, _parser(filename, package))
+    template = context.template()
+    if template is None:
+        raise ConfigurationError(
+            '%s uses directives which cannot be recorded' % spec)
+    return template
+
+def _resolve_spec(config, spec):
+    package_name, filename = resolve_asset_spec(spec, config.package_name)
     if package_name is None: # absolute filename
-        package = self.package
+        package = config.package
     else:
         __import__(package_name)
         package = sys.modules[package_name]
+    return package, filename
 
+def _parser(filename, package):
+    def parse(context):
+        include(context, filename, package)
+    return parse
+
+def _zcml_context(config, package, features=(),
+                  machine_class=ZCMLMachine, lazy_imports=False,
+                  cache_dir=None):
     # To avoid breaking people's expectations of how ZCML works, we
     # cannot autocommit ZCML actions incrementally.  If we commit actions
     # incrementally, configuration outcome will be controlled purely by
@@ -839,24 +1432,32 @@ def load_zcml(self, spec='configure.zcml', lock=threading.Lock(), features=()):
     # ZCML expects.  So we don't autocommit each ZCML directive action
     # while parsing is happening, but we do make sure to commit right
     # after parsing if autocommit it True.
-    context = ConfigurationMachine()
+    context = new_machine(machine_class)
     for feature in features:
         context.provideFeature(feature)
-    context.registry = self.registry
+    context.registry = config.registry
     context.autocommit = False
     context.package = package
-    context.route_prefix = getattr(self, 'route_prefix', None)
-    context.introspection = getattr(self, 'introspection', True)
-    context.config_class = self.__class__
-    registerCommonDirectives(context)
-
-    self.manager.push({'registry':self.registry, 'request':None})
+    context.route_prefix = getattr(config, 'route_prefix', None)
+    context.introspection = getattr(config, 'introspection', True)
+    context.config_class = config.__class__
+    context.configurators = {}
+    context.lazy_imports = lazy_imports
+    context.cache_dir = cache_dir
+    return context
+
+def _process(config, context, process, lock=None):
+    # call ``process`` with the context while the configurator's actions
+    # are redirected to the context's action list
+    if lock is None:
+        lock = _registry_lock(config.registry)
+    config.manager.push({'registry':config.registry, 'request':None})
     lock.acquire()
 
     try:
         # old_action_state will be None for Pyramid 1.0 and 1.1, but
         # not for 1.2
-        old_action_state = getattr(self.registry, 'action_state', None)
+        old_action_state = getattr(config.registry, 'action_state', None)
         if old_action_state is not None:
             # For Pyramid 1.2+, we need to assign a temporary action state to
             # the registry, because the configurator actions must populate
@@ -864,27 +1465,22 @@ def load_zcml(self, spec='configure.zcml', lock=threading.Lock(), features=()):
             # state's action list) in order for includeOverrides to work
             # properly.
             from pyramid.config import ActionState 
-            self.registry.action_state = ActionState()
-            self.registry.action_state.actions = context.actions
-        xmlconfig.file(filename, package, context=context, execute=False)
+            config.registry.action_state = ActionState()
+            config.registry.action_state.actions = context.actions
+        process(context)
     finally:
         if old_action_state is not None:
             # if we reassigned the action state, restore the old one (1.2 only)
-            self.registry.action_state = old_action_state
+            config.registry.action_state = old_action_state
         lock.release()
-        self.manager.pop()
-
-    self._ctx.actions.extend(context.actions)
-    if self.autocommit:
-        self.commit()
-
-    return self.registry
+        config.manager.pop()
 
 # note that ``options`` is a b/w compat alias for ``settings`` and
 # ``Configurator`` is a testing dep inj
 # XXX remove?
 def make_app(root_factory, package=None, filename='configure.zcml',
-             settings=None, options=None, Configurator=Configurator):
+             settings=None, options=None, Configurator=Configurator,
+             warm_caches=False):
     """ Return a Router object, representing a fully configured
     Pyramid WSGI application.
 
@@ -926,6 +1522,10 @@ def make_app(root_factory, package=None, filename='configure.zcml',
     e.g. ``{'reload_templates':True}``.  Note that the keyword
     parameter ``options`` is a backwards compatibility alias for the
     ``settings`` keyword parameter.
+
+    If ``warm_caches`` is true, the lookup caches of the registry are
+    populated by :func:`pyramid_zcml.warm_caches` before the application
+    is returned.
     """
     settings = settings or options or {}
     zcml_file = settings.get('configure_zcml', filename)
@@ -934,7 +1534,10 @@ def make_app(root_factory, package=None, filename='configure.zcml',
     config.include(includeme)
     config.hook_zca()
     config.begin()
-    config.load_zcml(zcml_file)
+    if warm_caches:
+        config.load_zcml(zcml_file, warm_caches=True)
+    else:
+        config.load_zcml(zcml_file)
     config.end()
     return config.make_wsgi_app()
 
@@ -0,0 +1,219 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('pyramid_zcml')
+
+POLICIES = ('block', 'drop', 'drop_oldest')
+
+class AsyncDispatcher(object):
+    """ Runs event handlers on a bounded pool of daemon threads.
+
+    ``workers`` is the number of threads and ``queue_size`` the number of
+    events which may wait for a thread.  ``policy`` says what happens to an
+    event submitted while the queue is full: ``drop`` discards it,
+    ``drop_oldest`` discards the event which has waited longest, and
+    ``block`` makes the caller wait for room, for at most ``timeout``
+    seconds (``None`` waits forever) before discarding the event.
+
+    The threads are started when the first event is submitted, and again
+    in a child process after a fork, so a dispatcher may be created in the
+    master process of a preforking server.  The ``submitted``,
+    ``completed``, ``failed`` and ``dropped`` counters and the
+    ``queue_depth`` and ``max_depth`` of the queue are reported by
+    :meth:`stats`."""
+    def __init__(self, workers=2, queue_size=1000, policy='drop',
+                 timeout=None):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of %s, not %r' % (
+                ', '.join(POLICIES), policy))
+        self.workers = workers
+        self.queue_size = queue_size
+        self.policy = policy
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._queue = collections.deque()
+        self._threads = []
+        self._closed = False
+        self.submitted = self.completed = self.failed = self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def submit(self, func, *args, **kw):
+        """ Queue a call of ``func`` with ``args`` and ``kw``.  Returns
+        ``True`` if it was queued, ``False`` if it was dropped."""
+        if self._pid != os.getpid():
+            # forked: the threads and queue of the parent are not ours
+            self._reset()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('dispatcher was shut down')
+            self.submitted += 1
+            if len(self._queue) >= self.queue_size:
+                if self.policy == 'drop':
+                    self.dropped += 1
+                    return False
+                elif self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif not self._wait_for_room():
+                    self.dropped += 1
+                    return False
+            self._queue.append((func, args, kw))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if len(self._threads) < self.workers:
+                self._start_thread()
+            self._not_empty.notify()
+        return True
+
+    def _wait_for_room(self):
+        # called with the lock held
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while len(self._queue) >= self.queue_size and not self._closed:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+            self._not_full.wait(remaining)
+        return not self._closed
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._work,
+                                  name='pyramid_zcml-async')
+        thread.daemon = True
+        self._threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                func, args, kw = self._queue.popleft()
+                self._not_full.notify()
+            try:
+                func(*args, **kw)
+            except Exception:
+                logger.exception('Asynchronous event handler %r failed',
+                                 func)
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.completed += 1
+
+    def stats(self):
+        """ Return a dictionary of the counters of the dispatcher."""
+        with self._lock:
+            return {
+                'workers': len(self._threads),
+                'queue_depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                }
+
+    def shutdown(self, wait=True):
+        """ Stop accepting events.  Events already queued are still
+        handled; if ``wait`` is true, wait until they have been."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+_dispatchers_lock = threading.Lock()
+
+def _positive_int(settings, name, default):
+    value = settings.get(name, default)
+    try:
+        result = int(value)
+    except (TypeError, ValueError):
+        result = 0
+    if result < 1:
+        raise ValueError('%s must be a positive integer, not %r' % (
+            name, value))
+    return result
+
+def dispatcher_settings(settings):
+    """ Return the keyword arguments of the :class:`AsyncDispatcher` made
+    by :func:`async_dispatcher` from ``settings``.  Raises ``ValueError``
+    if a setting is invalid."""
+    settings = settings or {}
+    policy = settings.get('pyramid_zcml.async_policy', 'drop')
+    if policy not in POLICIES:
+        raise ValueError('pyramid_zcml.async_policy must be one of %s, '
+                         'not %r' % (', '.join(POLICIES), policy))
+    timeout = settings.get('pyramid_zcml.async_timeout')
+    if timeout is not None:
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            timeout = -1
+        if timeout < 0:
+            raise ValueError('pyramid_zcml.async_timeout must be a number '
+                             'of seconds, not %r' % (
+                                 settings['pyramid_zcml.async_timeout'],))
+    return {
+        'workers': _positive_int(settings, 'pyramid_zcml.async_workers', 2),
+        'queue_size': _positive_int(settings,
+                                    'pyramid_zcml.async_queue_size', 1000),
+        'policy': policy,
+        'timeout': timeout,
+        }
+
+def async_dispatcher(registry):
+    """ Return the :class:`AsyncDispatcher` which runs the handlers of
+    ``subscriber`` directives marked ``async="true"`` in ``registry``,
+    creating it from the ``pyramid_zcml.async_workers``,
+    ``pyramid_zcml.async_queue_size``, ``pyramid_zcml.async_policy`` and
+    ``pyramid_zcml.async_timeout`` settings if necessary."""
+    dispatcher = getattr(registry, '_pyramid_zcml_dispatcher', None)
+    if dispatcher is None:
+        with _dispatchers_lock:
+            dispatcher = getattr(registry, '_pyramid_zcml_dispatcher', None)
+            if dispatcher is None:
+                dispatcher = AsyncDispatcher(
+                    **dispatcher_settings(registry.settings))
+                registry._pyramid_zcml_dispatcher = dispatcher
+    return dispatcher
+
+class AsyncHandler(object):
+    """ The event handler registered for a ``subscriber`` directive marked
+    ``async="true"`` or given an ``executor``: it submits each call of
+    ``handler`` to the executor (by default, the :func:`async_dispatcher`
+    of ``registry``) and returns at once."""
+    def __init__(self, handler, registry, executor=None):
+        self.handler = handler
+        self.registry = registry
+        self.executor = executor
+
+    def __call__(self, *events):
+        executor = self.executor
+        if executor is None:
+            executor = async_dispatcher(self.registry)
+        executor.submit(self.handler, *events)
+
+    def __repr__(self):
+        return '<AsyncHandler %r>' % (self.handler,)
@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+
+from zope.interface.adapter import BaseAdapterRegistry
+from zope.interface.adapter import _convert_None_to_Interface
+
+class _DeferredRegistry(object):
+    # While installed on an adapter registry, the registry's ``changed``
+    # only notes that a change happened and ``subscribe`` collects the new
+    # subscriber values per leaf instead of copying the leaf tuple for
+    # each of them.  ``uninstall`` writes the collected values and calls
+    # ``changed`` once.
+    methods = ('changed', 'subscribe', 'unsubscribe')
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.dirty = False
+        self.leaves = {}
+        self.saved = {}
+
+    def install(self):
+        registry = self.registry
+        for name in self.methods:
+            if name in registry.__dict__:
+                self.saved[name] = registry.__dict__[name]
+            setattr(registry, name, getattr(self, name))
+
+    def uninstall(self):
+        registry = self.registry
+        for name in self.methods:
+            if name in self.saved:
+                setattr(registry, name, self.saved[name])
+            else:
+                delattr(registry, name)
+        self.write_leaves()
+        if self.dirty:
+            registry.changed(registry)
+
+    def changed(self, originally_changed):
+        self.dirty = True
+
+    def subscribe(self, required, provided, value):
+        # BaseAdapterRegistry.subscribe, with the leaf update deferred
+        registry = self.registry
+        required = tuple([_convert_None_to_Interface(r) for r in required])
+        byorder = registry._subscribers
+        order = len(required)
+        while len(byorder) <= order:
+            byorder.append(registry._mappingType())
+        components = byorder[order]
+        for k in required + (provided,):
+            d = components.get(k)
+            if d is None:
+                d = registry._mappingType()
+                components[k] = d
+            components = d
+        leaf = self.leaves.get(id(components))
+        if leaf is None:
+            leaf = self.leaves[id(components)] = (components, [])
+        leaf[1].append(value)
+        if provided is not None:
+            n = registry._provided.get(provided, 0) + 1
+            registry._provided[provided] = n
+            if n == 1:
+                registry._v_lookup.add_extendor(provided)
+        self.changed(registry)
+
+    def unsubscribe(self, required, provided, value=None):
+        self.write_leaves()
+        BaseAdapterRegistry.unsubscribe(self.registry, required, provided,
+                                        value)
+
+    def write_leaves(self):
+        leaves, self.leaves = self.leaves, {}
+        for components, values in leaves.values():
+            components[''] = components.get('', ()) + tuple(values)
+
+def _can_defer(registry):
+    # only registries which keep their subscribers in tuples, the way
+    # BaseAdapterRegistry does, and whose methods can be shadowed;
+    # _addValueToLeaf is new in zope.interface 5.3
+    cls = type(registry)
+    add = getattr(BaseAdapterRegistry, '_addValueToLeaf', None)
+    return (add is not None and
+            isinstance(registry, BaseAdapterRegistry) and
+            hasattr(registry, '__dict__') and
+            cls.subscribe is BaseAdapterRegistry.subscribe and
+            cls.unsubscribe is BaseAdapterRegistry.unsubscribe and
+            getattr(cls, '_addValueToLeaf', None) is add and
+            getattr(cls, '_leafSequenceType', tuple) is tuple)
+
+@contextmanager
+def deferred_invalidation(*registries):
+    """ Within the block, the lookup caches of the zope.interface adapter
+    ``registries`` are invalidated once, when the block is left, instead
+    of after each registration.  Lookups made within the block may return
+    stale results."""
+    installed = []
+    try:
+        for registry in registries:
+            if _can_defer(registry):
+                deferred = _DeferredRegistry(registry)
+                deferred.install()
+                installed.append(deferred)
+        yield
+    finally:
+        for deferred in installed:
+            deferred.uninstall()
+
+class RegistrationBatch(object):
+    """ Adapter and utility registrations collected from consecutive
+    actions, made together by :meth:`flush`."""
+    def __init__(self, registry):
+        self.registry = registry
+        self.pending = []
+
+    def add(self, method, *args, **kw):
+        self.pending.append((method, args, kw))
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        registry = self.registry
+        with deferred_invalidation(registry.adapters, registry.utilities):
+            for method, args, kw in pending:
+                getattr(registry, method)(*args, **kw)
+
+def batch_registrations(registry, actions):
+    """ Return ``actions`` with every run of two or more consecutive
+    actions which register an adapter or a utility into ``registry``
+    replaced by actions which add to a :class:`RegistrationBatch`,
+    followed by an action which flushes the batch.  Discriminators are
+    unchanged, so conflict detection and overrides work as before; the
+    registrations which survive them are made in the same order, but
+    with one cache invalidation per run."""
+    methods = (
+        ('registerAdapter', registry.registerAdapter),
+        ('registerUtility', registry.registerUtility),
+        )
+    result = []
+    run = []
+    for action in actions:
+        method = _registration_method(action, methods)
+        if run and (method is None or
+                    action.get('order') != run[0][1].get('order')):
+            _add_run(registry, run, result)
+            run = []
+        if method is None:
+            result.append(action)
+        else:
+            run.append((method, action))
+    _add_run(registry, run, result)
+    return result
+
+def _registration_method(action, methods):
+    callable = action.get('callable')
+    for name, method in methods:
+        if callable == method:
+            return name
+
+def _add_run(registry, run, result):
+    if len(run) < 2:
+        result.extend([action for method, action in run])
+        return
+    batch = RegistrationBatch(registry)
+    for method, action in run:
+        action = dict(action)
+        action['callable'] = batch.add
+        action['args'] = (method,) + tuple(action['args'])
+        result.append(action)
+    flush = dict(action)
+    flush.update(discriminator=None, callable=batch.flush, args=(), kw={},
+                 introspectables=())
+    result.append(flush)
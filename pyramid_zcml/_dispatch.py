@@ -0,0 +1,80 @@
+import threading
+
+from zope.interface import implementedBy
+from zope.interface import providedBy
+from zope.interface.declarations import Implements
+
+from pyramid_zcml._warmup import EVENT_CLASSES
+
+class DispatchTable(object):
+    """ Replaces the ``notify`` method of a registry by one which keeps the
+    handlers subscribed to each type of event in a dictionary, so that
+    notifying an event of a type seen before is a dictionary lookup plus
+    a loop over the handlers.  The dictionary is emptied whenever the
+    adapter registry changes, e.g. when a subscriber is registered.
+    Notifications of several objects at once are passed on to the
+    original ``notify``."""
+    def __init__(self, registry):
+        self.registry = registry
+        self.original_notify = registry.notify
+        self.table = {}
+        self.lookup = None
+
+    def _attach(self, lookup):
+        # empty the table whenever the lookup caches of the adapter
+        # registry are invalidated; a changed registry may also create a
+        # new lookup object, which is then attached to
+        changed = lookup.changed
+        def invalidate(originally_changed):
+            self.table = {}
+            changed(originally_changed)
+        lookup.changed = invalidate
+        self.table = {}
+        self.lookup = lookup
+
+    def handlers(self, spec):
+        """ Return the handlers subscribed to events providing ``spec``."""
+        lookup = self.registry.adapters._v_lookup
+        if lookup is not self.lookup:
+            self._attach(lookup)
+        table = self.table
+        handlers = table.get(spec)
+        if handlers is None:
+            handlers = table[spec] = tuple(lookup.subscriptions((spec,), None))
+        return handlers
+
+    def notify(self, *events):
+        if not self.registry.has_listeners:
+            return
+        if len(events) != 1:
+            return self.original_notify(*events)
+        event = events[0]
+        for handler in self.handlers(providedBy(event)):
+            handler(event)
+
+    def compile(self, classes=EVENT_CLASSES):
+        """ Fill the table for events which are instances of ``classes``,
+        by default the events Pyramid sends while handling a request, and
+        for instances of the classes handlers are registered for."""
+        specs = [implementedBy(cls) for cls in classes]
+        for reg in self.registry.registeredHandlers():
+            if len(reg.required) == 1 and isinstance(reg.required[0],
+                                                     Implements):
+                specs.append(reg.required[0])
+        for spec in specs:
+            self.handlers(spec)
+
+_tables_lock = threading.Lock()
+
+def dispatch_table(registry):
+    """ Return the :class:`DispatchTable` of ``registry``, installing one
+    if necessary."""
+    table = registry.__dict__.get('_pyramid_zcml_dispatch_table')
+    if table is None:
+        with _tables_lock:
+            table = registry.__dict__.get('_pyramid_zcml_dispatch_table')
+            if table is None:
+                table = DispatchTable(registry)
+                registry._pyramid_zcml_dispatch_table = table
+                registry.notify = table.notify
+    return table
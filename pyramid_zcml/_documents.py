@@ -0,0 +1,216 @@
+import os
+import sys
+import threading
+
+from glob import glob
+from xml.sax import SAXParseException
+from xml.sax import make_parser
+from xml.sax.handler import ContentHandler
+from xml.sax.handler import feature_namespaces
+from xml.sax.xmlreader import InputSource
+
+from zope.configuration import xmlconfig
+from zope.configuration.config import GroupingContextDecorator
+from zope.configuration.config import GroupingStackItem
+from zope.configuration.config import defineSimpleDirective
+from zope.configuration.config import resolveConflicts
+from zope.configuration.xmlconfig import ConfigurationHandler
+from zope.configuration.xmlconfig import IInclude
+from zope.configuration.xmlconfig import ZopeSAXParseException
+
+class _Recorder(ContentHandler):
+    # records the SAX events a ConfigurationHandler is interested in,
+    # along with the position of the parser when each was reported
+    locator = None
+
+    def __init__(self):
+        ContentHandler.__init__(self)
+        self.events = []
+
+    def setDocumentLocator(self, locator):
+        self.locator = locator
+
+    def startElementNS(self, name, qname, attrs):
+        self.events.append((
+            'startElementNS', (name, qname, dict(attrs.items())),
+            self.locator.getLineNumber(), self.locator.getColumnNumber()))
+
+    def endElementNS(self, name, qname):
+        self.events.append((
+            'endElementNS', (name, qname),
+            self.locator.getLineNumber(), self.locator.getColumnNumber()))
+
+    def characters(self, text):
+        self.events.append(('characters', (text,), None, None))
+
+class _Locator(object):
+    def __init__(self, system_id):
+        self.system_id = system_id
+        self.line = self.column = None
+
+    def getSystemId(self):
+        return self.system_id
+
+    def getLineNumber(self):
+        return self.line
+
+    def getColumnNumber(self):
+        return self.column
+
+class Document(object):
+    """ The SAX events of a parsed ZCML file, which can be fed to the
+    ``ConfigurationHandler`` of any number of configuration contexts."""
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+
+    def process(self, context):
+        handler = ConfigurationHandler(context)
+        locator = _Locator(self.name)
+        handler.setDocumentLocator(locator)
+        for method, args, line, column in self.events:
+            locator.line = line
+            locator.column = column
+            getattr(handler, method)(*args)
+
+def _parse(path):
+    with xmlconfig.openInOrPlain(path) as f:
+        recorder = _Recorder()
+        src = InputSource(f.name)
+        src.setByteStream(f)
+        parser = make_parser()
+        parser.setContentHandler(recorder)
+        parser.setFeature(feature_namespaces, True)
+        try:
+            parser.parse(src)
+        except SAXParseException:
+            raise ZopeSAXParseException(f, sys.exc_info()[1])
+        return Document(f.name, recorder.events)
+
+class DocumentCache(object):
+    """ A process-wide cache of parsed ZCML files, used by the ``include``
+    and ``includeOverrides`` directives while ``load_zcml`` runs.  Entries
+    are keyed by absolute path and are reused while the modification time,
+    size and inode of the file are unchanged.  ``hits`` and ``misses``
+    count lookups."""
+    def __init__(self):
+        self.documents = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """ Return the :class:`Document` for the ZCML file ``path``,
+        parsing it if it is not cached or has changed."""
+        real = path
+        if not os.path.exists(real) and os.path.exists(real + '.in'):
+            real = real + '.in' # what openInOrPlain falls back to
+        try:
+            st = os.stat(real)
+        except OSError:
+            # let the opener produce the usual error
+            return _parse(path)
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self.lock:
+            entry = self.documents.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        document = _parse(path)
+        with self.lock:
+            self.documents[path] = (key, document)
+        return document
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        """ Return a dictionary of the cache counters."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'documents': len(self.documents),
+                }
+
+    def clear(self):
+        """ Forget every cached document and reset the counters."""
+        with self.lock:
+            self.documents.clear()
+            self.hits = self.misses = 0
+
+document_cache = DocumentCache()
+
+# ``include`` and ``includeOverrides`` are those of
+# zope.configuration.xmlconfig, except that ZCML files are obtained from
+# the document cache instead of being parsed each time they are included
+
+def include(_context, file=None, package=None, files=None):
+    if files:
+        if file:
+            raise ValueError("Must specify only one of file or files")
+    elif not file:
+        file = 'configure.zcml'
+
+    # This is a tad tricky. We want to behave as a grouping directive.
+
+    context = GroupingContextDecorator(_context)
+    if package is not None:
+        context.package = package
+        context.basepath = None
+
+    if files:
+        pattern = context.path(files)
+        globs = getattr(_context, '_include_globs', None)
+        if globs is not None:
+            # recorded so that cached parses notice files added later
+            globs.append(pattern)
+        paths = glob(pattern)
+        paths = sorted(zip([path.lower() for path in paths], paths))
+        paths = [path for (l, path) in paths]
+    else:
+        paths = [context.path(file)]
+
+    for path in paths:
+        if context.processFile(path):
+            document = document_cache.get(path)
+            context.basepath = os.path.dirname(path)
+            context.includepath = _context.includepath + (document.name, )
+            _context.stack.append(GroupingStackItem(context))
+            document.process(context)
+            assert _context.stack[-1].context is context
+            _context.stack.pop()
+
+def includeOverrides(_context, file=None, package=None, files=None):
+    # We need to remember how many actions we had before
+    nactions = len(_context.actions)
+
+    # We'll give the new actions this include path
+    includepath = _context.includepath
+
+    # Now we'll include the file. We'll munge the actions after
+    include(_context, file, package, files)
+
+    # Now we'll grab the new actions, resolve conflicts,
+    # and munge the includepath:
+    newactions = []
+
+    for action in resolveConflicts(_context.actions[nactions:]):
+        action['includepath'] = includepath
+        newactions.append(action)
+
+    _context.actions[nactions:] = newactions
+
+def register_include_directives(context):
+    # replaces the directives registered by registerCommonDirectives
+    defineSimpleDirective(
+        context, "include", IInclude, include, namespace="*")
+
+    defineSimpleDirective(
+        context, "includeOverrides", IInclude, includeOverrides, namespace="*")
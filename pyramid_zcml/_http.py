@@ -0,0 +1,61 @@
+import functools
+
+from pyramid.exceptions import ConfigurationError
+
+# the Cache-Control response directives ``http_cache`` may name, spelled
+# the way webob's ``CacheControl`` spells them
+CACHE_CONTROL_DIRECTIVES = (
+    'public', 'private', 'no_cache', 'no_store', 'no_transform',
+    'must_revalidate', 'proxy_revalidate', 'max_age', 's_maxage',
+    'stale_while_revalidate', 'stale_if_error',
+    )
+
+def parse_http_cache(value):
+    """ Convert the ``http_cache`` attribute of a ZCML directive to the
+    ``http_cache`` argument of ``add_view``.  The attribute is a comma
+    separated list holding a number of seconds and/or ``Cache-Control``
+    directives, e.g. ``3600``, ``3600, public, must-revalidate`` or
+    ``private, s-maxage=60``."""
+    seconds = None
+    options = {}
+    for token in value.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        if token.isdigit() and seconds is None and not options:
+            seconds = int(token)
+            continue
+        name, sep, arg = token.partition('=')
+        name = name.strip().lower().replace('-', '_')
+        if name not in CACHE_CONTROL_DIRECTIVES:
+            raise ConfigurationError(
+                'Unknown Cache-Control directive %r in http_cache %r' % (
+                    token, value))
+        if not sep:
+            options[name] = True
+        elif arg.strip().isdigit():
+            options[name] = int(arg)
+        else:
+            options[name] = arg.strip()
+    if not options:
+        return seconds
+    return (seconds, options)
+
+def conditional_response(view):
+    """ A view decorator which makes the responses of ``view`` conditional:
+    a request whose ``If-None-Match`` or ``If-Modified-Since`` header
+    matches the ``ETag`` or ``Last-Modified`` header of the response is
+    answered with ``304 Not Modified`` and no body.  A successful response
+    to a ``GET`` or ``HEAD`` request which has neither header gets an
+    ``ETag`` computed from its body."""
+    @functools.wraps(view)
+    def conditional_view(context, request):
+        response = view(context, request)
+        if (response.etag is None and response.last_modified is None and
+                response.status_int == 200 and
+                request.method in ('GET', 'HEAD') and
+                isinstance(response.app_iter, list)):
+            response.md5_etag()
+        response.conditional_response = True
+        return response
+    return conditional_view
@@ -0,0 +1,220 @@
+import threading
+
+from zope.configuration.fields import GlobalObject
+from zope.schema import ValidationError
+
+from pyramid.config.views import DefaultViewMapper
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IViewMapperFactory
+from pyramid.path import DottedNameResolver
+from pyramid.threadlocal import get_current_registry
+
+from pyramid_zcml._async import AsyncHandler
+
+_marker = object()
+
+class LazyViewMapper(object):
+    """ The view mapper of :class:`LazyObject`.  Mapping a view requires
+    inspecting it, so this mapper defers mapping (and thus importing) the
+    view until it is first called, and then maps it the way Pyramid would
+    have mapped it when it was added."""
+    def __init__(self, **kw):
+        self.kw = kw
+
+    def __call__(self, view):
+        kw = self.kw
+        mapped = []
+        def lazy_view(context, request):
+            if not mapped:
+                real = resolve_lazy(view)
+                mapper = getattr(real, '__view_mapper__', None)
+                if mapper is None:
+                    registry = get_current_registry()
+                    mapper = registry.queryUtility(IViewMapperFactory)
+                    if mapper is None:
+                        mapper = DefaultViewMapper
+                mapped.append(mapper(**kw)(real))
+            return mapped[0](context, request)
+        return lazy_view
+
+class LazyObject(object):
+    """ A stand-in for the global object named by a dotted name, which is
+    imported when the stand-in is first called or when an attribute which
+    is not a special (``__dunder__``) attribute is looked up on it."""
+    __view_mapper__ = LazyViewMapper
+
+    def __init__(self, name, package_name=None, info=None):
+        self._lazy_name = name
+        self._lazy_package_name = package_name
+        self._lazy_info = info
+        self._lazy_target = _marker
+        absolute = name
+        if absolute.startswith('.') and package_name:
+            absolute = package_name + absolute.rstrip('.')
+        module, dot, attr = absolute.rpartition('.')
+        # what Pyramid copies onto the views it derives from this one
+        self.__module__ = module
+        self.__name__ = self.__qualname__ = attr
+        self.__doc__ = None
+
+    def _lazy_resolve(self):
+        target = self._lazy_target
+        if target is _marker:
+            resolver = DottedNameResolver(self._lazy_package_name)
+            target = self._lazy_target = resolver.resolve(self._lazy_name)
+        return target
+
+    def __call__(self, *arg, **kw):
+        return self._lazy_resolve()(*arg, **kw)
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(self._lazy_resolve(), name)
+
+    def __reduce__(self):
+        return (LazyObject, (self._lazy_name, self._lazy_package_name,
+                             self._lazy_info))
+
+    def __repr__(self):
+        return '<LazyObject %s.%s>' % (self.__module__, self.__name__)
+
+def resolve_lazy(ob):
+    """ Return the object ``ob`` stands for if it is a :class:`LazyObject`,
+    otherwise ``ob`` itself."""
+    if isinstance(ob, LazyObject):
+        return ob._lazy_resolve()
+    return ob
+
+class LazyGlobalObject(GlobalObject):
+    """ A :class:`zope.configuration.fields.GlobalObject` which, when the
+    configuration context has a true ``lazy_imports`` attribute, converts
+    to a :class:`LazyObject` instead of importing the named object."""
+    def fromUnicode(self, value):
+        if not getattr(self.context, 'lazy_imports', False):
+            return GlobalObject.fromUnicode(self, value)
+        name = str(value.strip())
+        if name == '*':
+            return None
+        try:
+            to_validate = name.lstrip('.')
+            if to_validate:
+                self._DOT_VALIDATOR.validate(to_validate)
+        except ValidationError as v:
+            v.with_field_and_value(self, name)
+            raise
+        package = getattr(self.context, 'package', None)
+        return LazyObject(name, getattr(package, '__name__', None),
+                          getattr(self.context, 'info', None))
+
+def validate_lazy_imports(registry):
+    """ Import the object behind every :class:`LazyObject` used by the
+    views, routes, adapters and subscribers of ``registry``, raising a
+    :exc:`pyramid.exceptions.ConfigurationError` which lists every dotted
+    name that cannot be imported."""
+    candidates = []
+    introspector = getattr(registry, 'introspector', None)
+    if introspector is not None:
+        for intr in introspector.get_category('views') or ():
+            candidates.append(intr['introspectable'].get('callable'))
+        for intr in introspector.get_category('routes') or ():
+            candidates.append(intr['introspectable'].get('factory'))
+    for reg in registry.registeredAdapters():
+        candidates.append(reg.factory)
+        candidates.append(getattr(reg.factory, '__original_view__', None))
+    for reg in registry.registeredSubscriptionAdapters():
+        candidates.append(reg.factory)
+    for reg in registry.registeredHandlers():
+        candidates.append(reg.handler)
+        if isinstance(reg.handler, AsyncHandler):
+            candidates.append(reg.handler.handler)
+
+    errors = []
+    seen = set()
+    for ob in candidates:
+        if not isinstance(ob, LazyObject) or id(ob) in seen:
+            continue
+        seen.add(id(ob))
+        try:
+            ob._lazy_resolve()
+        except Exception as e:
+            errors.append('%s: %s: %s\n%s' % (
+                ob._lazy_name, e.__class__.__name__, e, ob._lazy_info))
+    if errors:
+        raise ConfigurationError(
+            'Cannot import lazily resolved objects:\n\n' +
+            '\n\n'.join(errors))
+
+class LazyUtility(object):
+    """ The placeholder registered by ``<utility factory="..."
+    lazy="true"/>``.  The first time it is looked up with ``queryUtility``
+    or ``getUtility`` (or used, when it was obtained some other way), the
+    factory is called and the utility it returns is registered in place of
+    the placeholder."""
+    def __init__(self, registry, factory, provides, name='', info=''):
+        self._lazy_registry = registry
+        self._lazy_factory = factory
+        self._lazy_provides = provides
+        self._lazy_name = name
+        self._lazy_info = info
+        self._lazy_target = _marker
+        self._lazy_lock = threading.Lock()
+
+    def _lazy_resolve(self):
+        target = self._lazy_target
+        if target is _marker:
+            with self._lazy_lock:
+                target = self._lazy_target
+                if target is _marker:
+                    target = self._lazy_factory()
+                    registry = self._lazy_registry
+                    provides, name = self._lazy_provides, self._lazy_name
+                    # unless something else was registered meanwhile
+                    if registry.utilities.lookup((), provides, name) is self:
+                        registry.registerUtility(target, provides, name,
+                                                 self._lazy_info)
+                    self._lazy_target = target
+        return target
+
+    def __call__(self, *arg, **kw):
+        return self._lazy_resolve()(*arg, **kw)
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(self._lazy_resolve(), name)
+
+    def __repr__(self):
+        return '<LazyUtility %s %r>' % (self._lazy_provides.__identifier__,
+                                        self._lazy_name)
+
+def _install_utility_hooks(registry):
+    # make queryUtility and getUtility of ``registry`` replace the
+    # LazyUtility placeholders they find by the utilities they stand for
+    if '_pyramid_zcml_lazy_utilities' in registry.__dict__:
+        return
+    query = registry.queryUtility
+    get = registry.getUtility
+
+    def queryUtility(provided, name='', default=None):
+        utility = query(provided, name, default)
+        if isinstance(utility, LazyUtility):
+            utility = utility._lazy_resolve()
+        return utility
+
+    def getUtility(provided, name=''):
+        utility = get(provided, name)
+        if isinstance(utility, LazyUtility):
+            utility = utility._lazy_resolve()
+        return utility
+
+    registry.queryUtility = queryUtility
+    registry.getUtility = getUtility
+    registry._pyramid_zcml_lazy_utilities = True
+
+def register_lazy_utility(registry, factory, provides, name='', info=''):
+    """ Register a :class:`LazyUtility` for ``factory`` in ``registry``."""
+    _install_utility_hooks(registry)
+    registry.registerUtility(
+        LazyUtility(registry, factory, provides, name, info), provides, name,
+        info)
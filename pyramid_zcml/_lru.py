@@ -0,0 +1,96 @@
+import collections
+import threading
+import time
+
+class LRUCache(object):
+    """ A thread-safe mapping which discards its least recently used
+    entries when it holds more than ``max_entries`` entries, or when the
+    sizes given to :meth:`set` add up to more than ``max_bytes``.  Either
+    bound may be ``None``.  With a ``ttl``, entries expire that many
+    seconds after they were set.  :meth:`stats` reports the ``hits``,
+    ``misses``, ``evictions`` and ``expirations`` counted since the cache
+    was created."""
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = collections.OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """ Return the value stored for ``key`` and mark it as the most
+        recently used, or return ``default``."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[2] is not None and entry[2] <= time.monotonic():
+                del self._data[key]
+                self.size -= entry[1]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=0):
+        """ Store ``value`` for ``key``, as the most recently used entry.
+        Values larger than ``max_bytes`` are not stored."""
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size, expires)
+            self.size += size
+            data = self._data
+            while data and (
+                    (self.max_entries is not None and
+                     len(data) > self.max_entries) or
+                    (self.max_bytes is not None and
+                     self.size > self.max_bytes)):
+                key, entry = data.popitem(last=False)
+                self.size -= entry[1]
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """ Remove the entry for ``key`` and return its value, or return
+        ``default``."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        """ Return a dictionary of the counters and the current size of
+        the cache."""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                }
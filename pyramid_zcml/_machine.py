@@ -0,0 +1,61 @@
+import copy
+import threading
+
+from zope.configuration import xmlconfig
+from zope.configuration.config import ConfigurationMachine
+from zope.configuration.config import RootStackItem
+from zope.interface.adapter import AdapterRegistry
+
+from pyramid_zcml._documents import include
+from pyramid_zcml._documents import register_include_directives
+
+class ZCMLMachine(ConfigurationMachine):
+    """ The configuration machine used by ``load_zcml``.  Machines are
+    normally created by :func:`new_machine`, which copies the directive
+    registrations of a prototype instead of registering them again; the
+    per-directive adapter registries of the prototype are shared until a
+    machine registers a directive of the same name."""
+    _shared = frozenset()
+
+    def register(self, interface, name, factory):
+        if name in self._shared:
+            # copy on write: never modify the registry of the prototype
+            self._registry[name] = AdapterRegistry(
+                bases=(self._registry[name],))
+            self._shared = self._shared - set([name])
+        ConfigurationMachine.register(self, interface, name, factory)
+
+_prototypes = {}
+_prototypes_lock = threading.Lock()
+
+def _make_prototype(machine_class):
+    import pyramid_zcml
+    machine = machine_class()
+    xmlconfig.registerCommonDirectives(machine)
+    register_include_directives(machine)
+    # registers the pyramid_zcml directives and marks meta.zcml and
+    # configure.zcml as seen, so ``<include package="pyramid_zcml"/>``
+    # is a no-op for machines copied from this one
+    include(machine, package=pyramid_zcml)
+    assert not machine.actions
+    return machine
+
+def new_machine(machine_class=ZCMLMachine):
+    """ Return a new ``machine_class`` instance on which the common ZCML
+    directives and those of ``pyramid_zcml`` are already registered.  The
+    registrations are made once per process and class."""
+    prototype = _prototypes.get(machine_class)
+    if prototype is None:
+        with _prototypes_lock:
+            prototype = _prototypes.get(machine_class)
+            if prototype is None:
+                prototype = _prototypes[machine_class] = _make_prototype(
+                    machine_class)
+    machine = machine_class.__new__(machine_class)
+    for name, value in prototype.__dict__.items():
+        if isinstance(value, (list, dict, set)):
+            value = copy.copy(value)
+        machine.__dict__[name] = value
+    machine.stack = [RootStackItem(machine)]
+    machine._shared = frozenset(prototype._registry)
+    return machine
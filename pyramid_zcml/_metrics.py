@@ -0,0 +1,234 @@
+import bisect
+import logging
+import threading
+import time
+
+from pyramid.events import ApplicationCreated
+from pyramid.response import Response
+
+# the upper bounds of the histogram buckets, in seconds, used by default;
+# those of the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+                   1.0, 2.5, 5.0, 7.5, 10.0)
+
+# the (source, view) of the view handling a request, in its environ
+SOURCE_KEY = 'pyramid_zcml.view_source'
+
+NO_VIEW = ('-', '-')
+
+class ViewMetrics(object):
+    """ Latency histograms of the requests handled by each view, labelled
+    by the ``file:line`` of the ZCML directive which added the view and by
+    the dotted name of the view.  The histograms count the requests whose
+    latency in seconds is at most each bound of ``buckets``."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # (source, view): [count per bucket..., count above, sum]
+        self._histograms = {}
+
+    def observe(self, key, seconds):
+        """ Count a request handled by the view ``key``, a ``(source,
+        view)`` tuple, which took ``seconds``."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = (
+                    [0] * (len(self.buckets) + 2))
+                histogram[-1] = 0.0
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        """ Return a dictionary mapping each ``(source, view)`` to a
+        dictionary of its ``count``, ``sum`` and cumulative ``buckets``, a
+        list of ``(bound, count)`` ending with ``(inf, count)``."""
+        with self._lock:
+            histograms = [(key, list(histogram))
+                          for key, histogram in self._histograms.items()]
+        bounds = self.buckets + (float('inf'),)
+        result = {}
+        for key, histogram in histograms:
+            cumulative = []
+            count = 0
+            for bound, n in zip(bounds, histogram[:-1]):
+                count += n
+                cumulative.append((bound, count))
+            result[key] = {'count': count, 'sum': histogram[-1],
+                           'buckets': cumulative}
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def prometheus_text(self, name='pyramid_zcml_view_duration_seconds'):
+        """ Return the histograms in the Prometheus text exposition
+        format."""
+        lines = [
+            '# HELP %s Latency of the requests handled by each view, by the '
+            'ZCML directive which added it.' % name,
+            '# TYPE %s histogram' % name,
+            ]
+        for (source, view), data in sorted(self.snapshot().items()):
+            labels = 'source="%s",view="%s"' % (_escape(source),
+                                                _escape(view))
+            for bound, count in data['buckets']:
+                if bound == float('inf'):
+                    le = '+Inf'
+                else:
+                    le = repr(float(bound))
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, le, count))
+            lines.append('%s_sum{%s} %r' % (name, labels, data['sum']))
+            lines.append('%s_count{%s} %d' % (name, labels, data['count']))
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+def quantile(data, fraction):
+    """ The upper bound of the bucket holding the ``fraction`` quantile of
+    ``data``, a histogram of :meth:`ViewMetrics.snapshot`."""
+    rank = fraction * data['count']
+    for bound, count in data['buckets']:
+        if count >= rank:
+            return bound
+    return float('inf')
+
+def view_metrics(registry):
+    """ Return the :class:`ViewMetrics` collected for the application of
+    ``registry`` because of its ``viewmetrics`` directive, or ``None``."""
+    return getattr(registry, '_pyramid_zcml_view_metrics', None)
+
+def view_metrics_tween_factory(handler, registry):
+    """ A tween factory: the tween adds the latency of each request to the
+    histogram of the view which handled it."""
+    metrics = view_metrics(registry)
+    if metrics is None:
+        return handler
+    perf_counter = time.perf_counter
+    def view_metrics_tween(request):
+        start = perf_counter()
+        try:
+            return handler(request)
+        finally:
+            metrics.observe(request.environ.get(SOURCE_KEY, NO_VIEW),
+                            perf_counter() - start)
+    return view_metrics_tween
+
+_current = threading.local()
+
+def _source_action(callable, info):
+    def source_action(*arg, **kw):
+        _current.info = info
+        try:
+            return callable(*arg, **kw)
+        finally:
+            _current.info = None
+    return source_action
+
+def source_actions(actions):
+    """ Return ``actions`` with the callables of those which have a ZCML
+    location wrapped so that the view derivers run while they are executed
+    know it."""
+    result = []
+    for action in actions:
+        info = action.get('info')
+        if action.get('callable') is not None and hasattr(info, 'line'):
+            action = dict(action)
+            action['callable'] = _source_action(action['callable'], info)
+        result.append(action)
+    return result
+
+def _view_name(view):
+    name = getattr(view, '__qualname__', None) or getattr(
+        view, '__name__', None) or view.__class__.__name__
+    module = getattr(view, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    return name
+
+def view_source_deriver(view, info):
+    """ A view deriver which records the ZCML location of the directive
+    which added the view, and the view's name, in the environ of the
+    requests it handles."""
+    location = getattr(_current, 'info', None)
+    source = '-'
+    if location is not None:
+        source = '%s:%s' % (location.file, location.line)
+    name = _view_name(info.original_view)
+    attr = info.options.get('attr')
+    if attr:
+        name = '%s.%s' % (name, attr)
+    key = (source, name)
+    def view_source(context, request):
+        environ = request.environ
+        if SOURCE_KEY not in environ:
+            environ[SOURCE_KEY] = key
+        return view(context, request)
+    return view_source
+
+class PrometheusExporter(object):
+    """ An exporter which serves the :class:`ViewMetrics` in the
+    Prometheus text exposition format at ``path``."""
+    route_name = 'pyramid_zcml.viewmetrics'
+
+    def __init__(self, path='/metrics'):
+        self.path = path
+
+    def __call__(self, config, metrics):
+        def metrics_view(request):
+            return Response(metrics.prometheus_text(),
+                            content_type='text/plain; version=0.0.4',
+                            charset='utf-8')
+        config.add_route(self.route_name, self.path)
+        config.add_view(metrics_view, route_name=self.route_name)
+
+class LogExporter(object):
+    """ An exporter which logs a line per view of the :class:`ViewMetrics`
+    every ``interval`` seconds with the ``logger`` named ``logger``, from a
+    daemon thread started when the application is created.  With
+    ``reset``, the histograms are emptied after each dump."""
+    def __init__(self, interval=60, logger='pyramid_zcml.viewmetrics',
+                 reset=False):
+        self.interval = interval
+        self.logger = logging.getLogger(logger)
+        self.reset = reset
+        self.thread = None
+
+    def __call__(self, config, metrics):
+        self.metrics = metrics
+        config.add_subscriber(self.start, ApplicationCreated)
+
+    def start(self, event=None):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run,
+                                           name='pyramid_zcml.viewmetrics')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.dump()
+
+    def dump(self):
+        """ Log the histograms now."""
+        snapshot = self.metrics.snapshot()
+        if self.reset:
+            self.metrics.reset()
+        for (source, view), data in sorted(snapshot.items()):
+            count = data['count']
+            self.logger.info(
+                '%s %s: %d requests, mean %.1fms, p50 <= %sms, '
+                'p99 <= %sms', source, view, count,
+                data['sum'] / count * 1e3 if count else 0.0,
+                _ms(quantile(data, 0.5)), _ms(quantile(data, 0.99)))
+
+def _ms(bound):
+    if bound == float('inf'):
+        return 'inf'
+    return '%g' % (bound * 1e3)
@@ -0,0 +1,120 @@
+import threading
+
+# the attribute of a request holding the results of its shared predicates
+_RESULTS = '_pyramid_zcml_predicate_results'
+
+class SharedPredicate(object):
+    """ The ``predicate`` of every view and route with the same predicate
+    value.  It is evaluated once per request; its result is then reused."""
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def text(self):
+        return self.predicate.text()
+
+    def phash(self):
+        return self.predicate.phash()
+
+    def __call__(self, context, request):
+        attrs = request.__dict__
+        results = attrs.get(_RESULTS)
+        if results is None:
+            results = attrs[_RESULTS] = {}
+        result = results.get(self)
+        if result is None:
+            result = results[self] = self.predicate(context, request)
+        return result
+
+class _InterningFactory(object):
+    def __init__(self, interner, factory):
+        self.interner = interner
+        self.factory = factory
+
+    def __call__(self, value, info):
+        return self.interner.predicate(self.factory, value, info)
+
+class PredicateInterner(object):
+    """ Makes the views and routes of a registry share their
+    ``path_info``, ``request_param``, ``header`` and ``accept`` predicates:
+    a predicate is made once per distinct value, as a
+    :class:`SharedPredicate`."""
+    names = ('path_info', 'request_param', 'header', 'accept')
+
+    def __init__(self):
+        # (factory, value): shared predicate
+        self.predicates = {}
+        # (factory, phash): shared predicate, for values which are written
+        # differently but mean the same, e.g. "a b" and "b a"
+        self.hashes = {}
+
+    def predicate(self, factory, value, info):
+        """ Return the shared predicate made by ``factory`` for ``value``,
+        making it if necessary."""
+        try:
+            key = (factory, _frozen(value))
+            shared = self.predicates.get(key)
+        except TypeError:
+            # an unhashable value
+            key = shared = None
+        if shared is None:
+            predicate = factory(value, info)
+            hkey = (factory, predicate.phash())
+            shared = self.hashes.get(hkey)
+            if shared is None:
+                shared = self.hashes[hkey] = SharedPredicate(predicate)
+            if key is not None:
+                self.predicates[key] = shared
+        return shared
+
+    def install(self, config):
+        """ Make the view and route predicate lists of ``config`` intern
+        the predicates they make."""
+        factories = _request_predicates()
+        for type in ('view', 'route'):
+            predlist = config.get_predlist(type)
+            if getattr(predlist, '_pyramid_zcml_interner', None) is self:
+                continue
+            predlist.make = self._interning_make(predlist, predlist.make,
+                                                 factories)
+            predlist._pyramid_zcml_interner = self
+
+    def _interning_make(self, predlist, make, factories):
+        def interning_make(config, **kw):
+            # the default predicates may be added after the interner is
+            # installed, and may be overridden by other factories
+            name2val = predlist.sorter.name2val
+            for name in self.names:
+                factory = name2val.get(name)
+                if factory in factories:
+                    name2val[name] = _InterningFactory(self, factory)
+            return make(config, **kw)
+        return interning_make
+
+def _request_predicates():
+    # the predicates which only depend on the request, not on the context
+    try:
+        from pyramid import predicates
+    except ImportError: # Pyramid < 1.9
+        from pyramid.config import predicates
+    return (predicates.PathInfoPredicate, predicates.RequestParamPredicate,
+            predicates.HeaderPredicate, predicates.AcceptPredicate)
+
+def _frozen(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(v) for v in value)
+    return value
+
+_lock = threading.Lock()
+
+def predicate_interner(registry):
+    """ Return the :class:`PredicateInterner` of ``registry``, making it if
+    necessary."""
+    interner = getattr(registry, '_pyramid_zcml_predicate_interner', None)
+    if interner is None:
+        with _lock:
+            interner = getattr(registry, '_pyramid_zcml_predicate_interner',
+                               None)
+            if interner is None:
+                interner = registry._pyramid_zcml_predicate_interner = (
+                    PredicateInterner())
+    return interner
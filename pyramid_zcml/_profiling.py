@@ -0,0 +1,138 @@
+import json
+import time
+
+from zope.configuration.config import SimpleStackItem
+from zope.configuration.config import toargs
+
+from pyramid_zcml._machine import ZCMLMachine
+from pyramid_zcml._recording import _call
+from pyramid_zcml._recording import _is_structural
+
+class DirectiveTiming(object):
+    """ The timings of a single ZCML directive, in seconds.  ``imports`` is
+    the time spent importing the dotted names of its attributes,
+    ``handler`` the time spent in the directive handler and ``commit`` the
+    time its actions took when the configuration was committed."""
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self.imports = 0.0
+        self.handler = 0.0
+        self.commit = 0.0
+        self.events = []
+
+    @property
+    def location(self):
+        file = getattr(self.info, 'file', None)
+        if file is None:
+            return str(self.info)
+        return '%s:%s' % (file, self.info.line)
+
+    @property
+    def total(self):
+        return self.imports + self.handler + self.commit
+
+class ZCMLProfiler(object):
+    """ Collects per-directive timings when passed as the ``profiler``
+    argument of :func:`pyramid_zcml.load_zcml`.  After the configuration
+    has been committed, :meth:`report` and :meth:`write_trace` export the
+    timings."""
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.directives = []
+
+    def directive(self, name, info):
+        timing = DirectiveTiming(name, info)
+        self.directives.append(timing)
+        return timing
+
+    def timed(self, timing, phase, label, func):
+        # call ``func``, adding the elapsed time to ``phase`` of ``timing``
+        # and remembering it as a trace event
+        start = self.clock()
+        try:
+            return func()
+        finally:
+            end = self.clock()
+            setattr(timing, phase, getattr(timing, phase) + end - start)
+            timing.events.append((phase, label, start - self.origin,
+                                  end - start))
+
+    def report(self, sort='total', limit=None):
+        """ Return a text report with one line per directive, slowest (by
+        the ``sort`` column: ``total``, ``imports``, ``handler`` or
+        ``commit``) first."""
+        directives = sorted(self.directives, key=lambda d: getattr(d, sort),
+                            reverse=True)
+        if limit is not None:
+            directives = directives[:limit]
+        lines = ['%9s %9s %9s %9s  %-12s %s' % (
+            'total', 'imports', 'handler', 'commit', 'directive', 'location')]
+        for d in directives:
+            lines.append('%9.6f %9.6f %9.6f %9.6f  %-12s %s' % (
+                d.total, d.imports, d.handler, d.commit, d.name, d.location))
+        return '\n'.join(lines) + '\n'
+
+    def trace(self):
+        """ Return the timings in the Chrome trace event format."""
+        events = []
+        for d in self.directives:
+            for phase, label, start, duration in d.events:
+                events.append({
+                    'name': label,
+                    'cat': phase,
+                    'ph': 'X',
+                    'ts': start * 1e6,
+                    'dur': duration * 1e6,
+                    'pid': 1,
+                    'tid': phase == 'commit' and 2 or 1,
+                    'args': {'directive': d.name, 'location': d.location},
+                    })
+        events.sort(key=lambda event: event['ts'])
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, filename):
+        """ Write :meth:`trace` as JSON to ``filename``; the file can be
+        loaded into ``chrome://tracing`` or Perfetto."""
+        with open(filename, 'w') as f:
+            json.dump(self.trace(), f)
+
+class ProfilingMachine(ZCMLMachine):
+    """ A configuration machine which times every simple directive it
+    processes using the ``profiler`` attribute set on it."""
+    profiler = None
+
+    def end(self):
+        item = self.stack.pop()
+        if (not isinstance(item, SimpleStackItem) or
+            _is_structural(item.handler)):
+            item.finish()
+            return
+        context = item.context
+        handler = item.handler
+        name = getattr(handler, '__name__', repr(handler))
+        timing = self.profiler.directive(name, context.info)
+        resolve = context.resolve
+        def timed_resolve(dottedname):
+            return self.profiler.timed(timing, 'imports', dottedname,
+                                       lambda: resolve(dottedname))
+        context.resolve = timed_resolve
+        try:
+            kw = toargs(context, *item.argdata)
+        finally:
+            del context.resolve
+        start = len(self.actions)
+        self.profiler.timed(timing, 'handler', name,
+                            lambda: _call(context, handler, kw))
+        for action in self.actions[start:]:
+            if action.get('callable') is not None:
+                action['callable'] = self._timed_callable(
+                    timing, action['callable'])
+
+    def _timed_callable(self, timing, callable):
+        profiler = self.profiler
+        def timed_callable(*args, **kw):
+            return profiler.timed(timing, 'commit', timing.name,
+                                  lambda: callable(*args, **kw))
+        return timed_callable
@@ -0,0 +1,230 @@
+import copyreg
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import types
+from glob import glob
+
+from zope.configuration.config import GroupingContextDecorator
+from zope.configuration.config import SimpleStackItem
+from zope.configuration.config import expand_action
+from zope.configuration.config import toargs
+
+from pyramid_zcml._documents import include
+from pyramid_zcml._documents import includeOverrides
+from pyramid_zcml._machine import ZCMLMachine
+
+# bump this whenever the layout of a pickled recording changes so that
+# caches written by older versions are ignored instead of misread
+CACHE_FORMAT = 2
+
+logger = logging.getLogger('pyramid_zcml')
+
+class DirectiveRecord(object):
+    """ A single simple ZCML directive call, captured after schema
+    conversion: the handler, its converted keyword arguments and the
+    state of the context it was called with."""
+    def __init__(self, handler, kw, info, package_name, basepath,
+                 includepath):
+        self.handler = handler
+        self.kw = kw
+        self.info = info
+        self.package_name = package_name
+        self.basepath = basepath
+        self.includepath = includepath
+
+class ZCMLTemplate(object):
+    """ An ordered sequence of :class:`DirectiveRecord` objects which can
+    be replayed into a configuration context without parsing any XML."""
+    def __init__(self, records):
+        self.records = records
+
+    def apply(self, config, lock=None):
+        """ Add the recorded configuration to the :term:`Configurator`
+        ``config``, as if the ZCML had been loaded with
+        :func:`pyramid_zcml.load_zcml`.  ``lock`` has the same meaning as
+        for ``load_zcml``."""
+        from pyramid_zcml import _apply_template
+        _apply_template(config, self, lock)
+
+    def replay(self, context):
+        # directives which were processed at the same include level
+        # share a grouping context, just like they do when the XML is
+        # parsed
+        levels = {}
+        for record in self.records:
+            key = (record.package_name, record.basepath, record.includepath)
+            level = levels.get(key)
+            if level is None:
+                level = GroupingContextDecorator(context)
+                level.package = _import(record.package_name)
+                level.basepath = record.basepath
+                level.includepath = record.includepath
+                levels[key] = level
+            directive_context = GroupingContextDecorator(level)
+            directive_context.info = record.info
+            _call(directive_context, record.handler, record.kw)
+
+def _import(package_name):
+    if package_name is None:
+        return None
+    __import__(package_name)
+    return sys.modules[package_name]
+
+def _call(context, handler, kw):
+    # this is what SimpleStackItem.finish does once the arguments have
+    # been converted
+    actions = handler(context, **kw)
+    if actions:
+        # we allow the handler to return nothing
+        for action in actions:
+            if not isinstance(action, dict):
+                action = expand_action(*action) # b/c
+            context.action(**action)
+
+def _is_structural(handler):
+    # include, includeOverrides, exclude and the meta directives only
+    # influence parsing; their effect is already captured by the
+    # directives they cause to be processed
+    if handler in (include, includeOverrides):
+        return True
+    module = getattr(handler, '__module__', None) or ''
+    return module.startswith('zope.configuration.')
+
+class RecordingMachine(ZCMLMachine):
+    """ A configuration machine which records every simple directive it
+    processes so that the parse can later be turned into a
+    :class:`ZCMLTemplate`."""
+    def __init__(self):
+        ZCMLMachine.__init__(self)
+        self.recorded = []
+        # the patterns of the ``files`` of include directives
+        self._include_globs = []
+
+    def end(self):
+        item = self.stack.pop()
+        if (not isinstance(item, SimpleStackItem) or
+            _is_structural(item.handler)):
+            item.finish()
+            return
+        context = item.context
+        kw = toargs(context, *item.argdata)
+        start = len(self.actions)
+        _call(context, item.handler, kw)
+        package = getattr(context, 'package', None)
+        record = DirectiveRecord(
+            item.handler,
+            kw,
+            context.info,
+            getattr(package, '__name__', None),
+            context.basepath,
+            context.includepath,
+            )
+        self.recorded.append((record, start, len(self.actions) - start))
+
+    def template(self):
+        """ Return a :class:`ZCMLTemplate` representing everything this
+        machine has processed, or ``None`` if some actions were not
+        produced by a recorded simple directive (for example those of
+        complex directives) and the parse thus cannot be replayed."""
+        if sum([count for (record, start, count) in self.recorded]) != len(
+            self.actions):
+            return None
+        records = []
+        for record, start, count in self.recorded:
+            if count:
+                # includeOverrides rewrites the include path of the
+                # actions after they were produced; replay the directive
+                # with the include path its actions ended up with
+                record.includepath = self.actions[start]['includepath']
+            records.append(record)
+        return ZCMLTemplate(records)
+
+def _digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+class ActionCache(object):
+    """ An on-disk cache of ZCML parse results.  Each entry holds a
+    pickled :class:`ZCMLTemplate` along with the content hash of every
+    file that was included to produce it, and the files matched by the
+    ``files`` pattern of every include; the entry is only used while all
+    of those files are unchanged and the patterns match the same files."""
+    def __init__(self, cache_dir, lazy_imports=False):
+        self.cache_dir = cache_dir
+        self.lazy_imports = lazy_imports
+
+    def _path(self, package_name, filename, features):
+        key = repr((CACHE_FORMAT, package_name, filename,
+                    sorted(features), bool(self.lazy_imports)))
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.zcmlcache')
+
+    def load(self, package_name, filename, features):
+        """ Return the cached :class:`ZCMLTemplate` or ``None`` if there
+        is no valid cache entry."""
+        path = self._path(package_name, filename, features)
+        try:
+            with open(path, 'rb') as f:
+                version, files, globs, template = pickle.load(f)
+        except Exception:
+            # missing, unreadable or unpicklable (e.g. a module which
+            # has disappeared); all of them mean "reparse"
+            return None
+        if version != CACHE_FORMAT:
+            return None
+        for filepath, digest in files:
+            if _digest(filepath) != digest:
+                return None
+        for pattern, paths in globs:
+            if sorted(glob(pattern)) != paths:
+                return None
+        return template
+
+    def store(self, package_name, filename, features, files, template,
+              globs=()):
+        """ Store ``template`` for later use.  Templates which refer to
+        objects that cannot be pickled (such as lambdas) are not cached;
+        a warning is logged."""
+        files = [(path, _digest(path)) for path in sorted(files)]
+        globs = [(pattern, sorted(glob(pattern)))
+                 for pattern in sorted(set(globs))]
+        try:
+            data = _dumps((CACHE_FORMAT, files, globs, template))
+        except Exception as e:
+            logger.warning('Cannot cache the ZCML of %s (%s): %s',
+                           filename, package_name, e)
+            return False
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self._path(package_name, filename, features)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        return True
+
+def _reduce_module(module):
+    # modules, e.g. the package of a scan directive, are pickled by name
+    return _import, (module.__name__,)
+
+_dispatch_table = copyreg.dispatch_table.copy()
+_dispatch_table[types.ModuleType] = _reduce_module
+
+def _dumps(obj):
+    f = io.BytesIO()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = _dispatch_table
+    pickler.dump(obj)
+    return f.getvalue()
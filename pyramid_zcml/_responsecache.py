@@ -0,0 +1,113 @@
+import functools
+import threading
+
+from pyramid.response import Response
+
+from pyramid_zcml._lru import LRUCache
+
+class ResponseCache(object):
+    """ A view decorator which keeps the successful responses of a view to
+    ``GET`` and ``HEAD`` requests in an :class:`LRUCache` of at most
+    ``size`` entries, for ``ttl`` seconds, and answers later requests with
+    the same key from it without calling the view.
+
+    The key of a request is made of the name and match dictionary of the
+    matched route (or the path, for requests which matched no route), the
+    view name and the values of the request parameters named in
+    ``params``; other parameters, cookies and headers are not part of it,
+    so the view must not depend on them.  The exception are the request
+    headers named by the ``Vary`` header of a response: the response is
+    only used for requests with the same values of these headers.
+    Responses which set cookies, which are marked ``private`` or
+    ``no-store``, which vary on ``*``, or whose body is streamed are not
+    kept.  ``label`` names the cache in the result of
+    :func:`response_caches`."""
+    def __init__(self, ttl, params=(), size=1000, label=None):
+        self.ttl = ttl
+        self.params = tuple(params)
+        self.label = label
+        self.cache = LRUCache(max_entries=size, ttl=ttl)
+        # key: the lower-cased names of the headers the responses vary on
+        self.varies = LRUCache(max_entries=size, ttl=ttl)
+
+    def key(self, request):
+        route = getattr(request, 'matched_route', None)
+        if route is None:
+            where = (None, request.path_info)
+        else:
+            matchdict = request.matchdict or {}
+            where = (route.name, tuple(sorted(matchdict.items())))
+        return where + (
+            getattr(request, 'view_name', ''),
+            tuple([tuple(request.params.getall(name))
+                   for name in self.params]),
+            )
+
+    def stats(self):
+        """ Return the counters of the cache, see
+        :meth:`LRUCache.stats`."""
+        return self.cache.stats()
+
+    def __call__(self, view):
+        cache = self.cache
+        @functools.wraps(view)
+        def cached_view(context, request):
+            if request.method not in ('GET', 'HEAD'):
+                return view(context, request)
+            base = key = self.key(request)
+            vary = self.varies.get(base)
+            if vary is not None:
+                key = base + (_variant(request, vary),)
+            entry = cache.get(key)
+            if entry is not None:
+                status, headerlist, body, conditional = entry
+                response = Response(status=status, headerlist=list(headerlist),
+                                    body=body)
+                response.conditional_response = conditional
+                return response
+            response = view(context, request)
+            if _cacheable(response):
+                vary = _vary(response)
+                if vary:
+                    self.varies.set(base, vary)
+                    key = base + (_variant(request, vary),)
+                else:
+                    self.varies.pop(base)
+                    key = base
+                cache.set(key, (response.status, tuple(response.headerlist),
+                                response.body, response.conditional_response))
+            return response
+        return cached_view
+
+def _cacheable(response):
+    if response.status_int != 200:
+        return False
+    if not isinstance(response.app_iter, list):
+        return False
+    if 'Set-Cookie' in response.headers:
+        return False
+    if '*' in _vary(response):
+        return False
+    cache_control = response.cache_control
+    return not (cache_control.private or cache_control.no_store)
+
+def _vary(response):
+    return tuple(sorted(set([name.strip().lower()
+                             for name in response.vary or ()])))
+
+def _variant(request, vary):
+    return tuple([request.headers.get(name) for name in vary])
+
+_caches_lock = threading.Lock()
+
+def response_caches(registry):
+    """ Return the list of the :class:`ResponseCache` objects created for
+    the ``cache_ttl`` attributes of ZCML directives configuring
+    ``registry``, e.g. to report their :meth:`ResponseCache.stats`."""
+    caches = getattr(registry, '_pyramid_zcml_response_caches', None)
+    if caches is None:
+        with _caches_lock:
+            caches = getattr(registry, '_pyramid_zcml_response_caches', None)
+            if caches is None:
+                caches = registry._pyramid_zcml_response_caches = []
+    return caches
@@ -0,0 +1,291 @@
+import bisect
+import re
+import threading
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.exceptions import URLDecodeError
+from pyramid.interfaces import IRoutesMapper
+from pyramid.urldispatch import RoutesMapper
+
+_PATTERN_TYPE = type(re.compile(''))
+
+# inline flags which apply to a whole pattern, e.g. ``(?i)``; combined
+# with other patterns they would apply to those too
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+class CombinedRoutesMapper(RoutesMapper):
+    """ A routes mapper which matches the routes named in ``names`` by
+    looking up the path in a trie of the static prefixes of their
+    patterns and trying the regular expressions of the routes which may
+    match at once, as one alternation.  The first route whose pattern
+    and predicates match is found, exactly as by Pyramid's mapper; other
+    routes, and routes whose regular expression cannot be combined, are
+    tried one by one in their place in the list.  The trie is rebuilt on
+    the first request after a route is connected."""
+    def __init__(self, names=None):
+        RoutesMapper.__init__(self)
+        self._setup(names)
+
+    def _setup(self, names):
+        if names is None:
+            names = set()
+        self.names = names
+        self.trie = None
+
+    def connect(self, *arg, **kw):
+        self.trie = None
+        return RoutesMapper.connect(self, *arg, **kw)
+
+    def compile(self):
+        """ Build the trie of the routes, and return it."""
+        trie = self.trie = RouteTrie(self.routelist, self.names)
+        return trie
+
+    def __call__(self, request):
+        try:
+            # empty if mounted under a path in mod_wsgi, for example
+            path = request.path_info or '/'
+        except KeyError:
+            path = '/'
+        except UnicodeDecodeError as e:
+            raise URLDecodeError(
+                e.encoding, e.object, e.start, e.end, e.reason)
+        trie = self.trie
+        if trie is None:
+            trie = self.compile()
+        return trie(path, request)
+
+class _Node(object):
+    def __init__(self, parent=None):
+        self.children = {}
+        # (index, source, number of groups) of the routes whose static
+        # prefix ends at this node
+        self.own = []
+        self.parent = parent
+        # the routes of this node and its ancestors, in order
+        self.entries = None
+        # start index: (match function or None, route index of each group)
+        self.regexes = {}
+
+    def regex(self, start):
+        regex = self.regexes.get(start)
+        if regex is None:
+            parts = []
+            groups = [None]
+            for index, source, count in self.entries:
+                if index < start:
+                    continue
+                parts.append('(' + source + ')')
+                groups.extend([index] * (count + 1))
+            match = None
+            if parts:
+                match = re.compile('|'.join(parts)).match
+            regex = self.regexes[start] = (match, groups)
+        return regex
+
+class RouteTrie(object):
+    """ The routes of ``routes`` named in ``names``, arranged by the
+    complete path segments their patterns start with."""
+    def __init__(self, routes, names):
+        self.routes = list(routes)
+        self.root = _Node()
+        # indexes of the routes tried one by one
+        self.linear = []
+        nodes = [self.root]
+        for index, route in enumerate(self.routes):
+            combinable = None
+            if route.name in names:
+                combinable = _combinable(_route_source(route))
+            if combinable is None:
+                self.linear.append(index)
+                continue
+            source, count = combinable
+            node = self.root
+            for segment in _static_segments(source):
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _Node(node)
+                    nodes.append(child)
+                node = child
+            node.own.append((index, source, count))
+        # parents come before their children in nodes
+        for node in nodes:
+            if node.parent is None:
+                node.entries = node.own
+            else:
+                node.entries = sorted(node.parent.entries + node.own)
+
+    def __call__(self, path, request):
+        node = self.root
+        if path.endswith('\n'):
+            # matched by "$" as if it was not there
+            segments = path[:-1].split('/')[1:]
+        else:
+            segments = path.split('/')[1:]
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+        routes = self.routes
+        linear = self.linear
+        start = 0
+        while True:
+            match, groups = node.regex(start)
+            m = match(path) if match is not None else None
+            end = groups[m.lastindex] if m is not None else len(routes)
+            for index in linear[bisect.bisect_left(linear, start):]:
+                if index >= end:
+                    break
+                info = _match(routes[index], path, request)
+                if info is not None:
+                    return info
+            if m is None:
+                return {'route': None, 'match': None}
+            info = _match(routes[end], path, request)
+            if info is not None:
+                return info
+            start = end + 1
+
+def _match(route, path, request):
+    # what RoutesMapper.__call__ does for each route
+    match = route.match(path)
+    if match is None:
+        return None
+    preds = route.predicates
+    info = {'match': match, 'route': route}
+    if preds and not all(p(info, request) for p in preds):
+        return None
+    return info
+
+def _route_source(route):
+    # the regular expression Pyramid compiled for the pattern of route,
+    # found in the closure of its match function
+    for cell in getattr(route.match, '__closure__', None) or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        pattern = getattr(value, '__self__', None)
+        if isinstance(pattern, _PATTERN_TYPE):
+            if isinstance(pattern.pattern, str):
+                return pattern.pattern
+    return None
+
+def _combinable(source):
+    # (source without group names, number of capturing groups), or None
+    # if the regular expression source cannot be combined with others
+    if source is None:
+        return None
+    out = []
+    groups = 0
+    in_class = False
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c == '\\':
+            if source[i + 1:i + 2].isdigit():
+                # a back reference would refer to another group
+                return None
+            out.append(source[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            if c == ']':
+                in_class = False
+            out.append(c)
+            i += 1
+            continue
+        if c == '[':
+            in_class = True
+            j = i + 1
+            if source[j:j + 1] == '^':
+                j += 1
+            if source[j:j + 1] == ']':
+                j += 1
+            out.append(source[i:j])
+            i = j
+            continue
+        if c == '(':
+            if source.startswith('(?P<', i):
+                out.append('(?:')
+                i = source.index('>', i) + 1
+                continue
+            if source.startswith('(?P=', i) or source.startswith('(?(', i):
+                return None
+            if _GLOBAL_FLAGS.match(source, i):
+                return None
+            if not source.startswith('(?', i):
+                groups += 1
+        out.append(c)
+        i += 1
+    return ''.join(out), groups
+
+def _static_segments(source):
+    # the path segments every path matched by source starts with, each
+    # followed by a slash; or all the segments of the only path matched
+    # by source, if it has no parameters
+    chars = []
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c == '\\':
+            escaped = source[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                break
+            chars.append(escaped)
+            i += 2
+        elif c in '.^$*+?{}[]|()':
+            break
+        else:
+            chars.append(c)
+            i += 1
+        if source[i:i + 1] in ('*', '+', '?', '{'):
+            # a quantified character is not static
+            chars.pop()
+            break
+    prefix = ''.join(chars)
+    if not prefix.startswith('/'):
+        return []
+    if i == n - 1 and source[i] == '$':
+        return prefix.split('/')[1:]
+    return prefix.split('/')[1:-1]
+
+_lock = threading.Lock()
+
+def zcml_route_names(registry):
+    """ Return the set of the names of the routes added to ``registry`` by
+    ``route`` directives."""
+    names = getattr(registry, '_pyramid_zcml_route_names', None)
+    if names is None:
+        with _lock:
+            names = getattr(registry, '_pyramid_zcml_route_names', None)
+            if names is None:
+                names = registry._pyramid_zcml_route_names = set()
+    return names
+
+def combined_routes_mapper(registry):
+    """ Return the :class:`CombinedRoutesMapper` of ``registry``, which
+    combines the routes added by ``route`` directives, making the routes
+    mapper of the registry one if necessary."""
+    mapper = registry.queryUtility(IRoutesMapper)
+    if isinstance(mapper, CombinedRoutesMapper):
+        return mapper
+    names = zcml_route_names(registry)
+    with _lock:
+        mapper = registry.queryUtility(IRoutesMapper)
+        if mapper is None:
+            mapper = CombinedRoutesMapper(names)
+            registry.registerUtility(mapper, IRoutesMapper)
+        elif type(mapper) is RoutesMapper:
+            # routes already added hold on to this very mapper, to connect
+            # themselves when the configuration is committed
+            mapper.__class__ = CombinedRoutesMapper
+            mapper._setup(names)
+        elif not isinstance(mapper, CombinedRoutesMapper):
+            raise ConfigurationError(
+                'Cannot combine the routes of the routes mapper %r' % (
+                    mapper,))
+    return mapper
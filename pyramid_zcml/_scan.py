@@ -0,0 +1,207 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pkgutil
+import sys
+import tempfile
+
+import venusian
+
+SCAN_CACHE_FORMAT = 1
+
+def _absolute(package_name, ignore):
+    # venusian resolves ignores with a leading dot against the package
+    # being scanned; make them absolute so they mean the same thing when
+    # modules of the package are scanned one by one
+    result = []
+    for name in ignore or ():
+        if isinstance(name, str) and name.startswith('.'):
+            name = package_name + name
+        result.append(name)
+    return result
+
+def _ignored(fullname, ignore):
+    # the way venusian matches ignores against dotted names
+    for name in ignore:
+        if isinstance(name, str):
+            if fullname.startswith(name):
+                return True
+        elif name(fullname):
+            return True
+    return False
+
+def _source_modules(package, ignore):
+    # the (dotted name, source file) of the package and of every module
+    # venusian would import while scanning it, in the same order, found
+    # without importing anything; None if the package has modules which
+    # are not plain source files (namespace packages, extension modules,
+    # sourceless bytecode), whose changes cannot be told from a stat
+    filename = getattr(package, '__file__', None)
+    if not filename or not filename.endswith('.py'):
+        return None
+    modules = [(package.__name__, filename)]
+    if hasattr(package, '__path__'):
+        if not _walk(package.__path__, package.__name__ + '.', ignore,
+                     modules):
+            return None
+    return modules
+
+def _walk(paths, prefix, ignore, modules):
+    seen = set()
+    for path in paths:
+        try:
+            filenames = sorted(os.listdir(path))
+        except OSError:
+            continue
+        for fn in filenames:
+            full = os.path.join(path, fn)
+            if os.path.isdir(full):
+                if '.' in fn or fn in seen or fn == '__pycache__':
+                    continue
+                init = os.path.join(full, '__init__.py')
+                if not os.path.isfile(init):
+                    if _has_module(full):
+                        return False
+                    continue
+                seen.add(fn)
+                name = prefix + fn
+                if _ignored(name, ignore):
+                    continue
+                modules.append((name, init))
+                if not _walk([full], name + '.', ignore, modules):
+                    return False
+                continue
+            modname = inspect.getmodulename(fn)
+            if modname is None or modname == '__init__' or modname in seen:
+                continue
+            if not fn.endswith('.py') or '.' in modname:
+                return False
+            seen.add(modname)
+            name = prefix + modname
+            if not _ignored(name, ignore):
+                modules.append((name, full))
+    return True
+
+def _has_module(path):
+    # whether a directory without an __init__.py holds modules, i.e. is a
+    # namespace package; bytecode in __pycache__ is not a module
+    for info in pkgutil.iter_modules([path]):
+        return True
+    return False
+
+def _stat(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def has_callbacks(module):
+    """ Return ``True`` if ``module`` defines objects decorated with
+    Venusian callbacks, i.e. whether a scan of it could find
+    anything."""
+    name = module.__name__
+    for attr, ob in list(vars(module).items()):
+        try:
+            categories = getattr(ob, venusian.ATTACH_ATTR)
+            if not categories.attached_to(name, attr, ob):
+                continue
+        except Exception:
+            continue
+        for callbacks in categories.values():
+            for callback, cb_mod_name, liftid, scope in callbacks:
+                if cb_mod_name == name:
+                    return True
+    return False
+
+class ScanCache(object):
+    """ An on-disk record of which modules of a scanned package define
+    decorated objects, keyed on the modification time and size of each
+    module's source file.  Modules recorded as defining none are neither
+    imported nor walked by later scans while their source is
+    unchanged."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _path(self, package_name, categories, ignore):
+        key = repr((SCAN_CACHE_FORMAT, package_name,
+                    sorted(categories) if categories is not None else None,
+                    sorted(ignore)))
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.scancache')
+
+    def load(self, package_name, categories, ignore):
+        """ Return the recorded ``{module name: [mtime, size, found]}``,
+        empty if there is no usable record."""
+        path = self._path(package_name, categories, ignore)
+        try:
+            with open(path) as f:
+                version, modules = json.load(f)
+        except Exception:
+            return {}
+        if version != SCAN_CACHE_FORMAT:
+            return {}
+        return modules
+
+    def store(self, package_name, categories, ignore, modules):
+        data = json.dumps([SCAN_CACHE_FORMAT, modules], sort_keys=True)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self._path(package_name, categories, ignore)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+def scan(config, package, categories=None, ignore=None, cache_dir=None):
+    """ Scan ``package`` with ``config`` like ``config.scan`` does.  With
+    a ``cache_dir``, only the modules which defined decorated objects the
+    last time they were scanned, or whose source has changed since, are
+    imported and scanned.  Returns the names of the modules scanned, or
+    ``None`` if the whole package was scanned at once."""
+    kw = {}
+    if categories is not None:
+        kw['categories'] = categories
+    if ignore:
+        kw['ignore'] = ignore
+    modules = None
+    if cache_dir:
+        ignore = _absolute(package.__name__, ignore)
+        modules = _source_modules(package, ignore)
+        if modules is not None and ignore:
+            kw['ignore'] = ignore
+    if modules is None:
+        config.scan(package, **kw)
+        return None
+
+    cache = ScanCache(cache_dir)
+    recorded = cache.load(package.__name__, categories, ignore)
+    current = {}
+    scanned = []
+    for name, filename in modules:
+        stat = _stat(filename)
+        entry = recorded.get(name)
+        if entry is not None and entry[:2] == stat and not entry[2]:
+            current[name] = entry
+            continue
+        module = sys.modules.get(name)
+        if module is None:
+            module = importlib.import_module(name)
+        module_kw = kw
+        if hasattr(module, '__path__'):
+            # scanning a package walks its submodules too, which are
+            # scanned on their own here
+            prefix = name + '.'
+            children = set([n for n, f in modules if n.startswith(prefix)
+                            and '.' not in n[len(prefix):]])
+            module_kw = dict(kw)
+            module_kw['ignore'] = list(ignore) + [children.__contains__]
+        config.scan(module, **module_kw)
+        scanned.append(name)
+        current[name] = stat + [has_callbacks(module)]
+    if current != recorded:
+        cache.store(package.__name__, categories, ignore, current)
+    return scanned
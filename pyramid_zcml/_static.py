@@ -0,0 +1,317 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import time
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.path import AssetResolver
+from pyramid.response import Response
+from pyramid.static import static_view
+
+try:
+    from pyramid.static import QueryStringCacheBuster
+except ImportError: # Pyramid < 1.6, which has no cache busters
+    QueryStringCacheBuster = object
+
+try:
+    import brotli
+except ImportError: # pragma: no cover
+    brotli = None
+
+# the max-age of responses to fingerprinted static URLs
+ONE_YEAR = 365 * 24 * 60 * 60
+
+# the content types worth compressing, besides text/*
+COMPRESSIBLE_TYPES = (
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'application/wasm',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+    )
+
+def asset_path(config, path):
+    """ Return the absolute filename of ``path``, an absolute path, an
+    :term:`asset specification` or a path relative to the package of
+    ``config``."""
+    return AssetResolver(config.package).resolve(path).abspath()
+
+def _file_hash(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _files(directory):
+    # (path relative to directory separated by slashes, filename)
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full = os.path.join(dirpath, filename)
+            relative = os.path.relpath(full, directory)
+            yield relative.replace(os.sep, '/'), full
+
+def build_static_manifest(directory):
+    """ Return a dictionary mapping the path of every file below
+    ``directory``, relative to it and separated by slashes, to a hash of
+    the file's content."""
+    manifest = {}
+    for relative, full in _files(directory):
+        manifest[relative] = _file_hash(full)
+    return manifest
+
+def load_static_manifest(directory, filename=None):
+    """ Return the manifest of ``directory``, as built by
+    :func:`build_static_manifest`.  ``filename``, if given, names a JSON
+    file recording the hash, size and modification time of every file:
+    the hashes of the files whose size and modification time are those
+    recorded are taken from it, the others are computed, and the file is
+    rewritten, if possible, when it is out of date."""
+    recorded = {}
+    if filename is not None:
+        try:
+            with open(filename) as f:
+                recorded = json.load(f)
+        except (IOError, ValueError):
+            pass
+        if not isinstance(recorded, dict):
+            recorded = {}
+    manifest = {}
+    entries = {}
+    for relative, full in _files(directory):
+        st = os.stat(full)
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = recorded.get(relative)
+        if isinstance(entry, list) and entry[1:] == stamp:
+            digest = entry[0]
+        else:
+            digest = _file_hash(full)
+        manifest[relative] = digest
+        entries[relative] = [digest] + stamp
+    if filename is not None and entries != recorded:
+        try:
+            with open(filename, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+        except (IOError, OSError):
+            pass
+    return manifest
+
+def _gzip(data):
+    out = io.BytesIO()
+    # a fixed mtime makes the output depend on the content only
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+# encoding: (file extension, compression function)
+ENCODERS = {'gzip': ('.gz', _gzip)}
+if brotli is not None: # pragma: no cover
+    ENCODERS['br'] = ('.br', brotli.compress)
+
+def supports_cache_busters():
+    """ Whether Pyramid can add cache busting tokens to static URLs, i.e.
+    whether Pyramid is 1.6 or later."""
+    return QueryStringCacheBuster is not object
+
+def supports_content_encodings():
+    """ Whether Pyramid's static view can serve precompressed variants of
+    files, i.e. whether Pyramid is 2.0 or later."""
+    return hasattr(static_view, 'find_best_match')
+
+def available_encodings():
+    """ The encodings :func:`precompress` can produce, best first."""
+    return [name for name in ('br', 'gzip') if name in ENCODERS]
+
+def _compressible(filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding is not None or content_type is None:
+        return False
+    return (content_type.startswith('text/') or
+            content_type in COMPRESSIBLE_TYPES)
+
+def precompress(directory, encodings=None, min_size=256):
+    """ Write compressed variants of the compressible files below
+    ``directory`` which are at least ``min_size`` bytes long next to them,
+    e.g. ``app.css.gz`` for ``app.css`` and the ``gzip`` encoding.
+    ``encodings`` defaults to :func:`available_encodings`.  Variants
+    newer than their file are kept, and variants which are not smaller
+    than their file are not written.  Returns the filenames written."""
+    if encodings is None:
+        encodings = available_encodings()
+    written = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            full = os.path.join(dirpath, filename)
+            if not _compressible(full):
+                continue
+            st = os.stat(full)
+            if st.st_size < min_size:
+                continue
+            data = None
+            for encoding in encodings:
+                if encoding not in ENCODERS:
+                    continue
+                extension, compress = ENCODERS[encoding]
+                target = full + extension
+                try:
+                    if os.stat(target).st_mtime >= st.st_mtime:
+                        continue
+                except OSError:
+                    pass
+                if data is None:
+                    with open(full, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                try:
+                    _write(target, compressed)
+                except (IOError, OSError):
+                    # e.g. a read-only installation: serve what exists
+                    continue
+                written.append(target)
+    return written
+
+def _write(filename, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, filename)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+class ContentHashCacheBuster(QueryStringCacheBuster):
+    """ A cache buster which adds the content hash of an asset, as found in
+    ``manifest`` (see :func:`build_static_manifest`), to its URL as the
+    ``param`` query parameter.  URLs of assets missing from the manifest
+    are left alone."""
+    def __init__(self, manifest, param='v'):
+        QueryStringCacheBuster.__init__(self, param)
+        self.manifest = manifest
+
+    def tokenize(self, request, subpath, kw):
+        return self.manifest.get(subpath)
+
+    def __call__(self, request, subpath, kw):
+        if subpath not in self.manifest:
+            return subpath, kw
+        return QueryStringCacheBuster.__call__(self, request, subpath, kw)
+
+class StaticView(object):
+    """ Wraps the view which serves a static directory.  Responses get an
+    ``ETag`` which differs between the encoded variants of a file.  With a
+    ``manifest``, responses to URLs carrying the current content hash of
+    the asset, as generated by a :class:`ContentHashCacheBuster` with the
+    same ``manifest`` and ``param``, may be cached for a year and are
+    marked ``immutable``.
+
+    With a ``memory_cache`` (an :class:`LRUCache` bounded by bytes), the
+    bodies of files no larger than ``max_file_size`` are kept in memory and
+    served without opening the file.  A cached file is checked for changes
+    of its modification time or size at most once every ``revalidate``
+    seconds."""
+    def __init__(self, view, manifest=None, param='v', memory_cache=None,
+                 max_file_size=65536, revalidate=5):
+        self.view = view
+        self.manifest = manifest
+        self.param = param
+        self.memory_cache = memory_cache
+        self.max_file_size = max_file_size
+        self.revalidate = revalidate
+
+    def __call__(self, context, request):
+        response = None
+        if self.memory_cache is not None:
+            response = self._from_memory(request)
+        if response is None:
+            response = self.view(context, request)
+        if response.etag is None and response.last_modified is not None:
+            response.etag = '%x-%x-%s' % (
+                int(response.last_modified.timestamp()),
+                response.content_length or 0,
+                response.content_encoding or 'identity')
+        if self.manifest is None:
+            return response
+        token = request.GET.get(self.param)
+        if (token is not None and
+                token == self.manifest.get('/'.join(request.subpath))):
+            response.cache_expires = ONE_YEAR
+            response.headers['Cache-Control'] += ', immutable'
+        return response
+
+    def _from_memory(self, request):
+        # the response the wrapped view would make, built from memory; or
+        # None if the file is too large to be kept there
+        view = self.view
+        resource_name = view.get_resource_name(request)
+        files = view.get_possible_files(resource_name)
+        path, encoding = view.find_best_match(request, files)
+        if path is None:
+            raise HTTPNotFound(request.url)
+        entry = self._entry(path)
+        if entry is None:
+            return None
+        body, mtime = entry[0], entry[1]
+        content_type, _ = mimetypes.guess_type(resource_name, strict=False)
+        response = Response(
+            conditional_response=True,
+            content_type=content_type or 'application/octet-stream',
+            content_encoding=encoding,
+            )
+        response.body = body
+        response.last_modified = mtime
+        if view.cache_max_age is not None:
+            response.cache_expires = view.cache_max_age
+        if len(files) > 1:
+            response.vary = ('Accept-Encoding',)
+        return response
+
+    def _entry(self, path):
+        # [body, mtime, size, time of the last check] of the file, fresh
+        # enough; read from the file if necessary
+        cache = self.memory_cache
+        now = time.monotonic()
+        entry = cache.get(path)
+        if entry is not None:
+            if now - entry[3] < self.revalidate:
+                return entry
+            try:
+                st = os.stat(path)
+            except OSError:
+                # gone: let the wrapped view deal with it
+                cache.pop(path)
+                return None
+            if (st.st_mtime, st.st_size) == (entry[1], entry[2]):
+                entry[3] = now
+                return entry
+            cache.pop(path)
+        st = os.stat(path)
+        if st.st_size > self.max_file_size:
+            return None
+        with open(path, 'rb') as f:
+            body = f.read()
+        entry = [body, st.st_mtime, len(body), now]
+        cache.set(path, entry, len(body))
+        return entry
+
+def add_static_view(config, name, path, wrap, **kw):
+    """ Call ``config.add_static_view`` with ``name``, ``path`` and ``kw``,
+    registering ``wrap(view)`` instead of the view Pyramid creates to
+    serve the directory."""
+    cls = config.__class__
+    static_config = cls.__new__(cls)
+    static_config.__dict__.update(config.__dict__)
+    def add_view(view=None, **view_kw):
+        return cls.add_view(static_config, view=wrap(view), **view_kw)
+    static_config.add_view = add_view
+    static_config.add_static_view(name, path, **kw)
@@ -0,0 +1,110 @@
+from zope.interface import implementedBy
+
+from pyramid.events import ApplicationCreated
+from pyramid.events import BeforeRender
+from pyramid.events import ContextFound
+from pyramid.events import NewRequest
+from pyramid.events import NewResponse
+from pyramid.interfaces import IRootFactory
+from pyramid.interfaces import IRoutesMapper
+from pyramid.interfaces import ITraverser
+from pyramid.interfaces import IView
+from pyramid.interfaces import IViewClassifier
+from pyramid.traversal import DefaultRootFactory
+
+try:
+    from pyramid.events import BeforeTraversal
+except ImportError: # Pyramid < 1.7
+    BeforeTraversal = None
+
+try:
+    from pyramid.view import _find_views
+except ImportError: # Pyramid < 1.6
+    def _find_views(registry, request_iface, context, name):
+        # the lookup the router of these versions makes
+        return registry.adapters.lookup(
+            (IViewClassifier, request_iface, context), IView, name=name)
+
+# the events Pyramid sends while handling a request or creating an app
+EVENT_CLASSES = tuple([cls for cls in (NewRequest, BeforeTraversal,
+                                       ContextFound, BeforeRender,
+                                       NewResponse, ApplicationCreated)
+                       if cls is not None])
+
+def _context_specs(registry):
+    # the specifications provided by the contexts the root factory and the
+    # route factories return, as far as they can be told without calling
+    # them: only factories which are classes
+    factories = [registry.queryUtility(IRootFactory,
+                                       default=DefaultRootFactory)]
+    mapper = registry.queryUtility(IRoutesMapper)
+    if mapper is not None:
+        factories.extend([route.factory for route in mapper.get_routes()])
+    specs = []
+    for factory in factories:
+        if isinstance(factory, type):
+            spec = implementedBy(factory)
+            if spec not in specs:
+                specs.append(spec)
+    return specs
+
+def warm_caches(registry):
+    """ Populate the lookup caches of ``registry`` for the views, adapters,
+    subscribers and utilities registered in it, so that the first requests
+    after startup do not pay for cache misses.  Call it after the
+    configuration has been committed and before the application serves
+    requests; in a preforking server, call it in the master process so the
+    warm caches are shared by the workers.  Returns a dictionary counting
+    the lookups made per kind of registration."""
+    adapters = registry.adapters
+    contexts = _context_specs(registry)
+    counts = {'views': 0, 'adapters': 0, 'subscribers': 0, 'utilities': 0}
+
+    views = set()
+    for reg in registry.registeredAdapters():
+        required = reg.required
+        if len(required) == 3 and required[0] is IViewClassifier:
+            # what a request for this view looks up: the registered context,
+            # or the context classes which provide it
+            for context in [required[2]] + contexts:
+                if context.isOrExtends(required[2]):
+                    views.add((required[1], context, reg.name))
+        else:
+            adapters.lookup(required, reg.provided, reg.name)
+            counts['adapters'] += 1
+    for request_iface, context, name in views:
+        _find_views(registry, request_iface, context, name)
+        counts['views'] += 1
+
+    for context in contexts:
+        adapters.lookup((context,), ITraverser)
+        counts['adapters'] += 1
+
+    subscriptions = set()
+    events = [implementedBy(cls) for cls in EVENT_CLASSES]
+    registrations = list(registry.registeredSubscriptionAdapters())
+    registrations.extend(registry.registeredHandlers())
+    for reg in registrations:
+        provided = getattr(reg, 'provided', None)
+        subscriptions.add((reg.required, provided))
+        if len(reg.required) == 1:
+            for event in events:
+                if event.isOrExtends(reg.required[0]):
+                    subscriptions.add(((event,), provided))
+    for required, provided in subscriptions:
+        adapters.subscriptions(required, provided)
+        counts['subscribers'] += 1
+
+    for reg in registry.registeredUtilities():
+        registry.utilities.lookup((), reg.provided, reg.name)
+        counts['utilities'] += 1
+
+    table = registry.__dict__.get('_pyramid_zcml_dispatch_table')
+    if table is not None:
+        table.compile()
+    return counts
+
+def warm_caches_subscriber(event):
+    """ An ``ApplicationCreated`` subscriber which calls
+    :func:`warm_caches` with the registry of the new application."""
+    warm_caches(event.app.registry)
@@ -0,0 +1,230 @@
+import argparse
+import os
+import pprint
+import sys
+import textwrap
+import types
+
+from pyramid.config import Configurator
+from pyramid.exceptions import ConfigurationError
+
+from zope.configuration.xmlconfig import ParserInfo
+
+from pyramid_zcml import LazyObject
+from pyramid_zcml import _record_zcml
+
+def main(argv=sys.argv, quiet=False):
+    command = PZCMLCompileCommand(argv, quiet)
+    return command.run()
+
+class PZCMLCompileCommand(object):
+    description = """\
+    Compile a ZCML file, and every file it includes, into a Python module.
+
+    The generated module has an 'includeme' function which adds the same
+    configuration to a Configurator as calling 'config.load_zcml(spec)'
+    would, without parsing any XML.  Use it via
+    'config.include("generated.module")'.  Discriminators, include paths
+    and thus conflict detection and 'includeOverrides' semantics are
+    preserved.
+
+    This command accepts one positional argument: 'spec' is the asset
+    specification (e.g. 'myapp:configure.zcml') or the filename of the ZCML
+    file to compile.  Example: 'pzcml-compile myapp:configure.zcml -o
+    myapp/compiled_zcml.py'
+    """
+    script_name = 'pzcml-compile'
+    stdout = sys.stdout
+
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        )
+
+    parser.add_argument(
+        'spec',
+        help='The asset specification or filename of the ZCML file.',
+        )
+
+    parser.add_argument(
+        '-o', '--output',
+        dest='output',
+        default=None,
+        help='The file to write the generated module to (default: stdout).',
+        )
+
+    parser.add_argument(
+        '-f', '--feature',
+        dest='features',
+        action='append',
+        default=[],
+        help='A ZCML feature to provide while compiling. May be repeated.',
+        )
+
+    parser.add_argument(
+        '-l', '--lazy-imports',
+        dest='lazy_imports',
+        action='store_true',
+        help=('Import views and factories when they are first used instead '
+              'of when the generated module is included.'),
+        )
+
+    def __init__(self, argv, quiet=False):
+        self.quiet = quiet
+        self.args = self.parser.parse_args(argv[1:])
+
+    def out(self, msg): # pragma: no cover
+        if not self.quiet:
+            print(msg)
+
+    def run(self):
+        spec = self.args.spec
+        if ':' not in spec and not os.path.isabs(spec):
+            spec = os.path.abspath(spec)
+        config = Configurator()
+        try:
+            template = _record_zcml(config, spec, self.args.features,
+                                    self.args.lazy_imports)
+            source = generate_module(template, spec, self.args.features)
+        except ConfigurationError as e:
+            self.out('%s: %s' % (self.script_name, e))
+            return 1
+        if self.args.output is None:
+            self.stdout.write(source)
+        else:
+            with open(self.args.output, 'w') as f:
+                f.write(source)
+        return 0
+
+HEADER = '''\
+# Generated by pzcml-compile from %(spec)r%(features)s.
+# Do not edit; regenerate this module whenever the ZCML changes.
+import os
+import sys
+
+from zope.configuration.xmlconfig import ParserInfo
+
+from pyramid_zcml import load_compiled_zcml
+
+%(imports)s
+
+def _info(file, line, column, eline, ecolumn):
+    info = ParserInfo(file, line, column)
+    info.end(eline, ecolumn)
+    return info
+
+def _path(package_name, path=None):
+    package = sys.modules[package_name]
+    here = os.path.dirname(os.path.abspath(package.__file__))
+    if path is None:
+        return here
+    return os.path.join(here, path)
+
+'''
+
+FOOTER = '''
+def includeme(config):
+    load_compiled_zcml(config, DIRECTIVES)
+'''
+
+class _Expr(object):
+    # a piece of source code which pprint renders verbatim
+    def __init__(self, source):
+        self.source = source
+
+    def __repr__(self):
+        return self.source
+
+def generate_module(template, spec, features=()):
+    """ Return the source of a Python module equivalent to the
+    :class:`pyramid_zcml._recording.ZCMLTemplate` ``template``."""
+    generator = _Generator(template)
+    directives = [generator.directive(record) for record in template.records]
+    if features:
+        features = ' with features %s' % ', '.join(sorted(features))
+    else:
+        features = ''
+    header = HEADER % dict(
+        spec=spec,
+        features=features,
+        imports='\n'.join(
+            ['import %s' % name for name in sorted(generator.imports)]),
+        )
+    body = 'DIRECTIVES = %s\n' % pprint.pformat(directives, width=79)
+    return header + body + FOOTER
+
+class _Generator(object):
+    def __init__(self, template):
+        self.imports = set()
+        self.package_dirs = []
+        for record in template.records:
+            name = record.package_name
+            if name is not None:
+                self.imports.add(name)
+                package = sys.modules[name]
+                here = os.path.dirname(os.path.abspath(package.__file__))
+                self.package_dirs.append((here, name))
+        # longest directory first so the innermost package wins
+        self.package_dirs = sorted(set(self.package_dirs), reverse=True)
+
+    def directive(self, record):
+        return (
+            self.reference(record.handler),
+            dict([(k, self.value(v)) for k, v in record.kw.items()]),
+            self.info(record.info),
+            record.package_name,
+            self.path(record.basepath),
+            tuple([self.path(path) for path in record.includepath]),
+            )
+
+    def info(self, info):
+        if not isinstance(info, ParserInfo):
+            return self.value(info)
+        return _Expr('_info(%r, %r, %r, %r, %r)' % (
+            self.path(info.file), info.line, info.column, info.eline,
+            info.ecolumn))
+
+    def path(self, path):
+        if not path:
+            return path
+        for here, name in self.package_dirs:
+            if path == here:
+                return _Expr('_path(%r)' % name)
+            if path.startswith(here + os.sep):
+                return _Expr('_path(%r, %r)' % (name, path[len(here)+1:]))
+        return path
+
+    def value(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return str(value)
+        if isinstance(value, (list, tuple)):
+            return type(value)([self.value(v) for v in value])
+        if isinstance(value, dict):
+            return dict([(k, self.value(v)) for k, v in value.items()])
+        return self.reference(value)
+
+    def reference(self, ob):
+        if isinstance(ob, LazyObject):
+            self.imports.add('pyramid_zcml')
+            return _Expr('pyramid_zcml.LazyObject(%r, %r, %r)' % (
+                ob._lazy_name, ob._lazy_package_name,
+                self.info(ob._lazy_info)))
+        if isinstance(ob, types.ModuleType):
+            self.imports.add(ob.__name__)
+            return _Expr(ob.__name__)
+        module_name = getattr(ob, '__module__', None)
+        qualname = getattr(ob, '__qualname__', None)
+        if qualname is None:
+            qualname = getattr(ob, '__name__', None)
+        if module_name and qualname and not module_name == '__main__':
+            target = sys.modules.get(module_name)
+            for name in qualname.split('.'):
+                target = getattr(target, name, None)
+            if target is ob:
+                self.imports.add(module_name)
+                return _Expr('%s.%s' % (module_name, qualname))
+        raise ConfigurationError(
+            'Cannot compile a reference to %r: it is not importable by name'
+            % (ob,))
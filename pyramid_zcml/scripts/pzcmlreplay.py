@@ -0,0 +1,375 @@
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import textwrap
+import time
+
+from pyramid.config import Configurator
+from pyramid.exceptions import ConfigurationError
+from pyramid.path import DottedNameResolver
+from pyramid.request import Request
+
+from pyramid_zcml import includeme
+
+def main(argv=sys.argv, quiet=False):
+    command = PZCMLReplayCommand(argv, quiet)
+    return command.run()
+
+class PZCMLReplayCommand(object):
+    description = """\
+    Replay requests against the application configured by a ZCML file, in
+    the same process, and report the throughput and the latency of the
+    requests matched by each route and handled by each view.
+
+    The time of each request is split into route matching ('route'), the
+    view itself ('view'), rendering its result ('render') and everything
+    else ('lookup': tweens, traversal, finding the view and evaluating its
+    predicates, security checks and view decorators).
+
+    This command accepts two positional arguments: 'spec' is the asset
+    specification (e.g. 'myapp:configure.zcml') or the filename of the ZCML
+    file configuring the application, and 'requests' are the files holding
+    the requests to replay ('-' reads standard input).  Each line of these
+    files is either an entry of an access log in the Common or Combined Log
+    Format, a URL optionally preceded by a request method ('POST /login'),
+    or a JSON object with 'url', 'method', 'headers' and 'body' keys.
+    Example: 'pzcml-replay myapp:configure.zcml access.log -n 5'
+    """
+    script_name = 'pzcml-replay'
+    stdout = sys.stdout
+    stdin = sys.stdin
+
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        )
+
+    parser.add_argument(
+        'spec',
+        help='The asset specification or filename of the ZCML file.',
+        )
+
+    parser.add_argument(
+        'requests',
+        nargs='+',
+        help='The files holding the requests to replay.',
+        )
+
+    parser.add_argument(
+        '-n', '--repeat',
+        dest='repeat',
+        type=int,
+        default=1,
+        help='How many times to replay the requests (default: 1).',
+        )
+
+    parser.add_argument(
+        '-w', '--warmup',
+        dest='warmup',
+        type=int,
+        default=0,
+        help=('How many of the requests to replay once before measuring '
+              '(default: 0).'),
+        )
+
+    parser.add_argument(
+        '-f', '--feature',
+        dest='features',
+        action='append',
+        default=[],
+        help='A ZCML feature to provide while loading. May be repeated.',
+        )
+
+    parser.add_argument(
+        '-s', '--setting',
+        dest='settings',
+        action='append',
+        default=[],
+        help='A "name=value" application setting. May be repeated.',
+        )
+
+    parser.add_argument(
+        '-r', '--root-factory',
+        dest='root_factory',
+        default=None,
+        help='The dotted name of the root factory of the application.',
+        )
+
+    def __init__(self, argv, quiet=False):
+        self.quiet = quiet
+        self.args = self.parser.parse_args(argv[1:])
+
+    def out(self, msg): # pragma: no cover
+        if not self.quiet:
+            print(msg)
+
+    def run(self):
+        args = self.args
+        spec = args.spec
+        if ':' not in spec and not os.path.isabs(spec):
+            spec = os.path.abspath(spec)
+        settings = {}
+        for setting in args.settings:
+            name, sep, value = setting.partition('=')
+            if not sep:
+                self.out('%s: bad setting %r, expected "name=value"' % (
+                    self.script_name, setting))
+                return 2
+            settings[name.strip()] = value.strip()
+        requests = []
+        for filename in args.requests:
+            if filename == '-':
+                requests.extend(parse_requests(self.stdin))
+            else:
+                with open(filename) as f:
+                    requests.extend(parse_requests(f))
+        if not requests:
+            self.out('%s: no requests to replay' % self.script_name)
+            return 1
+        root_factory = None
+        if args.root_factory:
+            root_factory = DottedNameResolver().resolve(args.root_factory)
+        try:
+            app = make_app(spec, settings, root_factory, args.features)
+        except ConfigurationError as e:
+            self.out('%s: %s' % (self.script_name, e))
+            return 1
+        replayer = Replayer(app)
+        for method, url, headers, body in requests[:args.warmup]:
+            replayer.replay(method, url, headers, body)
+        replayer.reset()
+        for i in range(args.repeat):
+            for method, url, headers, body in requests:
+                replayer.replay(method, url, headers, body)
+        self.stdout.write(replayer.report())
+        return 0
+
+# the key of the RequestTimings of a replayed request in its environ
+TIMINGS_KEY = 'pyramid_zcml.replay_timings'
+
+class RequestTimings(object):
+    """ The time spent by a replayed request in the routes mapper, in its
+    view and in its view and renderer, and the names of the route and the
+    view."""
+    def __init__(self):
+        self.route = self.view = self.rendered = 0.0
+        self.route_name = self.view_name = None
+
+def view_label(view, attr=None):
+    """ A name for the view callable ``view``, e.g. ``myapp.views.home`` or
+    ``myapp.views.Pets.list`` for the ``list`` ``attr`` of a class."""
+    name = getattr(view, '__qualname__', None)
+    if name is None:
+        name = getattr(view, '__name__', None)
+    if name is None:
+        # an instance
+        name = view.__class__.__name__
+    module = getattr(view, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    if attr:
+        name = '%s.%s' % (name, attr)
+    return name
+
+def view_timer(view, info):
+    """ A view deriver which adds the time spent in the view itself to the
+    :class:`RequestTimings` of replayed requests."""
+    label = view_label(info.original_view, info.options.get('attr'))
+    def timed_view(context, request):
+        timings = request.environ.get(TIMINGS_KEY)
+        if timings is None:
+            return view(context, request)
+        if timings.view_name is None:
+            timings.view_name = label
+        start = time.perf_counter()
+        try:
+            return view(context, request)
+        finally:
+            timings.view += time.perf_counter() - start
+    return timed_view
+
+def render_timer(view, info):
+    """ A view deriver which adds the time spent in the view and its
+    renderer to the :class:`RequestTimings` of replayed requests."""
+    def timed_view(context, request):
+        timings = request.environ.get(TIMINGS_KEY)
+        if timings is None:
+            return view(context, request)
+        start = time.perf_counter()
+        try:
+            return view(context, request)
+        finally:
+            timings.rendered += time.perf_counter() - start
+    return timed_view
+
+def make_app(spec, settings=None, root_factory=None, features=()):
+    """ Return the application configured by the ZCML file ``spec``, the
+    way :func:`pyramid_zcml.make_app` does, with view derivers timing the
+    views and renderers of replayed requests."""
+    config = Configurator(settings=settings, root_factory=root_factory,
+                          autocommit=True)
+    config.include(includeme)
+    config.add_view_deriver(render_timer, under='decorated_view',
+                            over='rendered_view')
+    config.add_view_deriver(view_timer, under='rendered_view',
+                            over='mapped_view')
+    config.begin()
+    try:
+        config.load_zcml(spec, features=features)
+    finally:
+        config.end()
+    return config.make_wsgi_app()
+
+# host ident user [time] "request line" status size ["referer" "agent"]
+_LOG_LINE = re.compile(
+    r'^\S+ \S+ \S+ \[[^\]]*\] "(\S+) (\S+)[^"]*" \d{3} \S+'
+    r'(?: "((?:[^"\\]|\\.)*)" "((?:[^"\\]|\\.)*)")?')
+
+def parse_requests(lines):
+    """ Return a ``(method, url, headers, body)`` tuple for each request
+    found in ``lines``.  Blank lines, comments (starting with ``#``) and
+    lines which are not requests are skipped."""
+    requests = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(data, dict) or 'url' not in data:
+                continue
+            body = data.get('body')
+            if body is not None and not isinstance(body, bytes):
+                body = body.encode('utf-8')
+            requests.append((data.get('method', 'GET').upper(), data['url'],
+                             dict(data.get('headers') or {}), body))
+            continue
+        match = _LOG_LINE.match(line)
+        if match is not None:
+            method, url, referer, agent = match.groups()
+            headers = {}
+            if referer and referer != '-':
+                headers['Referer'] = referer
+            if agent and agent != '-':
+                headers['User-Agent'] = agent
+            requests.append((method.upper(), url, headers, None))
+            continue
+        parts = line.split()
+        if len(parts) == 1:
+            requests.append(('GET', parts[0], {}, None))
+        elif len(parts) == 2 and parts[0].isalpha():
+            requests.append((parts[0].upper(), parts[1], {}, None))
+    return requests
+
+def percentile(values, fraction):
+    """ The nearest-rank ``fraction`` percentile of the sorted ``values``."""
+    if not values:
+        return 0.0
+    index = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[index]
+
+class _Group(object):
+    def __init__(self):
+        self.totals = []
+        self.route = self.lookup = self.view = self.render = 0.0
+
+    def add(self, total, timings):
+        self.totals.append(total)
+        self.route += timings.route
+        self.view += timings.view
+        self.render += timings.rendered - timings.view
+        self.lookup += total - timings.route - timings.rendered
+
+class Replayer(object):
+    """ Replays requests against ``app``, a Pyramid router made by
+    :func:`make_app`, and collects their timings by route and by view."""
+    def __init__(self, app):
+        self.app = app
+        mapper = app.routes_mapper
+        if mapper is not None:
+            def timed_mapper(request):
+                timings = request.environ.get(TIMINGS_KEY)
+                if timings is None:
+                    return mapper(request)
+                start = time.perf_counter()
+                info = mapper(request)
+                timings.route += time.perf_counter() - start
+                if info['route'] is not None:
+                    timings.route_name = info['route'].name
+                return info
+            app.routes_mapper = timed_mapper
+        self.reset()
+
+    def reset(self):
+        """ Forget the requests replayed so far."""
+        self.routes = {}
+        self.views = {}
+        self.statuses = {}
+        self.elapsed = 0.0
+        self.count = 0
+
+    def replay(self, method, url, headers=None, body=None):
+        """ Make the request and record its timings; return the
+        response."""
+        request = Request.blank(url, method=method, headers=headers)
+        if body is not None:
+            request.body = body
+        timings = request.environ[TIMINGS_KEY] = RequestTimings()
+        start = time.perf_counter()
+        response = request.get_response(self.app)
+        app_iter = response.app_iter
+        for chunk in app_iter:
+            pass
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+        total = time.perf_counter() - start
+        for groups, name in ((self.routes, timings.route_name or '-'),
+                             (self.views, timings.view_name or '-')):
+            group = groups.get(name)
+            if group is None:
+                group = groups[name] = _Group()
+            group.add(total, timings)
+        status = response.status_int
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.elapsed += total
+        self.count += 1
+        return response
+
+    def report(self):
+        """ Return the throughput and latencies of the requests replayed
+        since the last :meth:`reset` as text."""
+        lines = []
+        throughput = self.count / self.elapsed if self.elapsed else 0.0
+        lines.append('%d requests in %.3fs: %.1f requests/s' % (
+            self.count, self.elapsed, throughput))
+        lines.append('status: %s' % ', '.join(
+            '%s x %d' % item for item in sorted(self.statuses.items())))
+        for title, groups in (('route', self.routes), ('view', self.views)):
+            width = max([len(title)] + [len(name) for name in groups])
+            lines.append('')
+            lines.append(
+                '%-*s %7s %9s %9s %9s %9s %9s %9s %9s' % (
+                    width, title, 'count', 'req/s', 'p50 ms', 'p99 ms',
+                    'route ms', 'lookup ms', 'view ms', 'render ms'))
+            for name, group in sorted(groups.items(),
+                                      key=lambda item: -sum(item[1].totals)):
+                totals = sorted(group.totals)
+                count = len(totals)
+                elapsed = sum(totals)
+                lines.append(
+                    '%-*s %7d %9.1f %9.3f %9.3f %9.3f %9.3f %9.3f %9.3f' % (
+                        width, name, count, count / elapsed if elapsed else 0.0,
+                        percentile(totals, 0.5) * 1e3,
+                        percentile(totals, 0.99) * 1e3,
+                        group.route / count * 1e3,
+                        group.lookup / count * 1e3,
+                        group.view / count * 1e3,
+                        group.render / count * 1e3))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,10 @@
+from zope.interface import Interface
+
+class IContext(Interface):
+    pass
+
+class IAdapted(Interface):
+    pass
+
+class IPool(Interface):
+    pass
@@ -0,0 +1,14 @@
+from zope.interface import implementer
+
+from pyramid_zcml.tests.lazyapp.interfaces import IPool
+
+created = []
+
+@implementer(IPool)
+class Pool(object):
+    # stands for something expensive to create, like a connection pool
+    def __init__(self):
+        created.append(self)
+
+    def connect(self):
+        return 'connection'
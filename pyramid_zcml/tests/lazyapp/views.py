@@ -0,0 +1,33 @@
+# only imported when one of its objects is first used
+from webob import Response
+
+from zope.interface import implementer
+
+from pyramid_zcml.tests.lazyapp.interfaces import IAdapted
+
+events = []
+
+class Root(object):
+    pass
+
+def root_factory(request):
+    return Root()
+
+def view(request):
+    """ """
+    return Response('lazy')
+
+class ClassView(object):
+    def __init__(self, request):
+        self.request = request
+
+    def hello(self):
+        return Response('hello %s' % self.request.context.__class__.__name__)
+
+@implementer(IAdapted)
+class Adapter(object):
+    def __init__(self, context):
+        self.context = context
+
+def handler(event):
+    events.append(event)
@@ -1,8 +1,10 @@
 import os
+import sys
 import unittest
 
 class IntegrationBase(unittest.TestCase):
     root_factory = None
+    load_options = {}
     def setUp(self):
         from pyramid_zcml import includeme
         from pyramid.config import Configurator
@@ -10,7 +12,7 @@ class IntegrationBase(unittest.TestCase):
         config.include('pyramid_mako')
         config.include(includeme)
         config.begin()
-        config.load_zcml(self.config)
+        config.load_zcml(self.config, **self.load_options)
         config.commit()
         app = config.make_wsgi_app()
         from webtest import TestApp
@@ -40,6 +42,64 @@ class TestFixtureApp(IntegrationBase):
     def test_protected(self):
         self.testapp.get('/protected.html', status=403)
 
+class TestLazyFixtureApp(TestFixtureApp):
+    load_options = {'lazy_imports': True}
+
+class TestLazyApp(IntegrationBase):
+    config = 'pyramid_zcml.tests.lazyapp:configure.zcml'
+    load_options = {'lazy_imports': True}
+    module = 'pyramid_zcml.tests.lazyapp.views'
+
+    def setUp(self):
+        _unimport(self.module)
+        IntegrationBase.setUp(self)
+
+    def tearDown(self):
+        IntegrationBase.tearDown(self)
+        _unimport(self.module)
+
+    def test_not_imported_until_used(self):
+        self.assertFalse(self.module in sys.modules)
+        res = self.testapp.get('/', status=200)
+        self.assertEqual(res.body, b'lazy')
+        self.assertTrue(self.module in sys.modules)
+
+    def test_route_factory_and_class_view(self):
+        res = self.testapp.get('/hello', status=200)
+        self.assertEqual(res.body, b'hello Root')
+
+    def test_subscriber(self):
+        self.testapp.get('/', status=200)
+        from pyramid_zcml.tests.lazyapp.views import events
+        self.assertEqual(len(events), 1)
+
+    def test_adapter(self):
+        from zope.interface import alsoProvides
+        from pyramid_zcml.tests.lazyapp.interfaces import IAdapted
+        from pyramid_zcml.tests.lazyapp.interfaces import IContext
+        ob = Dummy()
+        alsoProvides(ob, IContext)
+        adapted = self.config.registry.getAdapter(ob, IAdapted)
+        self.assertEqual(adapted.context, ob)
+
+    def test_validate_lazy_imports(self):
+        from pyramid_zcml import validate_lazy_imports
+        validate_lazy_imports(self.config.registry)
+        self.assertTrue(self.module in sys.modules)
+
+    def test_lazy_utility(self):
+        from pyramid_zcml.tests.lazyapp.interfaces import IPool
+        from pyramid_zcml.tests.lazyapp.pool import Pool
+        from pyramid_zcml.tests.lazyapp.pool import created
+        registry = self.config.registry
+        del created[:]
+        pool = registry.getUtility(IPool)
+        self.assertTrue(isinstance(pool, Pool))
+        self.assertEqual(created, [pool])
+        self.assertTrue(registry.queryUtility(IPool) is pool)
+        self.assertTrue(registry.utilities.lookup((), IPool) is pool)
+        self.assertEqual(created, [pool])
+
 class TestCCBug(IntegrationBase):
     # "unordered" as reported in IRC by author of
     # http://labs.creativecommons.org/2010/01/13/cc-engine-and-web-non-frameworks/
@@ -95,6 +155,121 @@ class TestHybridApp(IntegrationBase):
         res = self.testapp.get('/error_sub', status=200)
         self.assertEqual(res.body, b'supressed2')
 
+class TestCompiledHybridApp(TestHybridApp):
+    # the same application, configured from a module generated by
+    # pzcml-compile instead of from the ZCML itself
+    def setUp(self):
+        import tempfile
+        from pyramid.config import Configurator
+        from pyramid_zcml.scripts.pzcmlcompile import main
+        self.tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(self.tmpdir, 'compiled.py')
+        main(['pzcml-compile', self.config, '-o', filename], quiet=True)
+        config = Configurator()
+        config.include(_load_module('compiled', filename))
+        config.commit()
+        from webtest import TestApp
+        self.testapp = TestApp(config.make_wsgi_app())
+        self.config = config
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+class TestLazyHybridApp(TestHybridApp):
+    load_options = {'lazy_imports': True}
+
+class TestWarmCachesHybridApp(TestHybridApp):
+    load_options = {'warm_caches': True}
+
+    def test_caches_warm(self):
+        from pyramid.interfaces import IRequest
+        from pyramid.traversal import DefaultRootFactory
+        from zope.interface import implementedBy
+        cache = self.config.registry._view_lookup_cache
+        self.assertTrue(
+            (IRequest, implementedBy(DefaultRootFactory), 'global2') in cache)
+
+class TestCombinedRoutesHybridApp(TestHybridApp):
+    config = 'pyramid_zcml.tests.hybridapp:combined.zcml'
+
+    def test_mapper(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid_zcml import CombinedRoutesMapper
+        self.testapp.get('/abc', status=200)
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        self.assertTrue(isinstance(mapper, CombinedRoutesMapper))
+        self.assertEqual(mapper.trie.linear, [])
+
+class TestViewMetricsHybridApp(TestHybridApp):
+    config = 'pyramid_zcml.tests.hybridapp:metrics.zcml'
+
+    def test_metrics(self):
+        self.testapp.get('/abc', status=200)
+        self.testapp.get('/abc', status=200)
+        res = self.testapp.get('/metrics', status=200)
+        here = os.path.dirname(__file__)
+        source = os.path.join(here, 'hybridapp', 'configure.zcml')
+        self.assertTrue(
+            'pyramid_zcml_view_duration_seconds_count{source="%s:6",'
+            'view="pyramid_zcml.tests.hybridapp.views.route_view"} 2' % (
+                source,) in res.text)
+
+class TestInternedPredicatesHybridApp(TestHybridApp):
+    config = 'pyramid_zcml.tests.hybridapp:predicates.zcml'
+    load_options = {'intern_predicates': True}
+
+    def test_versions(self):
+        headers = {'X-Api-Version': '1'}
+        res = self.testapp.get('/version', headers=headers, status=200)
+        self.assertEqual(res.body, b'global')
+        headers = {'X-Api-Version': '2'}
+        res = self.testapp.get('/version', headers=headers, status=200)
+        self.assertEqual(res.body, b'global2')
+        self.testapp.get('/version', status=404)
+
+    def test_route(self):
+        headers = {'X-Api-Version': '1'}
+        res = self.testapp.get('/versioned', headers=headers, status=200)
+        self.assertEqual(res.body, b'route2')
+        self.testapp.get('/versioned', status=404)
+
+    def test_shared(self):
+        from pyramid_zcml import SharedPredicate
+        introspector = self.config.registry.introspector
+        route = introspector.get('routes', 'versioned')['object']
+        predicates = [intr['introspectable']['predicates'] for intr in
+                      introspector.get_category('views')
+                      if intr['introspectable']['name'] == 'version' or
+                      intr['introspectable']['route_name'] == 'versioned']
+        self.assertEqual(len(predicates), 3)
+        self.assertTrue(isinstance(route.predicates[0], SharedPredicate))
+        self.assertTrue(predicates[2][0] is route.predicates[0])
+        self.assertTrue(predicates[0][0] is route.predicates[0])
+        self.assertFalse(predicates[1][0] is route.predicates[0])
+
+class TestCompiledLazyApp(TestLazyApp):
+    def setUp(self):
+        import tempfile
+        from pyramid.config import Configurator
+        from pyramid_zcml.scripts.pzcmlcompile import main
+        _unimport(self.module)
+        self.tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(self.tmpdir, 'compiled.py')
+        main(['pzcml-compile', self.config, '-l', '-o', filename],
+             quiet=True)
+        config = Configurator()
+        config.include(_load_module('compiled_lazy', filename))
+        config.commit()
+        from webtest import TestApp
+        self.testapp = TestApp(config.make_wsgi_app())
+        self.config = config
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        _unimport(self.module)
+
 class TestRestBugApp(IntegrationBase):
     # test bug reported by delijati 2010/2/3 (http://pastebin.com/d4cc15515)
     config = 'pyramid_zcml.tests.restbugapp:configure.zcml'
@@ -121,6 +296,22 @@ class TestViewDecoratorApp(IntegrationBase):
         res = self.testapp.get('/second', status=200)
         self.assertTrue(b'OK2' in res.body)
 
+class TestViewDecoratorAppScanCache(TestViewDecoratorApp):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.load_options = {'cache_dir': self.tmpdir}
+        # the first load fills the cache, the second one uses it
+        IntegrationBase.setUp(self)
+        IntegrationBase.tearDown(self)
+        del self.config
+        IntegrationBase.setUp(self)
+
+    def tearDown(self):
+        import shutil
+        IntegrationBase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
 class TestViewPermissionBug(IntegrationBase):
     # view_execution_permitted bug as reported by Shane at http://lists.repoze.org/pipermail/repoze-dev/2010-October/003603.html
     config = 'pyramid_zcml.tests.permbugapp:configure.zcml'
@@ -196,3 +387,38 @@ class TestIncludeOverrideApp(unittest.TestCase):
         config.include(includeme)
         config.load_zcml(self.config)
         self.assertRaises(ConfigurationConflictError, config.make_wsgi_app)
+
+    def test_compiled(self):
+        import shutil
+        import tempfile
+        from pyramid.exceptions import ConfigurationConflictError
+        from pyramid.config import Configurator
+        from pyramid_zcml.scripts.pzcmlcompile import main
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'compiled.py')
+            main(['pzcml-compile', self.config, '-o', filename], quiet=True)
+            config = Configurator()
+            config.include(_load_module('compiled', filename))
+            self.assertRaises(ConfigurationConflictError,
+                              config.make_wsgi_app)
+        finally:
+            shutil.rmtree(tmpdir)
+
+def _load_module(name, filename):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    # Configurator.include needs to find the module by name
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def _unimport(name):
+    sys.modules.pop(name, None)
+    package, attr = name.rsplit('.', 1)
+    if hasattr(sys.modules.get(package), attr):
+        delattr(sys.modules[package], attr)
+
+class Dummy(object):
+    pass
@@ -1,4 +1,5 @@
 import logging
+import os
 import sys
 
 logging.basicConfig()
@@ -115,6 +116,107 @@ class TestViewDirective(unittest.TestCase):
             (IViewClassifier, IRequest, IDummy), IView, name='')
         self.assertEqual(regview(None, None), 'OK')
 
+    def _registeredView(self, context, name=''):
+        from pyramid.interfaces import IView
+        from pyramid.interfaces import IViewClassifier
+        from pyramid.interfaces import IRequest
+        _execute_actions(extract_actions(context.actions))
+        return self.config.registry.adapters.lookup(
+            (IViewClassifier, IRequest, IDummy), IView, name=name)
+
+    def test_with_http_cache(self):
+        from pyramid.response import Response
+        context = DummyZCMLContext(self.config)
+        view = lambda *arg: Response('OK')
+        self._callFUT(context, 'repoze.view', IDummy, view=view,
+                      http_cache='3600, public')
+        response = self._registeredView(context)(None, DummyRequest())
+        self.assertEqual(response.headers['Cache-Control'],
+                         'max-age=3600, public')
+
+    def test_with_conditional_response(self):
+        from pyramid.request import Request
+        from pyramid.response import Response
+        context = DummyZCMLContext(self.config)
+        calls = []
+        def decorator(view):
+            def decorated(context, request):
+                calls.append(request)
+                return view(context, request)
+            return decorated
+        view = lambda *arg: Response('OK')
+        self._callFUT(context, 'repoze.view', IDummy, view=view,
+                      decorator=decorator, conditional_response=True)
+        regview = self._registeredView(context)
+        response = regview(None, Request.blank('/'))
+        self.assertTrue(response.etag)
+        self.assertTrue(response.conditional_response)
+        request = Request.blank('/', if_none_match='"%s"' % response.etag)
+        response = request.get_response(
+            lambda environ, start_response: regview(None, request)(
+                environ, start_response))
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(len(calls), 2)
+
+    def test_with_conditional_response_post(self):
+        from pyramid.request import Request
+        from pyramid.response import Response
+        context = DummyZCMLContext(self.config)
+        view = lambda *arg: Response('OK')
+        self._callFUT(context, 'repoze.view', IDummy, view=view,
+                      conditional_response=True)
+        response = self._registeredView(context)(
+            None, Request.blank('/', method='POST'))
+        self.assertEqual(response.etag, None)
+
+    def test_with_cache_ttl(self):
+        from pyramid.request import Request
+        from pyramid.response import Response
+        from pyramid_zcml import response_caches
+        context = DummyZCMLContext(self.config)
+        calls = []
+        def view(context, request):
+            calls.append(request)
+            return Response('OK %d' % len(calls))
+        self._callFUT(context, 'repoze.view', IDummy, view=view,
+                      name='catalog', cache_ttl=60, cache_key=['page'],
+                      conditional_response=True)
+        regview = self._registeredView(context, 'catalog')
+        response = regview(None, Request.blank('/?page=1'))
+        etag = response.etag
+        response = regview(None, Request.blank('/?page=1&other=2'))
+        self.assertEqual(response.body, b'OK 1')
+        self.assertEqual(response.etag, etag)
+        self.assertTrue(response.conditional_response)
+        response = regview(None, Request.blank('/?page=2'))
+        self.assertEqual(response.body, b'OK 2')
+        caches = response_caches(self.config.registry)
+        self.assertEqual([cache.label for cache in caches], [':catalog'])
+        self.assertEqual(caches[0].stats()['hits'], 1)
+
+class Test_parse_http_cache(unittest.TestCase):
+    def _callFUT(self, value):
+        from pyramid_zcml._http import parse_http_cache
+        return parse_http_cache(value)
+
+    def test_seconds(self):
+        self.assertEqual(self._callFUT('3600'), 3600)
+
+    def test_seconds_and_directives(self):
+        self.assertEqual(
+            self._callFUT('3600, public, must-revalidate'),
+            (3600, {'public': True, 'must_revalidate': True}))
+
+    def test_directives(self):
+        self.assertEqual(
+            self._callFUT('private, s-maxage=60, stale-if-error=foo'),
+            (None, {'private': True, 's_maxage': 60,
+                    'stale_if_error': 'foo'}))
+
+    def test_unknown_directive(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._callFUT, '60, forever')
+
 class TestNotFoundDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -540,6 +642,386 @@ class TestRouteDirective(unittest.TestCase):
         context = DummyZCMLContext(self.config)
         self.assertRaises(ConfigurationError, self._callFUT, context, 'name')
 
+    def test_with_view_http_cache_and_conditional_response(self):
+        from zope.interface import Interface
+        from pyramid.interfaces import IView
+        from pyramid.interfaces import IViewClassifier
+        from pyramid.interfaces import IRouteRequest
+        from pyramid.request import Request
+        from pyramid.response import Response
+        reg = self.config.registry
+        context = DummyZCMLContext(self.config)
+        view = lambda *arg: Response('OK')
+        self._callFUT(context, 'name', 'pattern', view=view,
+                      view_http_cache='60',
+                      view_conditional_response=True)
+        actions = extract_actions(context.actions)
+        _execute_actions(actions)
+        request_type = reg.getUtility(IRouteRequest, 'name')
+        wrapped = reg.adapters.lookup(
+            (IViewClassifier, request_type, Interface), IView, name='')
+        response = wrapped(None, Request.blank('/pattern'))
+        self.assertEqual(response.cache_control.max_age, 60)
+        self.assertTrue(response.etag)
+
+    def test_with_view_cache_ttl(self):
+        from zope.interface import Interface
+        from pyramid.interfaces import IView
+        from pyramid.interfaces import IViewClassifier
+        from pyramid.interfaces import IRouteRequest
+        from pyramid_zcml import response_caches
+        reg = self.config.registry
+        context = DummyZCMLContext(self.config)
+        view = lambda *arg: 'OK'
+        self._callFUT(context, 'name', 'pattern', view=view,
+                      view_cache_ttl=60, view_cache_size=10)
+        actions = extract_actions(context.actions)
+        _execute_actions(actions)
+        caches = response_caches(reg)
+        self.assertEqual(len(caches), 1)
+        self.assertEqual(caches[0].label, 'name:')
+        self.assertEqual(caches[0].cache.max_entries, 10)
+
+    def test_records_route_name(self):
+        from pyramid_zcml._routes import zcml_route_names
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'name', 'pattern')
+        self.assertEqual(zcml_route_names(self.config.registry),
+                         set(['name']))
+
+class TestCombinedRoutesDirective(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp(autocommit=False)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, context):
+        from pyramid_zcml import combinedroutes
+        return combinedroutes(context)
+
+    def test_before_routes(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid_zcml import CombinedRoutesMapper
+        from pyramid_zcml import route
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context)
+        route(context, 'name', '/a/{x}')
+        _execute_actions(extract_actions(context.actions))
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        self.assertTrue(isinstance(mapper, CombinedRoutesMapper))
+        self.assertEqual(mapper.names, set(['name']))
+        self.assertEqual(
+            mapper(DummyRequest({'PATH_INFO': '/a/1'}))['match'], {'x': '1'})
+
+    def test_after_routes(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid_zcml import CombinedRoutesMapper
+        from pyramid_zcml import route
+        context = DummyZCMLContext(self.config)
+        route(context, 'name', '/a/{x}')
+        self._callFUT(context)
+        _execute_actions(extract_actions(context.actions))
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        self.assertTrue(isinstance(mapper, CombinedRoutesMapper))
+        self.assertEqual(len(mapper.get_routes()), 1)
+        self.assertEqual(
+            mapper(DummyRequest({'PATH_INFO': '/a/1'}))['match'], {'x': '1'})
+
+    def test_custom_mapper(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid.urldispatch import RoutesMapper
+        class CustomMapper(RoutesMapper):
+            pass
+        self.config.registry.registerUtility(CustomMapper(), IRoutesMapper)
+        context = DummyZCMLContext(self.config)
+        self.assertRaises(ConfigurationError, self._callFUT, context)
+
+class TestCombinedRoutesMapper(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid.urldispatch import RoutesMapper
+        from pyramid_zcml import CombinedRoutesMapper
+        self.linear = RoutesMapper()
+        self.mapper = CombinedRoutesMapper()
+        return self.mapper
+
+    def _connect(self, name, pattern, predicates=()):
+        self.linear.connect(name, pattern, predicates=predicates)
+        self.mapper.connect(name, pattern, predicates=predicates)
+        self.mapper.names.add(name)
+
+    def _match(self, path, method='GET'):
+        request = DummyRequest({'PATH_INFO': path})
+        request.method = method
+        info = self.mapper(request)
+        expected = self.linear(request)
+        name = info['route'] and info['route'].name
+        self.assertEqual(name, expected['route'] and expected['route'].name)
+        self.assertEqual(info['match'], expected['match'])
+        return name, info['match']
+
+    def _post(self, info, request):
+        return request.method == 'POST'
+
+    def test_first_match(self):
+        self._makeOne()
+        self._connect('static', '/a/b')
+        self._connect('param', '/a/{x}')
+        self._connect('regex', '/a/{x:\\d+}/{y:(c|d)e}')
+        self._connect('star', '/a/*rest')
+        self._connect('root', '/{x}/b')
+        self.assertEqual(self._match('/a/b'), ('static', {}))
+        self.assertEqual(self._match('/a/c'), ('param', {'x': 'c'}))
+        self.assertEqual(self._match('/a/1/de'),
+                         ('regex', {'x': '1', 'y': 'de'}))
+        self.assertEqual(self._match('/a/b/c'),
+                         ('star', {'rest': ('b', 'c')}))
+        self.assertEqual(self._match('/c/b'), ('root', {'x': 'c'}))
+        self.assertEqual(self._match('/a/b\n'), ('static', {}))
+        self.assertEqual(self._match('/c/d'), (None, None))
+        self.assertEqual(self._match('/'), (None, None))
+
+    def test_predicates(self):
+        self._makeOne()
+        self._connect('post', '/a/{x}', predicates=(self._post,))
+        self._connect('other_post', '/a/1', predicates=(self._post,))
+        self._connect('get', '/a/1')
+        self.assertEqual(self._match('/a/1', 'POST'), ('post', {'x': '1'}))
+        self.assertEqual(self._match('/a/1', 'GET'), ('get', {}))
+        self.assertEqual(self._match('/a/2', 'GET'), (None, None))
+
+    def test_not_combined(self):
+        self._makeOne()
+        self._connect('a', '/a/{x}')
+        self.linear.connect('other', '/a/1')
+        self.mapper.connect('other', '/a/1')
+        self._connect('backref', '/a/{x:(b)\\2}')
+        self._connect('b', '/a/{y}/c')
+        self.assertEqual(self._match('/a/1'), ('a', {'x': '1'}))
+        self.assertEqual(self._match('/a/bb'), ('a', {'x': 'bb'}))
+        self.assertEqual(self._match('/a/bb/c'), ('b', {'y': 'bb'}))
+        self.assertEqual(self.mapper.trie.linear, [1, 2])
+        self.linear.routelist.insert(0, self.linear.routelist.pop(1))
+        self.mapper.routelist.insert(0, self.mapper.routelist.pop(1))
+        self.mapper.trie = None
+        self.assertEqual(self._match('/a/1'), ('other', {}))
+
+    def test_connect_rebuilds(self):
+        self._makeOne()
+        self._connect('a', '/a/{x}')
+        self.assertEqual(self._match('/a/1'), ('a', {'x': '1'}))
+        self._connect('a', '/b/{x}')
+        self.assertEqual(self.mapper.trie, None)
+        self.assertEqual(self._match('/a/1'), (None, None))
+        self.assertEqual(self._match('/b/1'), ('a', {'x': '1'}))
+
+    def test_no_path_info(self):
+        self._makeOne()
+        self._connect('root', '/')
+        self.assertEqual(self._match(''), ('root', {}))
+
+class Test_combined_routes_mapper(unittest.TestCase):
+    def _callFUT(self, registry):
+        from pyramid_zcml._routes import combined_routes_mapper
+        return combined_routes_mapper(registry)
+
+    def test_installed_once(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid.registry import Registry
+        from pyramid_zcml import CombinedRoutesMapper
+        registry = Registry()
+        mapper = self._callFUT(registry)
+        self.assertTrue(isinstance(mapper, CombinedRoutesMapper))
+        self.assertTrue(registry.getUtility(IRoutesMapper) is mapper)
+        self.assertTrue(self._callFUT(registry) is mapper)
+
+    def test_existing_mapper(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid.registry import Registry
+        from pyramid.urldispatch import RoutesMapper
+        from pyramid_zcml import CombinedRoutesMapper
+        registry = Registry()
+        existing = RoutesMapper()
+        existing.connect('a', '/a')
+        registry.registerUtility(existing, IRoutesMapper)
+        mapper = self._callFUT(registry)
+        self.assertTrue(mapper is existing)
+        self.assertTrue(isinstance(mapper, CombinedRoutesMapper))
+        self.assertEqual(len(mapper.get_routes()), 1)
+
+class TestViewMetricsDirective(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp(autocommit=False)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, context, **kw):
+        from pyramid_zcml import viewmetrics
+        return viewmetrics(context, **kw)
+
+    def test_it(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid_zcml import ViewMetrics
+        from pyramid_zcml import view_metrics
+        exported = []
+        def exporter(config, metrics):
+            exported.append(metrics)
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, buckets=['1', '0.5'], path='/metrics',
+                      exporter=exporter)
+        metrics = view_metrics(self.config.registry)
+        self.assertTrue(isinstance(metrics, ViewMetrics))
+        self.assertEqual(metrics.buckets, (0.5, 1.0))
+        self.assertEqual(exported, [metrics])
+        _execute_actions(extract_actions(context.actions))
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        self.assertEqual(mapper.get_route('pyramid_zcml.viewmetrics').pattern,
+                         '/metrics')
+
+    def test_bad_buckets(self):
+        from pyramid.exceptions import ConfigurationError
+        context = DummyZCMLContext(self.config)
+        self.assertRaises(ConfigurationError, self._callFUT, context,
+                          buckets=['fast'])
+
+    def test_without_view_derivers(self):
+        from pyramid.exceptions import ConfigurationError
+        context = DummyZCMLContext(self.config)
+        original = sys.modules['pyramid.viewderivers']
+        sys.modules['pyramid.viewderivers'] = None
+        try:
+            self.assertRaises(ConfigurationError, self._callFUT, context)
+        finally:
+            sys.modules['pyramid.viewderivers'] = original
+        self.assertFalse(
+            '_pyramid_zcml_view_metrics' in self.config.registry.__dict__)
+
+class TestViewMetrics(unittest.TestCase):
+    def _makeOne(self, buckets=(0.1, 1)):
+        from pyramid_zcml import ViewMetrics
+        return ViewMetrics(buckets)
+
+    def test_snapshot(self):
+        metrics = self._makeOne()
+        metrics.observe(('a.zcml:1', 'v'), 0.05)
+        metrics.observe(('a.zcml:1', 'v'), 0.1)
+        metrics.observe(('a.zcml:1', 'v'), 2)
+        data = metrics.snapshot()[('a.zcml:1', 'v')]
+        self.assertEqual(data['count'], 3)
+        self.assertAlmostEqual(data['sum'], 2.15)
+        self.assertEqual(data['buckets'],
+                         [(0.1, 2), (1, 2), (float('inf'), 3)])
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_prometheus_text(self):
+        metrics = self._makeOne()
+        metrics.observe(('a "b".zcml:1', 'v'), 0.5)
+        lines = metrics.prometheus_text().splitlines()
+        self.assertEqual(lines[1],
+                         '# TYPE pyramid_zcml_view_duration_seconds histogram')
+        labels = 'source="a \\"b\\".zcml:1",view="v"'
+        self.assertEqual(lines[2:], [
+            'pyramid_zcml_view_duration_seconds_bucket{%s,le="0.1"} 0' % labels,
+            'pyramid_zcml_view_duration_seconds_bucket{%s,le="1.0"} 1' % labels,
+            'pyramid_zcml_view_duration_seconds_bucket{%s,le="+Inf"} 1' % (
+                labels,),
+            'pyramid_zcml_view_duration_seconds_sum{%s} 0.5' % labels,
+            'pyramid_zcml_view_duration_seconds_count{%s} 1' % labels,
+            ])
+
+    def test_quantile(self):
+        from pyramid_zcml._metrics import quantile
+        metrics = self._makeOne()
+        for seconds in (0.05,) * 98 + (0.5, 5):
+            metrics.observe(('a', 'v'), seconds)
+        data = metrics.snapshot()[('a', 'v')]
+        self.assertEqual(quantile(data, 0.5), 0.1)
+        self.assertEqual(quantile(data, 0.99), 1)
+        self.assertEqual(quantile(data, 1), float('inf'))
+
+class TestLogExporter(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from pyramid_zcml import LogExporter
+        return LogExporter(**kw)
+
+    def test_dump(self):
+        from pyramid_zcml import ViewMetrics
+        metrics = ViewMetrics((0.1, 1))
+        metrics.observe(('a.zcml:1', 'v'), 0.05)
+        metrics.observe(('a.zcml:1', 'v'), 0.15)
+        exporter = self._makeOne(reset=True)
+        subscribed = []
+        config = Dummy()
+        config.add_subscriber = lambda *arg: subscribed.append(arg)
+        exporter(config, metrics)
+        self.assertEqual(subscribed[0][0], exporter.start)
+        messages = []
+        exporter.logger = DummyLogger(messages)
+        exporter.dump()
+        self.assertEqual(messages, [
+            'a.zcml:1 v: 2 requests, mean 100.0ms, p50 <= 100ms, '
+            'p99 <= 1000ms'])
+        self.assertEqual(metrics.snapshot(), {})
+
+class Test_view_metrics_tween_factory(unittest.TestCase):
+    def _callFUT(self, handler, registry):
+        from pyramid_zcml._metrics import view_metrics_tween_factory
+        return view_metrics_tween_factory(handler, registry)
+
+    def test_disabled(self):
+        handler = lambda request: 'response'
+        self.assertTrue(self._callFUT(handler, Dummy()) is handler)
+
+    def test_it(self):
+        from pyramid_zcml import ViewMetrics
+        from pyramid_zcml._metrics import SOURCE_KEY
+        registry = Dummy()
+        metrics = registry._pyramid_zcml_view_metrics = ViewMetrics()
+        def handler(request):
+            if request.path_info == '/error':
+                raise ValueError
+            request.environ[SOURCE_KEY] = ('a.zcml:1', 'v')
+            return 'response'
+        tween = self._callFUT(handler, registry)
+        self.assertEqual(tween(DummyRequest({'PATH_INFO': '/'})), 'response')
+        self.assertRaises(ValueError, tween,
+                          DummyRequest({'PATH_INFO': '/error'}))
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot[('a.zcml:1', 'v')]['count'], 1)
+        self.assertEqual(snapshot[('-', '-')]['count'], 1)
+
+class Test_source_actions(unittest.TestCase):
+    def test_it(self):
+        from pyramid_zcml._metrics import source_actions
+        from pyramid_zcml._metrics import view_source_deriver
+        from pyramid_zcml._metrics import SOURCE_KEY
+        from zope.configuration.xmlconfig import ParserInfo
+        info = ParserInfo('configure.zcml', 12, 2)
+        derived = []
+        def register(view):
+            derived.append(view_source_deriver(view, DummyDeriverInfo(view)))
+        actions = source_actions([
+            {'callable': register, 'info': info, 'args': (dummy_view,)},
+            {'callable': None, 'info': info},
+            {'callable': register, 'info': 'python'},
+            ])
+        self.assertEqual(actions[1:], [{'callable': None, 'info': info},
+                                       {'callable': register,
+                                        'info': 'python'}])
+        actions[0]['callable'](dummy_view)
+        register(dummy_view)
+        request = DummyRequest()
+        self.assertEqual(derived[0](None, request), 'OK')
+        self.assertEqual(request.environ[SOURCE_KEY],
+                         ('configure.zcml:12', __name__ + '.dummy_view'))
+        request = DummyRequest()
+        derived[1](None, request)
+        self.assertEqual(request.environ[SOURCE_KEY],
+                         ('-', __name__ + '.dummy_view'))
+
 class TestStaticDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -620,6 +1102,515 @@ class TestStaticDirective(unittest.TestCase):
         request = DummyRequest()
         self.assertRaises(Forbidden, view, None, request)
 
+    def _makeStatic(self):
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        static = os.path.join(tmpdir, 'static')
+        os.makedirs(os.path.join(static, 'css'))
+        with open(os.path.join(static, 'css', 'app.css'), 'w') as f:
+            f.write('body {}')
+        return tmpdir, static
+
+    def _makeApp(self, context):
+        from webtest import TestApp
+        _execute_actions(extract_actions(context.actions))
+        return TestApp(self.config.make_wsgi_app())
+
+    def test_it_with_cachebust(self):
+        from pyramid_zcml import build_static_manifest
+        tmpdir, static = self._makeStatic()
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'static', static, cachebust=True)
+        app = self._makeApp(context)
+        token = build_static_manifest(static)['css/app.css']
+        request = testing.DummyRequest()
+        request.registry = self.config.registry
+        self.assertEqual(
+            request.static_url(os.path.join(static, 'css', 'app.css')),
+            'http://example.com/static/css/app.css?v=%s' % token)
+        res = app.get('/static/css/app.css?v=%s' % token, status=200)
+        self.assertEqual(res.body, b'body {}')
+        self.assertEqual(res.headers['Cache-Control'],
+                         'max-age=31536000, immutable')
+        res = app.get('/static/css/app.css?v=old', status=200)
+        self.assertEqual(res.headers['Cache-Control'], 'max-age=3600')
+        res = app.get('/static/css/app.css', status=200)
+        self.assertEqual(res.headers['Cache-Control'], 'max-age=3600')
+
+    def test_it_with_manifest(self):
+        import json
+        tmpdir, static = self._makeStatic()
+        manifest = os.path.join(tmpdir, 'manifest.json')
+        st = os.stat(os.path.join(static, 'css', 'app.css'))
+        with open(manifest, 'w') as f:
+            json.dump({'css/app.css': ['prebuilt', st.st_size,
+                                       st.st_mtime_ns]}, f)
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'static', static, manifest=manifest)
+        app = self._makeApp(context)
+        res = app.get('/static/css/app.css?v=prebuilt', status=200)
+        self.assertEqual(res.headers['Cache-Control'],
+                         'max-age=31536000, immutable')
+
+    def _get(self, app, path, **headers):
+        # not through webtest, which decodes the content
+        from webob import Request
+        return Request.blank(path, headers=headers).get_response(app.app)
+
+    def test_it_with_precompress(self):
+        import gzip
+        tmpdir, static = self._makeStatic()
+        css = os.path.join(static, 'css', 'big.css')
+        with open(css, 'w') as f:
+            f.write('p { color: red }\n' * 100)
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'static', static, precompress=True,
+                      content_encodings=['gzip'])
+        self.assertTrue(os.path.exists(css + '.gz'))
+        self.assertFalse(os.path.exists(
+            os.path.join(static, 'css', 'app.css.gz')))
+        app = self._makeApp(context)
+        res = self._get(app, '/static/css/big.css',
+                        **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(res.body),
+                         b'p { color: red }\n' * 100)
+        gzipped = res.headers['ETag']
+        res = self._get(app, '/static/css/big.css')
+        self.assertEqual(res.status_int, 200)
+        self.assertFalse('Content-Encoding' in res.headers)
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(res.headers['ETag'], gzipped)
+        res = self._get(app, '/static/css/big.css',
+                        **{'Accept-Encoding': 'gzip',
+                           'If-None-Match': gzipped})
+        self.assertEqual(res.status_int, 304)
+
+    def test_it_with_content_encodings(self):
+        tmpdir, static = self._makeStatic()
+        with open(os.path.join(static, 'css', 'app.css.br'), 'wb') as f:
+            f.write(b'br')
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'static', static, content_encodings=['br'])
+        app = self._makeApp(context)
+        res = self._get(app, '/static/css/app.css',
+                        **{'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(res.body, b'br')
+        res = self._get(app, '/static/css/app.css')
+        self.assertEqual(res.body, b'body {}')
+
+    def test_content_encodings_unsupported(self):
+        import pyramid_zcml
+        from pyramid.exceptions import ConfigurationError
+        tmpdir, static = self._makeStatic()
+        context = DummyZCMLContext(self.config)
+        original = pyramid_zcml.supports_content_encodings
+        pyramid_zcml.supports_content_encodings = lambda: False
+        try:
+            self.assertRaises(ConfigurationError, self._callFUT, context,
+                              'static', static, content_encodings=['br'])
+            self.assertRaises(ConfigurationError, self._callFUT, context,
+                              'static', static, precompress=True)
+            self.assertRaises(ConfigurationError, self._callFUT, context,
+                              'static', static, memory_cache=1024)
+        finally:
+            pyramid_zcml.supports_content_encodings = original
+        self.assertEqual(context.actions, [])
+
+    def test_cachebust_unsupported(self):
+        import pyramid_zcml
+        from pyramid.exceptions import ConfigurationError
+        tmpdir, static = self._makeStatic()
+        context = DummyZCMLContext(self.config)
+        original = pyramid_zcml.supports_cache_busters
+        pyramid_zcml.supports_cache_busters = lambda: False
+        try:
+            self.assertRaises(ConfigurationError, self._callFUT, context,
+                              'static', static, cachebust=True)
+            self.assertRaises(ConfigurationError, self._callFUT, context,
+                              'static', static,
+                              manifest=os.path.join(tmpdir, 'manifest.json'))
+        finally:
+            pyramid_zcml.supports_cache_busters = original
+        self.assertEqual(context.actions, [])
+
+    def test_it_with_memory_cache(self):
+        tmpdir, static = self._makeStatic()
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, 'static', static, memory_cache=1024,
+                      memory_cache_revalidate=3600)
+        app = self._makeApp(context)
+        res = app.get('/static/css/app.css', status=200)
+        self.assertEqual(res.body, b'body {}')
+        self.assertEqual(res.headers['Cache-Control'], 'max-age=3600')
+        with open(os.path.join(static, 'css', 'app.css'), 'w') as f:
+            f.write('body { margin: 0 }')
+        res = app.get('/static/css/app.css', status=200)
+        self.assertEqual(res.body, b'body {}')
+
+class TestStaticView(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from pyramid.static import static_view
+        self.tmpdir = tempfile.mkdtemp()
+        self._write('app.css', b'body {}')
+        self._write('big.js', b'x' * 100)
+        self.view = static_view(self.tmpdir, use_subpath=True)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.tmpdir, name), 'wb') as f:
+            f.write(data)
+
+    def _makeOne(self, **kw):
+        from pyramid_zcml._lru import LRUCache
+        from pyramid_zcml._static import StaticView
+        self.cache = LRUCache(max_bytes=1024)
+        return StaticView(self.view, memory_cache=self.cache, **kw)
+
+    def _request(self, name):
+        from pyramid.request import Request
+        request = Request.blank('/static/' + name)
+        request.subpath = (name,)
+        return request
+
+    def test_memory_cache(self):
+        view = self._makeOne(revalidate=3600)
+        response = view(None, self._request('app.css'))
+        self.assertEqual(response.body, b'body {}')
+        self.assertEqual(response.content_type, 'text/css')
+        self.assertTrue(response.etag)
+        response = view(None, self._request('app.css'))
+        self.assertEqual(response.body, b'body {}')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['bytes'], 7)
+
+    def test_revalidate(self):
+        view = self._makeOne(revalidate=0)
+        view(None, self._request('app.css'))
+        self._write('app.css', b'body { margin: 0 }')
+        response = view(None, self._request('app.css'))
+        self.assertEqual(response.body, b'body { margin: 0 }')
+
+    def test_removed(self):
+        view = self._makeOne(revalidate=0)
+        view(None, self._request('app.css'))
+        os.remove(os.path.join(self.tmpdir, 'app.css'))
+        self.assertRaises(Exception, view, None, self._request('app.css'))
+        self.assertFalse(os.path.join(self.tmpdir, 'app.css') in self.cache)
+
+    def test_large_file(self):
+        view = self._makeOne(max_file_size=50)
+        response = view(None, self._request('big.js'))
+        self.assertEqual(b''.join(response.app_iter), b'x' * 100)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_not_found(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        view = self._makeOne()
+        self.assertRaises(HTTPNotFound, view, None, self._request('no.css'))
+
+class TestResponseCache(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from pyramid_zcml import ResponseCache
+        return ResponseCache(60, **kw)
+
+    def _request(self, path='/', method='GET', route=None, matchdict=None):
+        from pyramid.request import Request
+        request = Request.blank(path, method=method)
+        request.matched_route = route
+        request.matchdict = matchdict
+        return request
+
+    def _view(self, response_factory=None):
+        from pyramid.response import Response
+        calls = []
+        def view(context, request):
+            calls.append(request)
+            if response_factory is not None:
+                return response_factory()
+            return Response('OK %d' % len(calls))
+        return view, calls
+
+    def test_hit(self):
+        view, calls = self._view()
+        cache = self._makeOne()
+        cached = cache(view)
+        first = cached(None, self._request())
+        second = cached(None, self._request())
+        self.assertEqual(second.body, b'OK 1')
+        self.assertFalse(first is second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_key(self):
+        route = DummyRoute()
+        route.name = 'item'
+        cache = self._makeOne(params=['q'])
+        request = self._request('/a?q=1&x=2', route=route,
+                                matchdict={'id': '1'})
+        self.assertEqual(cache.key(request),
+                         ('item', (('id', '1'),), '', (('1',),)))
+        request = self._request('/a?x=2')
+        self.assertEqual(cache.key(request), (None, '/a', '', ((),)))
+
+    def test_post_not_cached(self):
+        view, calls = self._view()
+        cached = self._makeOne()(view)
+        cached(None, self._request(method='POST'))
+        cached(None, self._request(method='POST'))
+        self.assertEqual(len(calls), 2)
+
+    def test_uncacheable_responses(self):
+        from pyramid.response import Response
+        def private():
+            response = Response('OK')
+            response.cache_control.private = True
+            return response
+        def cookie():
+            response = Response('OK')
+            response.set_cookie('a', 'b')
+            return response
+        def error():
+            return Response('Oops', status=500)
+        def streamed():
+            return Response(app_iter=iter([b'OK']))
+        for factory in (private, cookie, error, streamed):
+            view, calls = self._view(factory)
+            cached = self._makeOne()(view)
+            cached(None, self._request())
+            cached(None, self._request())
+            self.assertEqual(len(calls), 2)
+
+    def test_vary(self):
+        from pyramid.response import Response
+        calls = []
+        def view(context, request):
+            calls.append(request)
+            response = Response('OK %s' % request.accept)
+            response.vary = ('Accept',)
+            return response
+        cached = self._makeOne()(view)
+        def request(accept):
+            request = self._request()
+            request.headers['Accept'] = accept
+            return request
+        self.assertEqual(cached(None, request('text/html')).body,
+                         b'OK text/html')
+        self.assertEqual(cached(None, request('application/json')).body,
+                         b'OK application/json')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cached(None, request('text/html')).body,
+                         b'OK text/html')
+        self.assertEqual(cached(None, request('application/json')).body,
+                         b'OK application/json')
+        self.assertEqual(len(calls), 2)
+
+    def test_vary_star_not_cached(self):
+        from pyramid.response import Response
+        def factory():
+            response = Response('OK')
+            response.vary = ('*',)
+            return response
+        view, calls = self._view(factory)
+        cached = self._makeOne()(view)
+        cached(None, self._request())
+        cached(None, self._request())
+        self.assertEqual(len(calls), 2)
+
+    def test_size(self):
+        view, calls = self._view()
+        cache = self._makeOne(size=1)
+        cached = cache(view)
+        cached(None, self._request('/a'))
+        cached(None, self._request('/b'))
+        cached(None, self._request('/a'))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+class TestLRUCache(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from pyramid_zcml import LRUCache
+        return LRUCache(**kw)
+
+    def test_max_entries(self):
+        cache = self._makeOne(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {
+            'entries': 2, 'bytes': 0, 'hits': 3, 'misses': 1,
+            'evictions': 1, 'expirations': 0})
+
+    def test_ttl(self):
+        cache = self._makeOne(ttl=0)
+        cache.set('a', 1, 3)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.stats()['expirations'], 1)
+        cache = self._makeOne(ttl=3600)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+    def test_max_bytes(self):
+        cache = self._makeOne(max_bytes=10)
+        cache.set('a', 'a', 6)
+        cache.set('b', 'b', 6)
+        self.assertFalse('a' in cache)
+        self.assertEqual(cache.size, 6)
+        cache.set('b', 'bb', 4)
+        self.assertEqual(cache.size, 4)
+        cache.set('c', 'c', 11)
+        self.assertFalse('c' in cache)
+
+    def test_pop_and_clear(self):
+        cache = self._makeOne()
+        cache.set('a', 1, 3)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.pop('a', 2), 2)
+        self.assertEqual(cache.size, 0)
+        cache.set('a', 1, 3)
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+class Test_precompress(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _callFUT(self, **kw):
+        from pyramid_zcml._static import precompress
+        return precompress(self.tmpdir, **kw)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def test_it(self):
+        import gzip
+        js = self._write('app.js', b'var a = 1;\n' * 100)
+        self._write('small.css', b'p {}')
+        self._write('image.png', b'\0' * 1000)
+        self.assertEqual(self._callFUT(encodings=['gzip']), [js + '.gz'])
+        with open(js + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'var a = 1;\n' * 100)
+        self.assertEqual(self._callFUT(encodings=['gzip']), [])
+
+    def test_stale_variant(self):
+        css = self._write('app.css', b'p { color: red }\n' * 100)
+        self._write('app.css.gz', b'stale')
+        os.utime(css + '.gz', (0, 0))
+        self.assertEqual(self._callFUT(encodings=['gzip']), [css + '.gz'])
+
+    def test_unknown_encoding(self):
+        self._write('app.css', b'p { color: red }\n' * 100)
+        self.assertEqual(self._callFUT(encodings=['compress']), [])
+
+    def test_incompressible(self):
+        self._write('app.css', os.urandom(1000))
+        self.assertEqual(self._callFUT(encodings=['gzip']), [])
+
+class Test_load_static_manifest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.static = os.path.join(self.tmpdir, 'static')
+        os.makedirs(os.path.join(self.static, 'img'))
+        for name, data in (('a.css', b'a'), ('img/b.png', b'b')):
+            with open(os.path.join(self.static, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _callFUT(self, directory, filename=None):
+        from pyramid_zcml._static import load_static_manifest
+        return load_static_manifest(directory, filename)
+
+    def test_build(self):
+        manifest = self._callFUT(self.static)
+        self.assertEqual(sorted(manifest), ['a.css', 'img/b.png'])
+        self.assertEqual(len(manifest['a.css']), 16)
+        self.assertNotEqual(manifest['a.css'], manifest['img/b.png'])
+
+    def test_written_and_loaded(self):
+        import json
+        filename = os.path.join(self.tmpdir, 'manifest.json')
+        manifest = self._callFUT(self.static, filename)
+        self.assertTrue(os.path.exists(filename))
+        # the hashes of unchanged files are read from the file
+        with open(filename) as f:
+            entries = json.load(f)
+        entries['a.css'][0] = 'recorded'
+        with open(filename, 'w') as f:
+            json.dump(entries, f)
+        loaded = self._callFUT(self.static, filename)
+        self.assertEqual(loaded['a.css'], 'recorded')
+        self.assertEqual(loaded['img/b.png'], manifest['img/b.png'])
+
+    def test_stale_entries_rehashed(self):
+        import json
+        filename = os.path.join(self.tmpdir, 'manifest.json')
+        manifest = self._callFUT(self.static, filename)
+        with open(os.path.join(self.static, 'a.css'), 'wb') as f:
+            f.write(b'changed')
+        with open(os.path.join(self.static, 'c.js'), 'wb') as f:
+            f.write(b'c')
+        os.unlink(os.path.join(self.static, 'img', 'b.png'))
+        changed = self._callFUT(self.static, filename)
+        self.assertEqual(sorted(changed), ['a.css', 'c.js'])
+        self.assertNotEqual(changed['a.css'], manifest['a.css'])
+        with open(filename) as f:
+            entries = json.load(f)
+        self.assertEqual(sorted(entries), ['a.css', 'c.js'])
+        self.assertEqual(entries['a.css'][0], changed['a.css'])
+
+    def test_hashes_without_stamps_rehashed(self):
+        import json
+        filename = os.path.join(self.tmpdir, 'manifest.json')
+        with open(filename, 'w') as f:
+            json.dump({'a.css': 'stale'}, f)
+        manifest = self._callFUT(self.static, filename)
+        self.assertNotEqual(manifest['a.css'], 'stale')
+
+    def test_unwritable(self):
+        filename = os.path.join(self.tmpdir, 'missing', 'manifest.json')
+        manifest = self._callFUT(self.static, filename)
+        self.assertEqual(sorted(manifest), ['a.css', 'img/b.png'])
+
+class TestContentHashCacheBuster(unittest.TestCase):
+    def _makeOne(self, manifest):
+        from pyramid_zcml import ContentHashCacheBuster
+        return ContentHashCacheBuster(manifest)
+
+    def test_in_manifest(self):
+        buster = self._makeOne({'a.css': 'abc'})
+        self.assertEqual(buster(None, 'a.css', {}),
+                         ('a.css', {'_query': {'v': 'abc'}}))
+
+    def test_not_in_manifest(self):
+        buster = self._makeOne({'a.css': 'abc'})
+        self.assertEqual(buster(None, 'b.css', {}), ('b.css', {}))
+
 class TestAssetDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -755,6 +1746,138 @@ class TestZCMLScanDirective(unittest.TestCase):
         self._callFUT(context, dummy_module)
         self.assertTrue(dummy_module.scanned)
 
+    def test_it_with_ignore_and_categories(self):
+        config = DummyScanConfig()
+        context = DummyZCMLContext(self.config)
+        context.config_class = lambda **kw: config
+        from pyramid_zcml import scan
+        scan(context, DummyModule, ignore=['.views'], categories=['other'])
+        self.assertEqual(config.scanned,
+                         [(DummyModule, {'ignore': ['.views'],
+                                         'categories': ['other']})])
+
+SCAN_PACKAGE = {
+    '__init__.py': (
+        'import venusian\n'
+        'found = []\n'
+        'def mark(ob):\n'
+        '    def callback(scanner, name, ob):\n'
+        '        found.append(name)\n'
+        '    venusian.attach(ob, callback, category="test")\n'
+        '    return ob\n'),
+    'plain.py': 'def plain(): pass\n',
+    'views.py': (
+        'from pzcmlscan import mark\n'
+        '@mark\n'
+        'def view(): pass\n'),
+    'ignored.py': (
+        'from pzcmlscan import mark\n'
+        '@mark\n'
+        'def ignored(): pass\n'),
+    'sub/__init__.py': '',
+    'sub/more.py': (
+        'from pzcmlscan import mark\n'
+        '@mark\n'
+        'def more(): pass\n'),
+    }
+
+class Test_scan(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        for name, source in SCAN_PACKAGE.items():
+            self._write(name, source)
+        # bytecode as written by imports, whatever PYTHONDONTWRITEBYTECODE
+        for name in ('__pycache__', 'sub/__pycache__', 'nocode/__pycache__'):
+            self._write('%s/orphan.%s.pyc' % (
+                name, sys.implementation.cache_tag), '')
+        sys.path.insert(0, self.tmpdir)
+        self.config = testing.setUp(autocommit=False)
+
+    def tearDown(self):
+        import shutil
+        testing.tearDown()
+        sys.path.remove(self.tmpdir)
+        for name in list(sys.modules):
+            if name.split('.')[0] == 'pzcmlscan':
+                del sys.modules[name]
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, source):
+        path = os.path.join(self.tmpdir, 'pzcmlscan', name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(source)
+
+    def _callFUT(self, **kw):
+        import pzcmlscan
+        from pyramid_zcml._scan import scan
+        return scan(self.config, pzcmlscan, **kw)
+
+    def _found(self):
+        import pzcmlscan
+        return sorted(pzcmlscan.found)
+
+    def test_without_cache_dir(self):
+        self.assertEqual(self._callFUT(categories=['test']), None)
+        self.assertEqual(self._found(), ['ignored', 'more', 'view'])
+
+    def test_ignore(self):
+        self._callFUT(categories=['test'], ignore=['.ignored'])
+        self.assertEqual(self._found(), ['more', 'view'])
+        self.assertFalse('pzcmlscan.ignored' in sys.modules)
+
+    def test_categories(self):
+        self._callFUT(categories=['other'])
+        self.assertEqual(self._found(), [])
+
+    def test_cache_dir(self):
+        scanned = self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self.assertEqual(scanned, [
+            'pzcmlscan', 'pzcmlscan.ignored', 'pzcmlscan.plain',
+            'pzcmlscan.sub', 'pzcmlscan.sub.more', 'pzcmlscan.views'])
+        self.assertEqual(self._found(), ['ignored', 'more', 'view'])
+        del sys.modules['pzcmlscan.plain']
+        scanned = self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self.assertEqual(scanned, [
+            'pzcmlscan.ignored', 'pzcmlscan.sub.more', 'pzcmlscan.views'])
+        self.assertEqual(self._found(), ['ignored', 'ignored', 'more',
+                                         'more', 'view', 'view'])
+        self.assertFalse('pzcmlscan.plain' in sys.modules)
+
+    def test_cache_dir_changed_module(self):
+        self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self._write('plain.py', 'def plain(): pass\n\n')
+        scanned = self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self.assertEqual(scanned, [
+            'pzcmlscan.ignored', 'pzcmlscan.plain', 'pzcmlscan.sub.more',
+            'pzcmlscan.views'])
+
+    def test_cache_dir_new_module(self):
+        self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self._write('added.py', 'def added(): pass\n')
+        scanned = self._callFUT(categories=['test'], cache_dir=self.cache_dir)
+        self.assertEqual(scanned, [
+            'pzcmlscan.added', 'pzcmlscan.ignored', 'pzcmlscan.sub.more',
+            'pzcmlscan.views'])
+
+    def test_cache_dir_with_ignore(self):
+        scanned = self._callFUT(categories=['test'], ignore=['.sub'],
+                                cache_dir=self.cache_dir)
+        self.assertEqual(scanned, [
+            'pzcmlscan', 'pzcmlscan.ignored', 'pzcmlscan.plain',
+            'pzcmlscan.views'])
+        self.assertEqual(self._found(), ['ignored', 'view'])
+
+    def test_cache_dir_namespace_package(self):
+        self._write('nsp/module.py', 'def module(): pass\n')
+        self.assertEqual(
+            self._callFUT(categories=['test'], cache_dir=self.cache_dir),
+            None)
+        self.assertEqual(self._found(), ['ignored', 'more', 'view'])
+
 class TestAdapterDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -931,6 +2054,286 @@ class TestSubscriberDirective(unittest.TestCase):
             ((IDummy,), u(''), factory)
             )
 
+    def test_register_async_handler(self):
+        from pyramid_zcml._async import AsyncHandler
+        context = DummyZCMLContext(self.config)
+        handler = DummyFactory()
+        self._callFUT(context, for_=(IDummy,), handler=handler, async_=True)
+        actions = extract_actions(context.actions)
+        subadapt = actions[0]
+        subadapt['callable'](*subadapt['args'], **subadapt['kw'])
+        registrations = self.config.registry._handler_registrations
+        registered = registrations[0][2]
+        self.assertTrue(isinstance(registered, AsyncHandler))
+        self.assertTrue(registered.handler is handler)
+        self.assertTrue(registered.registry is self.config.registry)
+        self.assertEqual(registered.executor, None)
+
+    def _load(self, attrs):
+        import tempfile
+        from pyramid.config import Configurator
+        from pyramid_zcml import load_zcml
+        fd, filename = tempfile.mkstemp(suffix='.zcml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(ASYNC_SUBSCRIBER_ZCML % attrs)
+        try:
+            config = Configurator()
+            config.add_directive('load_zcml', load_zcml, action_wrap=False)
+            config.load_zcml(filename)
+            config.commit()
+        finally:
+            os.unlink(filename)
+        return config.registry
+
+    def test_async_attribute_where_async_is_not_a_keyword(self):
+        # Python < 3.7: zope.configuration passes ``async`` on as is
+        from zope.configuration import config
+        from zope.configuration.exceptions import ConfigurationError
+        from pyramid_zcml._async import AsyncHandler
+        original = config.iskeyword
+        config.iskeyword = lambda name: name != 'async' and original(name)
+        try:
+            registry = self._load('async="true"')
+            handler = registry._handler_registrations[0][2]
+            self.assertTrue(isinstance(handler, AsyncHandler))
+            registry = self._load('async="false"')
+            handler = registry._handler_registrations[0][2]
+            self.assertFalse(isinstance(handler, AsyncHandler))
+            self.assertRaises(ConfigurationError, self._load, 'asynk="true"')
+        finally:
+            config.iskeyword = original
+
+    def test_async_attribute(self):
+        from zope.configuration.exceptions import ConfigurationError
+        from pyramid_zcml._async import AsyncHandler
+        registry = self._load('async="true"')
+        handler = registry._handler_registrations[0][2]
+        self.assertTrue(isinstance(handler, AsyncHandler))
+        self.assertRaises(ConfigurationError, self._load, 'asynk="true"')
+
+    def test_async_invalid_settings(self):
+        from pyramid.exceptions import ConfigurationError
+        context = DummyZCMLContext(self.config)
+        for name, value in [('pyramid_zcml.async_policy', 'dropp'),
+                            ('pyramid_zcml.async_workers', 'two'),
+                            ('pyramid_zcml.async_queue_size', '0'),
+                            ('pyramid_zcml.async_timeout', 'soon')]:
+            self.config.registry.settings = {name: value}
+            try:
+                self._callFUT(context, for_=(IDummy,),
+                              handler=DummyFactory(), async_=True)
+            except ConfigurationError as e:
+                self.assertTrue(name in str(e))
+            else: # pragma: no cover
+                raise AssertionError('not raised')
+        self.assertEqual(context.actions, [])
+        # an executor does not use the settings
+        self._callFUT(context, for_=(IDummy,), handler=DummyFactory(),
+                      executor=DummyExecutor())
+
+    def test_register_handler_with_executor(self):
+        context = DummyZCMLContext(self.config)
+        handler = DummyFactory()
+        executor = DummyExecutor()
+        self._callFUT(context, for_=(IDummy,), handler=handler,
+                      executor=executor)
+        actions = extract_actions(context.actions)
+        subadapt = actions[0]
+        subadapt['callable'](*subadapt['args'], **subadapt['kw'])
+        registrations = self.config.registry._handler_registrations
+        registered = registrations[0][2]
+        self.assertTrue(registered.executor is executor)
+        registered('event')
+        self.assertEqual(executor.submitted, [(handler, ('event',))])
+
+    def test_async_factory(self):
+        context = DummyZCMLContext(self.config)
+        self.assertRaises(TypeError, self._callFUT, context, for_=(IDummy,),
+                          factory=DummyFactory(), provides=IFactory,
+                          async_=True)
+
+class TestAsyncDispatcher(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from pyramid_zcml import AsyncDispatcher
+        dispatcher = AsyncDispatcher(**kw)
+        self.addCleanup(dispatcher.shutdown)
+        return dispatcher
+
+    def _blocked(self, dispatcher):
+        # occupy every thread of ``dispatcher`` until the returned event
+        # is set
+        import threading
+        release = threading.Event()
+        started = threading.Semaphore(0)
+        def block():
+            started.release()
+            release.wait(5)
+        self.addCleanup(release.set)
+        for i in range(dispatcher.workers):
+            dispatcher.submit(block)
+        for i in range(dispatcher.workers):
+            started.acquire()
+        return release
+
+    def test_bad_policy(self):
+        from pyramid_zcml import AsyncDispatcher
+        self.assertRaises(ValueError, AsyncDispatcher, policy='wait')
+
+    def test_submit(self):
+        dispatcher = self._makeOne()
+        called = []
+        self.assertTrue(dispatcher.submit(called.append, 'a'))
+        self.assertTrue(dispatcher.submit(lambda **kw: called.append(kw),
+                                          b=1))
+        dispatcher.shutdown()
+        self.assertEqual(sorted(called, key=repr), ['a', {'b': 1}])
+        stats = dispatcher.stats()
+        self.assertEqual(stats['submitted'], 2)
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertTrue(stats['workers'] <= 2)
+
+    def test_threads_started_lazily(self):
+        dispatcher = self._makeOne(workers=3)
+        self.assertEqual(dispatcher.stats()['workers'], 0)
+        dispatcher.submit(lambda: None)
+        self.assertEqual(dispatcher.stats()['workers'], 1)
+
+    def test_drop(self):
+        dispatcher = self._makeOne(workers=1, queue_size=2)
+        release = self._blocked(dispatcher)
+        called = []
+        results = [dispatcher.submit(called.append, i) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(dispatcher.queue_depth, 2)
+        self.assertEqual(dispatcher.stats()['dropped'], 2)
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(called, [0, 1])
+        self.assertEqual(dispatcher.stats()['max_depth'], 2)
+
+    def test_drop_oldest(self):
+        dispatcher = self._makeOne(workers=1, queue_size=2,
+                                   policy='drop_oldest')
+        release = self._blocked(dispatcher)
+        called = []
+        results = [dispatcher.submit(called.append, i) for i in range(4)]
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(dispatcher.stats()['dropped'], 2)
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(called, [2, 3])
+
+    def test_block_with_timeout(self):
+        dispatcher = self._makeOne(workers=1, queue_size=1, policy='block',
+                                   timeout=0.01)
+        release = self._blocked(dispatcher)
+        called = []
+        self.assertTrue(dispatcher.submit(called.append, 0))
+        self.assertFalse(dispatcher.submit(called.append, 1))
+        self.assertEqual(dispatcher.stats()['dropped'], 1)
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(called, [0])
+
+    def test_block_until_room(self):
+        import threading
+        dispatcher = self._makeOne(workers=1, queue_size=1, policy='block')
+        release = self._blocked(dispatcher)
+        called = []
+        dispatcher.submit(called.append, 0)
+        submitter = threading.Thread(target=dispatcher.submit,
+                                     args=(called.append, 1))
+        submitter.start()
+        submitter.join(0.05)
+        self.assertTrue(submitter.is_alive())
+        release.set()
+        submitter.join(5)
+        dispatcher.shutdown()
+        self.assertEqual(called, [0, 1])
+        self.assertEqual(dispatcher.stats()['dropped'], 0)
+
+    def test_failure_counted(self):
+        dispatcher = self._makeOne()
+        def fail():
+            raise ValueError('fail')
+        import logging
+        logger = logging.getLogger('pyramid_zcml')
+        logger.disabled = True
+        try:
+            dispatcher.submit(fail)
+            dispatcher.shutdown()
+        finally:
+            logger.disabled = False
+        stats = dispatcher.stats()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['completed'], 0)
+
+    def test_submit_after_shutdown(self):
+        dispatcher = self._makeOne()
+        dispatcher.shutdown()
+        self.assertRaises(RuntimeError, dispatcher.submit, lambda: None)
+
+    def test_reset_after_fork(self):
+        dispatcher = self._makeOne()
+        dispatcher.submit(lambda: None)
+        dispatcher._pid = -1 # as if this process were a forked child
+        called = []
+        dispatcher.submit(called.append, 1)
+        dispatcher.shutdown()
+        self.assertEqual(called, [1])
+        self.assertEqual(dispatcher.stats()['submitted'], 1)
+
+class Test_async_dispatcher(unittest.TestCase):
+    def _callFUT(self, registry):
+        from pyramid_zcml import async_dispatcher
+        return async_dispatcher(registry)
+
+    def test_defaults(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        dispatcher = self._callFUT(registry)
+        self.assertEqual(dispatcher.workers, 2)
+        self.assertEqual(dispatcher.queue_size, 1000)
+        self.assertEqual(dispatcher.policy, 'drop')
+        self.assertEqual(dispatcher.timeout, None)
+        self.assertTrue(self._callFUT(registry) is dispatcher)
+
+    def test_settings(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        registry.settings = {
+            'pyramid_zcml.async_workers': '4',
+            'pyramid_zcml.async_queue_size': '10',
+            'pyramid_zcml.async_policy': 'block',
+            'pyramid_zcml.async_timeout': '0.5',
+            }
+        dispatcher = self._callFUT(registry)
+        self.assertEqual(dispatcher.workers, 4)
+        self.assertEqual(dispatcher.queue_size, 10)
+        self.assertEqual(dispatcher.policy, 'block')
+        self.assertEqual(dispatcher.timeout, 0.5)
+
+    def test_invalid_settings(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        registry.settings = {'pyramid_zcml.async_policy': 'dropp'}
+        self.assertRaises(ValueError, self._callFUT, registry)
+        self.assertEqual(
+            getattr(registry, '_pyramid_zcml_dispatcher', None), None)
+
+    def test_handler_uses_dispatcher(self):
+        from pyramid.registry import Registry
+        from pyramid_zcml._async import AsyncHandler
+        registry = Registry()
+        called = []
+        handler = AsyncHandler(called.append, registry)
+        handler('event')
+        dispatcher = self._callFUT(registry)
+        dispatcher.shutdown()
+        self.assertEqual(called, ['event'])
+
 class TestUtilityDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -984,6 +2387,109 @@ class TestUtilityDirective(unittest.TestCase):
         self.assertEqual(utility['args'][:3], (component, IFactory, ''))
         self.assertEqual(utility['kw'], {})
 
+    def test_lazy(self):
+        from pyramid.registry import undefer
+        from pyramid_zcml._lazy import register_lazy_utility
+        context = DummyZCMLContext(self.config)
+        self._callFUT(context, factory=DummyFactory, lazy=True, name='n')
+        actions = extract_actions(context.actions)
+        self.assertEqual(len(actions), 1)
+        utility = actions[0]
+        discrim = undefer(utility['discriminator'])
+        self.assertEqual(discrim, ('utility', IFactory, 'n'))
+        self.assertTrue(utility['callable'] is register_lazy_utility)
+        self.assertEqual(utility['args'][:4],
+                         (self.config.registry, DummyFactory, IFactory, 'n'))
+
+    def test_lazy_without_factory(self):
+        context = DummyZCMLContext(self.config)
+        self.assertRaises(TypeError, self._callFUT, context,
+                          component=DummyFactory(), lazy=True)
+
+class TestLazyUtility(unittest.TestCase):
+    def setUp(self):
+        from pyramid.registry import Registry
+        self.registry = Registry()
+        self.created = []
+
+    def _factory(self):
+        utility = DummyFactory()
+        self.created.append(utility)
+        return utility
+
+    def _register(self, name=''):
+        from pyramid_zcml._lazy import register_lazy_utility
+        register_lazy_utility(self.registry, self._factory, IFactory, name,
+                              'info')
+
+    def test_not_created_until_looked_up(self):
+        from pyramid_zcml._lazy import LazyUtility
+        self._register()
+        self.assertEqual(self.created, [])
+        placeholder = self.registry.utilities.lookup((), IFactory)
+        self.assertTrue(isinstance(placeholder, LazyUtility))
+        utility = self.registry.queryUtility(IFactory)
+        self.assertEqual(self.created, [utility])
+        self.assertTrue(self.registry.utilities.lookup((), IFactory)
+                        is utility)
+        self.assertTrue(self.registry.getUtility(IFactory) is utility)
+        self.assertTrue(placeholder._lazy_resolve() is utility)
+        self.assertEqual(self.created, [utility])
+
+    def test_getUtility(self):
+        from zope.interface.interfaces import ComponentLookupError
+        self._register('name')
+        utility = self.registry.getUtility(IFactory, 'name')
+        self.assertEqual(self.created, [utility])
+        self.assertRaises(ComponentLookupError, self.registry.getUtility,
+                          IFactory)
+        self.assertEqual(self.registry.queryUtility(IFactory, default=1), 1)
+
+    def test_placeholder_used_directly(self):
+        self._register()
+        placeholder = list(self.registry.getAllUtilitiesRegisteredFor(
+            IFactory))[0]
+        self.assertEqual(placeholder(), None)
+        self.assertEqual(len(self.created), 1)
+        self.assertTrue(self.registry.queryUtility(IFactory)
+                        is self.created[0])
+        self.assertRaises(AttributeError, getattr, placeholder, '__foo__')
+
+    def test_replaced_meanwhile(self):
+        self._register()
+        placeholder = self.registry.utilities.lookup((), IFactory)
+        other = DummyFactory()
+        self.registry.registerUtility(other, IFactory)
+        utility = placeholder._lazy_resolve()
+        self.assertTrue(utility is self.created[0])
+        self.assertTrue(self.registry.queryUtility(IFactory) is other)
+
+    def test_created_once_across_threads(self):
+        import threading
+        import time
+        self._register()
+        def factory():
+            time.sleep(0.01)
+            return self._factory()
+        placeholder = self.registry.utilities.lookup((), IFactory)
+        placeholder._lazy_factory = factory
+        results = []
+        def lookup():
+            results.append(self.registry.getUtility(IFactory))
+        threads = [threading.Thread(target=lookup) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(results, self.created * 8)
+
+    def test_hooks_installed_once(self):
+        self._register('a')
+        query = self.registry.queryUtility
+        self._register('b')
+        self.assertTrue(self.registry.queryUtility is query)
+
 class TestTranslationDirDirective(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(autocommit=False)
@@ -1165,6 +2671,36 @@ class Test_load_zcml(unittest.TestCase):
         config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
         self.assertTrue(config.registry.queryUtility(IFixture)) # only in c.zcml
 
+    def test_load_zcml_bulk_registration(self):
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        config = self._makeOne()
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                         features=['feature1'], bulk_registration=True)
+        names = [getattr(action['callable'], '__name__', None)
+                 for action in config.action_state.actions]
+        self.assertTrue('flush' in names)
+        config.commit()
+        self.assertTrue(config.registry.queryUtility(IFixture))
+        self.assertTrue(
+            config.registry.queryUtility(IFixture, name='feature1'))
+
+    def test_load_zcml_bulk_registration_setting(self):
+        config = self._makeOne()
+        config.registry.settings = {'pyramid_zcml.bulk_registration': 'true'}
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                         features=['feature1'])
+        names = [getattr(action['callable'], '__name__', None)
+                 for action in config.action_state.actions]
+        self.assertTrue('flush' in names)
+
+    def test_load_zcml_without_bulk_registration(self):
+        config = self._makeOne()
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                         features=['feature1'])
+        names = [getattr(action['callable'], '__name__', None)
+                 for action in config.action_state.actions]
+        self.assertFalse('flush' in names)
+
     def test_load_zcml_fixtureapp_with_feature(self):
         from pyramid_zcml.tests.fixtureapp.models import IFixture
         config = self._makeOne(autocommit=True)
@@ -1205,6 +2741,1322 @@ class Test_load_zcml(unittest.TestCase):
         self.assertEqual(dummylock.acquired, True)
         self.assertEqual(dummylock.released, True)
 
+    def test_load_zcml_default_lock_is_per_registry(self):
+        config = self._makeOne(autocommit=True)
+        dummylock = DummyLock()
+        config.registry._pyramid_zcml_lock = dummylock
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        self.assertEqual(dummylock.acquired, True)
+        self.assertEqual(dummylock.released, True)
+
+class Test_registry_lock(unittest.TestCase):
+    def _callFUT(self, registry):
+        from pyramid_zcml import _registry_lock
+        return _registry_lock(registry)
+
+    def test_same_registry_same_lock(self):
+        registry = Dummy()
+        self.assertTrue(self._callFUT(registry) is self._callFUT(registry))
+
+    def test_different_registries_different_locks(self):
+        self.assertFalse(self._callFUT(Dummy()) is self._callFUT(Dummy()))
+
+    def test_reentrant(self):
+        lock = self._callFUT(Dummy())
+        with lock:
+            self.assertTrue(lock.acquire(False))
+            lock.release()
+
+class Test_load_zcml_cache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.zcml = os.path.join(self.tmpdir, 'configure.zcml')
+        self._writeZCML('one')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _writeZCML(self, name):
+        with open(self.zcml, 'w') as f:
+            f.write(CACHE_ZCML % name)
+
+    def _makeOne(self, settings=None):
+        from pyramid_zcml import load_zcml
+        from pyramid.config import Configurator
+        c = Configurator(autocommit=True, settings=settings)
+        c.add_directive('load_zcml', load_zcml, action_wrap=False)
+        return c
+
+    def test_creates_cache(self):
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        self.assertTrue(config.registry.queryUtility(IFixture, name='one'))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_uses_cache(self):
+        import pyramid_zcml
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        original = pyramid_zcml.include
+        def fail(*arg, **kw): # pragma: no cover
+            raise AssertionError('parsed')
+        pyramid_zcml.include = fail
+        try:
+            config = self._makeOne()
+            config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        finally:
+            pyramid_zcml.include = original
+        self.assertTrue(config.registry.queryUtility(IFixture, name='one'))
+
+    def test_cache_dir_from_settings(self):
+        config = self._makeOne({'pyramid_zcml.cache_dir':self.cache_dir})
+        config.load_zcml(self.zcml)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_invalidated_when_file_changes(self):
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        self._writeZCML('two')
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        self.assertEqual(config.registry.queryUtility(IFixture, name='one'),
+                         None)
+        self.assertTrue(config.registry.queryUtility(IFixture, name='two'))
+
+    def test_features_are_part_of_key(self):
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir,
+                         features=['feature1'])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_lazy_imports_part_of_key(self):
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir,
+                         lazy_imports=True)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_lazy_objects_cached(self):
+        from pyramid_zcml import LazyObject
+        from pyramid_zcml.tests.fixtureapp.views import fixture_view
+        spec = 'pyramid_zcml.tests.fixtureapp:configure.zcml'
+        for i in range(2):
+            config = self._makeOne()
+            config.load_zcml(spec, cache_dir=self.cache_dir,
+                             lazy_imports=True)
+        views = config.registry.introspector.get_category('views')
+        callables = [intr['introspectable']['callable'] for intr in views]
+        lazy = [ob for ob in callables if isinstance(ob, LazyObject)]
+        self.assertEqual(len(lazy), 6)
+        self.assertTrue(fixture_view in [ob._lazy_resolve() for ob in lazy])
+
+    def test_scan_cached(self):
+        from pyramid.interfaces import IAuthenticationPolicy
+        spec = 'pyramid_zcml.tests.defpermbugapp:configure.zcml'
+        config = self._makeOne()
+        config.load_zcml(spec, cache_dir=self.cache_dir)
+        self.assertEqual(len([fn for fn in os.listdir(self.cache_dir)
+                              if fn.endswith('.zcmlcache')]), 1)
+        import pyramid_zcml
+        original = pyramid_zcml.include
+        def fail(*arg, **kw): # pragma: no cover
+            raise AssertionError('parsed')
+        pyramid_zcml.include = fail
+        try:
+            config = self._makeOne()
+            config.load_zcml(spec, cache_dir=self.cache_dir)
+        finally:
+            pyramid_zcml.include = original
+        self.assertTrue(config.registry.queryUtility(IAuthenticationPolicy))
+        views = config.registry.introspector.get_category('views')
+        self.assertTrue(views)
+
+    def test_invalidated_when_glob_matches_new_file(self):
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        os.mkdir(os.path.join(self.tmpdir, 'parts'))
+        with open(self.zcml, 'w') as f:
+            f.write(GLOB_ZCML)
+        with open(os.path.join(self.tmpdir, 'parts', 'one.zcml'), 'w') as f:
+            f.write(CACHE_ZCML % 'one')
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        with open(os.path.join(self.tmpdir, 'parts', 'two.zcml'), 'w') as f:
+            f.write(CACHE_ZCML % 'two')
+        config = self._makeOne()
+        config.load_zcml(self.zcml, cache_dir=self.cache_dir)
+        self.assertTrue(config.registry.queryUtility(IFixture, name='one'))
+        self.assertTrue(config.registry.queryUtility(IFixture, name='two'))
+
+    def test_includeoverrides_conflicts_survive_cache(self):
+        from pyramid.exceptions import ConfigurationConflictError
+        spec = 'pyramid_zcml.tests.includeoverrideapp:configure.zcml'
+        for i in range(2):
+            config = self._makeOne()
+            config.autocommit = False
+            config.load_zcml(spec, cache_dir=self.cache_dir)
+            self.assertRaises(ConfigurationConflictError, config.commit)
+
+class Test_load_zcml_profiler(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.zcml = os.path.join(self.tmpdir, 'configure.zcml')
+        with open(self.zcml, 'w') as f:
+            f.write(CACHE_ZCML % 'one')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self):
+        from pyramid_zcml import load_zcml
+        from pyramid.config import Configurator
+        c = Configurator()
+        c.add_directive('load_zcml', load_zcml, action_wrap=False)
+        return c
+
+    def test_records_directive_timings(self):
+        from pyramid_zcml import ZCMLProfiler
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        profiler = ZCMLProfiler()
+        config = self._makeOne()
+        config.load_zcml(self.zcml, profiler=profiler)
+        config.commit()
+        self.assertTrue(config.registry.queryUtility(IFixture, name='one'))
+        utilities = [d for d in profiler.directives if d.name == 'utility']
+        self.assertEqual(len(utilities), 1)
+        timing = utilities[0]
+        self.assertEqual(timing.location, '%s:3' % self.zcml)
+        self.assertTrue(timing.imports > 0)
+        self.assertTrue(timing.handler > 0)
+        self.assertTrue(timing.commit > 0)
+        phases = set([event[0] for event in timing.events])
+        self.assertEqual(phases, set(['imports', 'handler', 'commit']))
+
+    def test_cache_not_used(self):
+        from pyramid_zcml import ZCMLProfiler
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        config = self._makeOne()
+        config.load_zcml(self.zcml, profiler=ZCMLProfiler(),
+                         cache_dir=cache_dir)
+        self.assertFalse(os.path.exists(cache_dir))
+
+class TestZCMLProfiler(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_zcml import ZCMLProfiler
+        ticks = iter(range(100))
+        return ZCMLProfiler(clock=lambda: next(ticks))
+
+    def _populate(self, profiler):
+        info = Dummy()
+        info.file = 'configure.zcml'
+        info.line = 3
+        fast = profiler.directive('route', info)
+        slow = profiler.directive('view', 'info')
+        profiler.timed(fast, 'handler', 'route', lambda: None)
+        profiler.timed(slow, 'imports', 'a.b', lambda: None)
+        profiler.timed(slow, 'commit', 'view', lambda: profiler.clock())
+        return fast, slow
+
+    def test_timed(self):
+        profiler = self._makeOne()
+        fast, slow = self._populate(profiler)
+        self.assertEqual(fast.handler, 1)
+        self.assertEqual(slow.imports, 1)
+        self.assertEqual(slow.commit, 2)
+        self.assertEqual(slow.total, 3)
+        self.assertEqual(slow.events[1], ('commit', 'view', 5, 2))
+
+    def test_report(self):
+        profiler = self._makeOne()
+        self._populate(profiler)
+        lines = profiler.report().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(' info'))
+        self.assertTrue(lines[2].endswith(' configure.zcml:3'))
+        lines = profiler.report(sort='handler', limit=1).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue('route' in lines[1])
+
+    def test_write_trace(self):
+        import json
+        import tempfile
+        profiler = self._makeOne()
+        self._populate(profiler)
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            profiler.write_trace(filename)
+            with open(filename) as f:
+                trace = json.load(f)
+        finally:
+            os.unlink(filename)
+        events = trace['traceEvents']
+        self.assertEqual([e['cat'] for e in events],
+                         ['handler', 'imports', 'commit'])
+        self.assertEqual(events[2]['ts'], 5e6)
+        self.assertEqual(events[2]['dur'], 2e6)
+        self.assertEqual(events[2]['tid'], 2)
+        self.assertEqual(events[0]['args'],
+                         {'directive': 'route',
+                          'location': 'configure.zcml:3'})
+
+class TestLazyObject(unittest.TestCase):
+    def _makeOne(self, name, package_name=None, info=None):
+        from pyramid_zcml import LazyObject
+        return LazyObject(name, package_name, info)
+
+    def test_names_without_import(self):
+        ob = self._makeOne('.views.fixture_view',
+                           'pyramid_zcml.tests.fixtureapp')
+        self.assertEqual(ob.__module__, 'pyramid_zcml.tests.fixtureapp.views')
+        self.assertEqual(ob.__name__, 'fixture_view')
+        self.assertRaises(AttributeError, getattr, ob, '__permitted__')
+        self.assertEqual(
+            repr(ob), '<LazyObject pyramid_zcml.tests.fixtureapp.views.'
+            'fixture_view>')
+
+    def test_call_and_getattr_resolve(self):
+        ob = self._makeOne('pyramid_zcml.tests.test_units.DummyLazyTarget')
+        self.assertEqual(ob(1).ob, 1)
+        self.assertEqual(ob.attr, 'attr')
+
+    def test_pickle(self):
+        import pickle
+        ob = self._makeOne('.test_units.DummyLazyTarget', 'pyramid_zcml.tests',
+                           'info')
+        ob = pickle.loads(pickle.dumps(ob))
+        self.assertEqual(ob._lazy_info, 'info')
+        self.assertEqual(ob(1).ob, 1)
+
+    def test_resolve_lazy(self):
+        from pyramid_zcml._lazy import resolve_lazy
+        ob = self._makeOne('pyramid_zcml.tests.test_units.DummyLazyTarget')
+        self.assertTrue(resolve_lazy(ob) is DummyLazyTarget)
+        self.assertTrue(resolve_lazy(DummyLazyTarget) is DummyLazyTarget)
+
+    def test_view_mapper_uses_default_mapper(self):
+        ob = self._makeOne('pyramid_zcml.tests.test_units.dummy_lazy_view')
+        mapped = ob.__view_mapper__(attr=None)(ob)
+        self.assertEqual(mapped(None, 'request'), 'request')
+        self.assertEqual(mapped(None, 'request2'), 'request2')
+
+class TestLazyGlobalObject(unittest.TestCase):
+    def _makeOne(self, lazy_imports):
+        from zope.configuration.config import ConfigurationMachine
+        from pyramid_zcml._lazy import LazyGlobalObject
+        import pyramid_zcml.tests
+        context = ConfigurationMachine()
+        context.package = pyramid_zcml.tests
+        context.lazy_imports = lazy_imports
+        return LazyGlobalObject().bind(context)
+
+    def test_eager(self):
+        field = self._makeOne(False)
+        self.assertTrue(
+            field.fromUnicode('.test_units.DummyFactory') is DummyFactory)
+
+    def test_lazy(self):
+        from pyramid_zcml import LazyObject
+        field = self._makeOne(True)
+        ob = field.fromUnicode(' .test_units.Missing ')
+        self.assertTrue(isinstance(ob, LazyObject))
+        self.assertEqual(ob.__module__, 'pyramid_zcml.tests.test_units')
+        self.assertEqual(field.fromUnicode('*'), None)
+
+    def test_lazy_invalid_name(self):
+        from zope.schema import ValidationError
+        field = self._makeOne(True)
+        self.assertRaises(ValidationError, field.fromUnicode, 'not a name')
+
+class Test_validate_lazy_imports(unittest.TestCase):
+    def _callFUT(self, registry):
+        from pyramid_zcml import validate_lazy_imports
+        return validate_lazy_imports(registry)
+
+    def _load(self, zcml):
+        import tempfile
+        from pyramid.config import Configurator
+        from pyramid_zcml import load_zcml
+        fd, filename = tempfile.mkstemp(suffix='.zcml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(zcml)
+        try:
+            config = Configurator(settings={'pyramid_zcml.lazy_imports':'1'})
+            config.add_directive('load_zcml', load_zcml, action_wrap=False)
+            config.load_zcml(filename)
+            config.commit()
+        finally:
+            os.unlink(filename)
+        return config.registry
+
+    def test_reports_missing(self):
+        from pyramid.exceptions import ConfigurationError
+        registry = self._load(LAZY_ZCML)
+        try:
+            self._callFUT(registry)
+        except ConfigurationError as e:
+            self.assertTrue('pyramid_zcml.tests.missing.view' in str(e))
+            self.assertTrue('pyramid_zcml.tests.missing.factory' in str(e))
+            self.assertTrue('pyramid_zcml.tests.missing.handler' in str(e))
+            self.assertTrue(
+                'pyramid_zcml.tests.missing.async_handler' in str(e))
+        else: # pragma: no cover
+            raise AssertionError('not raised')
+
+    def test_nothing_lazy(self):
+        from pyramid.config import Configurator
+        self._callFUT(Configurator().registry)
+
+class Test_parse_zcml(unittest.TestCase):
+    def _callFUT(self, *arg, **kw):
+        from pyramid_zcml import parse_zcml
+        return parse_zcml(*arg, **kw)
+
+    def test_apply_to_many_configurators(self):
+        import pyramid_zcml
+        from pyramid.config import Configurator
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        template = self._callFUT(
+            'pyramid_zcml.tests.fixtureapp:configure.zcml',
+            features=['feature1'])
+        original = pyramid_zcml.include
+        def fail(*arg, **kw): # pragma: no cover
+            raise AssertionError('parsed')
+        pyramid_zcml.include = fail
+        try:
+            registries = []
+            for i in range(2):
+                config = Configurator()
+                template.apply(config)
+                config.commit()
+                registries.append(config.registry)
+        finally:
+            pyramid_zcml.include = original
+        self.assertFalse(registries[0] is registries[1])
+        for registry in registries:
+            self.assertTrue(registry.queryUtility(IFixture))
+            self.assertTrue(registry.queryUtility(IFixture, name='feature1'))
+
+    def test_relative_to_package(self):
+        import pyramid_zcml.tests.fixtureapp
+        template = self._callFUT(
+            'configure.zcml', package=pyramid_zcml.tests.fixtureapp)
+        self.assertTrue(template.records)
+
+    def test_apply_autocommit(self):
+        from pyramid.config import Configurator
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        template = self._callFUT(
+            'pyramid_zcml.tests.fixtureapp:configure.zcml')
+        config = Configurator(autocommit=True)
+        template.apply(config, lock=DummyLock())
+        self.assertTrue(config.registry.queryUtility(IFixture))
+
+class Test_new_machine(unittest.TestCase):
+    def _callFUT(self, *arg):
+        from pyramid_zcml._machine import new_machine
+        return new_machine(*arg)
+
+    def test_directives_registered(self):
+        from zope.configuration.config import ConfigurationMachine
+        machine = self._callFUT()
+        factory = machine.factory(
+            ConfigurationMachine(), ('http://pylonshq.com/pyramid', 'view'))
+        self.assertTrue(factory)
+        meta = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                            'meta.zcml')
+        self.assertTrue(meta in machine._seen_files)
+        self.assertEqual(machine.actions, [])
+        self.assertEqual(machine.stack[0].context, machine)
+
+    def test_state_not_shared(self):
+        machine1 = self._callFUT()
+        machine2 = self._callFUT()
+        machine1.processFile('/foo.zcml')
+        machine1.provideFeature('feature1')
+        self.assertTrue(machine2.processFile('/foo.zcml'))
+        self.assertFalse(machine2.hasFeature('feature1'))
+        self.assertFalse(machine1._docRegistry is machine2._docRegistry)
+
+    def test_register_copies_on_write(self):
+        from zope.interface import Interface
+        from zope.interface import alsoProvides
+        from zope.configuration.config import ConfigurationMachine
+        from zope.configuration.exceptions import ConfigurationError
+        name = ('http://pylonshq.com/pyramid', 'view')
+        machine1 = self._callFUT()
+        machine2 = self._callFUT()
+        class IOther(Interface):
+            pass
+        other = Dummy()
+        alsoProvides(other, IOther)
+        handler = object()
+        machine1.register(IOther, name, handler)
+        self.assertTrue(machine1.factory(other, name) is handler)
+        self.assertTrue(machine1.factory(ConfigurationMachine(), name))
+        self.assertRaises(ConfigurationError, machine2.factory, other, name)
+        self.assertRaises(ConfigurationError, self._callFUT().factory, other,
+                          name)
+
+    def test_machine_class(self):
+        from pyramid_zcml._recording import RecordingMachine
+        machine = self._callFUT(RecordingMachine)
+        self.assertTrue(isinstance(machine, RecordingMachine))
+        self.assertEqual(machine.recorded, [])
+
+class Test_batch_registrations(unittest.TestCase):
+    def _callFUT(self, registry, actions):
+        from pyramid_zcml._bulk import batch_registrations
+        return batch_registrations(registry, actions)
+
+    def _action(self, discriminator, callable, args=(), kw=None, order=0):
+        return dict(discriminator=discriminator, callable=callable,
+                    args=args, kw=kw or {}, order=order, includepath=(),
+                    info='info', introspectables=())
+
+    def _utility(self, registry, name, order=0):
+        return self._action(('utility', IDummy, name),
+                            registry.registerUtility,
+                            (DummyFactory(), IDummy, name, 'info'),
+                            order=order)
+
+    def _adapter(self, registry, name):
+        return self._action(('adapter', (IDummy,), IFactory, name),
+                            registry.registerAdapter,
+                            (DummyLazyTarget, (IDummy,), IFactory, name,
+                             'info'))
+
+    def test_runs_are_batched(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        other = self._action(None, lambda: None)
+        actions = [self._utility(registry, 'a'), self._adapter(registry, 'b'),
+                   other, self._utility(registry, 'c'),
+                   self._utility(registry, 'd')]
+        result = self._callFUT(registry, actions)
+        self.assertEqual(len(result), 7)
+        self.assertEqual([a['discriminator'] for a in result],
+                         [('utility', IDummy, 'a'),
+                          ('adapter', (IDummy,), IFactory, 'b'),
+                          None, None,
+                          ('utility', IDummy, 'c'),
+                          ('utility', IDummy, 'd'),
+                          None])
+        self.assertTrue(result[3] is other)
+        self.assertEqual(result[0]['args'][0], 'registerUtility')
+        self.assertEqual(result[1]['args'][0], 'registerAdapter')
+        self.assertEqual(result[2]['callable'].__name__, 'flush')
+        self.assertEqual(result[2]['introspectables'], ())
+        self.assertEqual(actions[0]['callable'], registry.registerUtility)
+        for action in result:
+            action['callable'](*action['args'], **action['kw'])
+        self.assertEqual(sorted(
+            [name for name, u in registry.getUtilitiesFor(IDummy)]),
+            ['a', 'c', 'd'])
+        self.assertTrue(
+            registry.queryAdapter(Dummy(), IFactory, name='b') is None)
+        context = Dummy()
+        from zope.interface import alsoProvides
+        alsoProvides(context, IDummy)
+        adapter = registry.queryAdapter(context, IFactory, name='b')
+        self.assertTrue(isinstance(adapter, DummyLazyTarget))
+
+    def test_single_registration_not_batched(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        actions = [self._utility(registry, 'a'),
+                   self._action(None, lambda: None),
+                   self._utility(registry, 'b')]
+        self.assertEqual(self._callFUT(registry, actions), actions)
+
+    def test_order_ends_run(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        actions = [self._utility(registry, 'a'), self._utility(registry, 'b'),
+                   self._utility(registry, 'c', order=1)]
+        result = self._callFUT(registry, actions)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result[2]['callable'].__name__, 'flush')
+        self.assertTrue(result[3] is actions[2])
+
+    def test_other_registry_not_batched(self):
+        from pyramid.registry import Registry
+        registry = Registry()
+        actions = [self._utility(Registry(), 'a'),
+                   self._utility(Registry(), 'b')]
+        self.assertEqual(self._callFUT(registry, actions), actions)
+
+class Test_deferred_invalidation(unittest.TestCase):
+    def _callFUT(self, *registries):
+        from pyramid_zcml._bulk import deferred_invalidation
+        return deferred_invalidation(*registries)
+
+    def test_changed_once(self):
+        from zope.interface.adapter import AdapterRegistry
+        registry = AdapterRegistry()
+        changes = []
+        original = registry.changed
+        registry.changed = lambda ob: changes.append(ob) or original(ob)
+        saved = registry.changed
+        self.assertEqual(registry.lookup((IDummy,), IFactory, 'a'), None)
+        with self._callFUT(registry):
+            registry.register((IDummy,), IFactory, 'a', 'one')
+            registry.register((IDummy,), IFactory, 'b', 'two')
+            self.assertEqual(changes, [])
+        self.assertEqual(changes, [registry])
+        self.assertTrue(registry.changed is saved)
+        self.assertEqual(registry.lookup((IDummy,), IFactory, 'a'), 'one')
+
+    def test_subscribers_match_unbatched(self):
+        from zope.interface.adapter import AdapterRegistry
+        expected = AdapterRegistry()
+        registry = AdapterRegistry()
+        expected.subscribe((), IDummy, 'zero')
+        registry.subscribe((), IDummy, 'zero')
+        self.assertEqual(registry.subscriptions((), IDummy), ['zero'])
+        with self._callFUT(registry):
+            for value in ('one', 'two', 'three'):
+                registry.subscribe((), IDummy, value)
+            registry.subscribe((IDummy,), IFactory, 'four')
+            registry.unsubscribe((), IDummy, 'two')
+            registry.subscribe((), IDummy, 'five')
+        for value in ('one', 'two', 'three'):
+            expected.subscribe((), IDummy, value)
+        expected.subscribe((IDummy,), IFactory, 'four')
+        expected.unsubscribe((), IDummy, 'two')
+        expected.subscribe((), IDummy, 'five')
+        self.assertEqual(registry._subscribers, expected._subscribers)
+        self.assertEqual(registry._provided, expected._provided)
+        self.assertEqual(registry.subscriptions((), IDummy),
+                         ['zero', 'one', 'three', 'five'])
+        self.assertEqual(registry.subscriptions((IDummy,), IFactory),
+                         ['four'])
+        self.assertFalse('subscribe' in registry.__dict__)
+
+    def test_restored_on_error(self):
+        from zope.interface.adapter import AdapterRegistry
+        registry = AdapterRegistry()
+        def register():
+            with self._callFUT(registry):
+                registry.register((IDummy,), IFactory, '', 'one')
+                raise ValueError
+        self.assertRaises(ValueError, register)
+        self.assertFalse('changed' in registry.__dict__)
+        self.assertEqual(registry.lookup((IDummy,), IFactory), 'one')
+
+    def test_unsupported_registry_untouched(self):
+        from zope.interface.adapter import AdapterRegistry
+        class ListRegistry(AdapterRegistry):
+            _leafSequenceType = list
+        registry = ListRegistry()
+        with self._callFUT(registry):
+            self.assertFalse('changed' in registry.__dict__)
+            registry.subscribe((), IDummy, 'one')
+        self.assertEqual(registry.subscriptions((), IDummy), ['one'])
+
+    def test_old_zope_interface_untouched(self):
+        from zope.interface.adapter import AdapterRegistry
+        from zope.interface.adapter import BaseAdapterRegistry
+        registry = AdapterRegistry()
+        original = BaseAdapterRegistry._addValueToLeaf
+        del BaseAdapterRegistry._addValueToLeaf
+        try:
+            with self._callFUT(registry):
+                self.assertFalse('changed' in registry.__dict__)
+        finally:
+            BaseAdapterRegistry._addValueToLeaf = original
+
+class Test_warm_caches(unittest.TestCase):
+    def setUp(self):
+        from pyramid.config import Configurator
+        from pyramid.events import NewRequest
+        config = Configurator()
+        config.add_view(dummy_lazy_view, name='a', renderer='string')
+        config.add_view(dummy_lazy_view, context=DummyLazyTarget)
+        config.add_route('r', '/r', factory=DummyLazyTarget)
+        config.add_view(dummy_lazy_view, route_name='r', renderer='string')
+        config.add_subscriber(dummy_lazy_view, NewRequest)
+        config.registry.registerAdapter(DummyLazyTarget, (IDummy,), IFactory)
+        config.registry.registerUtility(DummyFactory(), IFactory, 'u')
+        config.commit()
+        self.registry = config.registry
+
+    def _callFUT(self, registry):
+        from pyramid_zcml import warm_caches
+        return warm_caches(registry)
+
+    def _uncached(self, name):
+        # record the lookups which miss the caches of the adapter registry
+        lookup = self.registry.adapters._v_lookup
+        misses = []
+        original = getattr(lookup, name)
+        def uncached(*arg):
+            misses.append(arg)
+            return original(*arg)
+        setattr(lookup, name, uncached)
+        return misses
+
+    def test_views(self):
+        from pyramid.interfaces import IRequest
+        from pyramid.interfaces import IRouteRequest
+        from pyramid.traversal import DefaultRootFactory
+        from zope.interface import Interface
+        from zope.interface import implementedBy
+        counts = self._callFUT(self.registry)
+        cache = self.registry._view_lookup_cache
+        root = implementedBy(DefaultRootFactory)
+        target = implementedBy(DummyLazyTarget)
+        route_iface = self.registry.getUtility(IRouteRequest, 'r')
+        self.assertTrue((IRequest, root, 'a') in cache)
+        self.assertTrue((IRequest, Interface, 'a') in cache)
+        self.assertTrue((IRequest, target, '') in cache)
+        self.assertTrue((route_iface, target, '') in cache)
+        self.assertFalse((IRequest, root, '') in cache)
+        self.assertTrue(counts['views'] >= 5)
+
+    def test_subscribers(self):
+        from pyramid.events import NewRequest
+        self._callFUT(self.registry)
+        misses = self._uncached('_uncached_subscriptions')
+        self.registry.notify(NewRequest(DummyRequest()))
+        self.assertEqual(misses, [])
+
+    def test_adapters_and_utilities(self):
+        counts = self._callFUT(self.registry)
+        misses = self._uncached('_uncached_lookup')
+        context = Dummy()
+        from zope.interface import alsoProvides
+        alsoProvides(context, IDummy)
+        self.assertTrue(isinstance(
+            self.registry.adapters.lookup((IDummy,), IFactory),
+            type))
+        self.assertEqual(misses, [])
+        self.assertTrue(self.registry.queryUtility(IFactory, 'u'))
+        self.assertEqual(counts['adapters'] > 0, True)
+        self.assertEqual(counts['utilities'] > 0, True)
+        self.assertEqual(counts['subscribers'], 1)
+
+    def test_load_zcml_warm_caches(self):
+        from pyramid.config import Configurator
+        from pyramid.events import ApplicationCreated
+        from pyramid.interfaces import IRequest
+        from pyramid.traversal import DefaultRootFactory
+        from zope.interface import implementedBy
+        config = Configurator()
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                         warm_caches=True)
+        config.load_zcml('pyramid_zcml.tests.routesapp:configure.zcml',
+                         warm_caches=True)
+        config.commit()
+        created = implementedBy(ApplicationCreated)
+        handlers = [reg for reg in config.registry.registeredHandlers()
+                    if reg.required == (created,)]
+        self.assertEqual(len(handlers), 1)
+        cache = config.registry._view_lookup_cache
+        self.assertEqual(len(cache), 0)
+        config.make_wsgi_app()
+        self.assertTrue(
+            (IRequest, implementedBy(DefaultRootFactory), '') in cache)
+
+    def test_load_zcml_warm_caches_setting(self):
+        from pyramid.config import Configurator
+        config = Configurator(settings={'pyramid_zcml.warm_caches': 'true'})
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        config.make_wsgi_app()
+        self.assertTrue(config.registry._view_lookup_cache)
+
+class TestDispatchTable(unittest.TestCase):
+    def setUp(self):
+        from pyramid.config import Configurator
+        from pyramid.events import NewRequest
+        self.config = Configurator()
+        self.called = []
+        self.config.add_subscriber(self._handler('a'), NewRequest)
+        self.config.add_subscriber(self._handler('b'), NewRequest)
+        self.config.commit()
+        self.registry = self.config.registry
+
+    def _handler(self, name):
+        def handler(*events):
+            self.called.append((name,) + events)
+        return handler
+
+    def _callFUT(self, registry):
+        from pyramid_zcml import dispatch_table
+        return dispatch_table(registry)
+
+    def _uncached(self):
+        lookup = self.registry.adapters._v_lookup
+        misses = []
+        original = lookup._uncached_subscriptions
+        def uncached(*arg):
+            misses.append(arg)
+            return original(*arg)
+        lookup._uncached_subscriptions = uncached
+        return misses
+
+    def test_installed_once(self):
+        from pyramid_zcml import DispatchTable
+        table = self._callFUT(self.registry)
+        self.assertTrue(isinstance(table, DispatchTable))
+        self.assertEqual(self.registry.notify, table.notify)
+        self.assertTrue(self._callFUT(self.registry) is table)
+
+    def test_notify(self):
+        from pyramid.events import NewRequest
+        from pyramid.events import NewResponse
+        self._callFUT(self.registry)
+        event = NewRequest(None)
+        self.registry.notify(event)
+        self.assertEqual(self.called, [('a', event), ('b', event)])
+        misses = self._uncached()
+        self.registry.notify(event)
+        self.registry.notify(NewResponse(None, None))
+        self.assertEqual(len(self.called), 4)
+        self.assertEqual(len(misses), 1) # NewResponse, not yet seen
+
+    def test_compile(self):
+        from pyramid.events import NewRequest
+        from pyramid.events import NewResponse
+        table = self._callFUT(self.registry)
+        table.compile()
+        misses = self._uncached()
+        self.registry.notify(NewRequest(None))
+        self.registry.notify(NewResponse(None, None))
+        self.assertEqual(misses, [])
+        self.assertEqual(len(self.called), 2)
+
+    def test_compile_registered_classes(self):
+        self.config.add_subscriber(self._handler('c'), DummyLazyTarget)
+        self.config.commit()
+        table = self._callFUT(self.registry)
+        table.compile(classes=())
+        misses = self._uncached()
+        event = DummyLazyTarget(None)
+        self.registry.notify(event)
+        self.assertEqual(misses, [])
+        self.assertEqual(self.called, [('c', event)])
+
+    def test_invalidated_by_registration(self):
+        from pyramid.events import NewRequest
+        self._callFUT(self.registry).compile()
+        self.config.add_subscriber(self._handler('c'), NewRequest)
+        self.config.commit()
+        event = NewRequest(None)
+        self.registry.notify(event)
+        self.assertEqual([c[0] for c in self.called], ['a', 'b', 'c'])
+
+    def test_invalidated_by_new_lookup(self):
+        from pyramid.events import NewRequest
+        self._callFUT(self.registry).compile()
+        self.registry.adapters._createLookup()
+        self.registry.registerHandler(self._handler('c'), (NewRequest,))
+        self.registry.notify(NewRequest(None))
+        self.assertEqual([c[0] for c in self.called], ['a', 'b', 'c'])
+
+    def test_several_events(self):
+        from zope.interface import Interface
+        self.registry.registerHandler(self._handler('multi'),
+                                      (Interface, Interface))
+        self._callFUT(self.registry)
+        self.registry.notify(1, 2)
+        self.assertEqual(self.called, [('multi', 1, 2)])
+
+    def test_no_listeners(self):
+        from pyramid.events import NewRequest
+        self._callFUT(self.registry)
+        self.registry.has_listeners = False
+        self.registry.notify(NewRequest(None))
+        self.assertEqual(self.called, [])
+
+    def test_load_zcml_compile_events(self):
+        from pyramid.config import Configurator
+        from pyramid.events import NewRequest
+        from zope.interface import implementedBy
+        from pyramid_zcml._dispatch import DispatchTable
+        config = Configurator()
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.lazyapp:configure.zcml',
+                         compile_events=True)
+        table = config.registry._pyramid_zcml_dispatch_table
+        self.assertTrue(isinstance(table, DispatchTable))
+        self.assertEqual(table.table, {})
+        config.commit()
+        self.assertEqual(len(table.table[implementedBy(NewRequest)]), 1)
+
+    def test_load_zcml_compile_events_setting(self):
+        from pyramid.config import Configurator
+        config = Configurator(settings={'pyramid_zcml.compile_events': 'on'})
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        self.assertTrue(
+            '_pyramid_zcml_dispatch_table' in config.registry.__dict__)
+
+class TestSharedPredicate(unittest.TestCase):
+    def _makeOne(self, predicate):
+        from pyramid_zcml import SharedPredicate
+        return SharedPredicate(predicate)
+
+    def test_text_and_phash(self):
+        from pyramid.predicates import HeaderPredicate
+        shared = self._makeOne(HeaderPredicate('X-Api-Version:1', None))
+        self.assertEqual(shared.text(), 'header X-Api-Version=1')
+        self.assertEqual(shared.phash(), 'header X-Api-Version=1')
+
+    def test_evaluated_once_per_request(self):
+        calls = []
+        def predicate(context, request):
+            calls.append(context)
+            return False
+        shared = self._makeOne(predicate)
+        request = DummyRequest()
+        self.assertFalse(shared('a', request))
+        self.assertFalse(shared('b', request))
+        self.assertEqual(calls, ['a'])
+        self.assertFalse(shared('c', DummyRequest()))
+        self.assertEqual(calls, ['a', 'c'])
+
+class TestPredicateInterner(unittest.TestCase):
+    def setUp(self):
+        from pyramid.config import Configurator
+        self.config = Configurator()
+
+    def _callFUT(self, registry):
+        from pyramid_zcml import predicate_interner
+        return predicate_interner(registry)
+
+    def _make(self, type='view', **kw):
+        self._callFUT(self.config.registry).install(self.config)
+        self.config.commit()
+        return self.config.get_predlist(type).make(self.config, **kw)[1]
+
+    def test_once_per_registry(self):
+        from pyramid_zcml import PredicateInterner
+        interner = self._callFUT(self.config.registry)
+        self.assertTrue(isinstance(interner, PredicateInterner))
+        self.assertTrue(self._callFUT(self.config.registry) is interner)
+
+    def test_install_twice(self):
+        interner = self._callFUT(self.config.registry)
+        interner.install(self.config)
+        make = self.config.get_predlist('view').make
+        interner.install(self.config)
+        self.assertTrue(self.config.get_predlist('view').make is make)
+
+    def test_shared_by_views_and_routes(self):
+        from pyramid_zcml import SharedPredicate
+        path_info, header = self._make(header='X-Api-Version:1',
+                                       path_info='^/api')
+        self.assertTrue(isinstance(header, SharedPredicate))
+        self.assertEqual(header.text(), 'header X-Api-Version=1')
+        self.assertEqual(self._make(header='X-Api-Version:1'), [header])
+        self.assertEqual(self._make('route', header='X-Api-Version:1',
+                                    path_info='^/api'), [path_info, header])
+        self.assertNotEqual(self._make(header='X-Api-Version:2'), [header])
+
+    def test_same_meaning(self):
+        request_param, = self._make(request_param=['a', 'b=1'])
+        self.assertEqual(self._make(request_param=('b=1', 'a')),
+                         [request_param])
+        accept, = self._make(accept='text/html')
+        self.assertEqual(self._make(accept='text/html'), [accept])
+
+    def test_notted(self):
+        from pyramid.config import not_
+        header, = self._make(header='X-Api-Version:1')
+        notted, = self._make(header=not_('X-Api-Version:1'))
+        self.assertTrue(notted.predicate is header)
+        request = DummyRequest()
+        request.headers = {'X-Api-Version': '1'}
+        self.assertTrue(header(None, request))
+        self.assertFalse(notted(None, request))
+
+    def test_other_predicates_not_shared(self):
+        from pyramid_zcml import SharedPredicate
+        xhr, = self._make(xhr=True)
+        self.assertFalse(isinstance(xhr, SharedPredicate))
+
+    def test_overridden_predicate_not_shared(self):
+        self.config.add_view_predicate('header', DummyPredicate)
+        header, = self._make(header='X-Api-Version:1')
+        self.assertTrue(isinstance(header, DummyPredicate))
+
+    def test_unhashable_value(self):
+        interner = self._callFUT(self.config.registry)
+        value = DummyUnhashable(['a'])
+        shared = interner.predicate(DummyPredicate, value, None)
+        self.assertEqual(shared.predicate.value, value)
+        self.assertTrue(interner.predicate(DummyPredicate, value, None)
+                        is shared)
+
+    def test_load_zcml_intern_predicates(self):
+        from pyramid_zcml import SharedPredicate
+        config = self.config
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                         intern_predicates=True)
+        config.commit()
+        header, = config.get_predlist('view').make(config, header='X')[1]
+        self.assertTrue(isinstance(header, SharedPredicate))
+
+    def test_load_zcml_intern_predicates_setting(self):
+        from pyramid.config import Configurator
+        config = Configurator(
+            settings={'pyramid_zcml.intern_predicates': 'on'})
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        self.assertTrue(
+            '_pyramid_zcml_predicate_interner' in config.registry.__dict__)
+
+    def test_load_zcml_without_intern_predicates(self):
+        config = self.config
+        config.include('pyramid_zcml')
+        config.load_zcml('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        self.assertFalse(
+            '_pyramid_zcml_predicate_interner' in config.registry.__dict__)
+
+class TestDocumentCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.zcml = os.path.join(self.tmpdir, 'configure.zcml')
+        self._writeZCML('one', 1000000000)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _writeZCML(self, name, mtime, filename=None):
+        filename = filename or self.zcml
+        with open(filename, 'w') as f:
+            f.write(CACHE_ZCML % name)
+        os.utime(filename, (mtime, mtime))
+
+    def _makeOne(self):
+        from pyramid_zcml._documents import DocumentCache
+        return DocumentCache()
+
+    def _events(self, document):
+        return [event for event in document.events
+                if event[0] == 'startElementNS']
+
+    def test_hit(self):
+        cache = self._makeOne()
+        self.assertEqual(cache.hit_rate, 0.0)
+        document = cache.get(self.zcml)
+        self.assertTrue(cache.get(self.zcml) is document)
+        self.assertEqual(document.name, self.zcml)
+        self.assertEqual(len(self._events(document)), 3)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1,
+                                         'hit_rate': 0.5, 'documents': 1})
+
+    def test_changed_file_reparsed(self):
+        cache = self._makeOne()
+        document = cache.get(self.zcml)
+        self._writeZCML('two', 1000000001)
+        self.assertFalse(cache.get(self.zcml) is document)
+        self.assertEqual(cache.misses, 2)
+
+    def test_in_fallback(self):
+        cache = self._makeOne()
+        filename = os.path.join(self.tmpdir, 'other.zcml')
+        self._writeZCML('one', 1000000000, filename + '.in')
+        document = cache.get(filename)
+        self.assertEqual(document.name, filename + '.in')
+        self.assertTrue(cache.get(filename) is document)
+
+    def test_missing_file(self):
+        cache = self._makeOne()
+        self.assertRaises(IOError, cache.get,
+                          os.path.join(self.tmpdir, 'missing.zcml'))
+
+    def test_parse_error(self):
+        from zope.configuration.xmlconfig import ZopeSAXParseException
+        with open(self.zcml, 'w') as f:
+            f.write('<configure>')
+        cache = self._makeOne()
+        self.assertRaises(ZopeSAXParseException, cache.get, self.zcml)
+
+    def test_clear(self):
+        cache = self._makeOne()
+        cache.get(self.zcml)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0,
+                                         'hit_rate': 0.0, 'documents': 0})
+
+    def test_used_by_load_zcml(self):
+        from pyramid.config import Configurator
+        from pyramid_zcml import document_cache
+        from pyramid_zcml import load_zcml
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        hits = document_cache.hits
+        for i in range(2):
+            config = Configurator()
+            config.add_directive('load_zcml', load_zcml, action_wrap=False)
+            config.load_zcml(self.zcml)
+            config.commit()
+            self.assertTrue(config.registry.queryUtility(IFixture,
+                                                         name='one'))
+        self.assertEqual(document_cache.hits, hits + 1)
+
+class TestRecordingMachine(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_zcml._recording import RecordingMachine
+        return RecordingMachine()
+
+    def test_template_none_when_actions_unaccounted_for(self):
+        machine = self._makeOne()
+        machine.action(None)
+        self.assertEqual(machine.template(), None)
+
+    def test_template_empty(self):
+        machine = self._makeOne()
+        self.assertEqual(machine.template().records, [])
+
+class TestActionCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self):
+        from pyramid_zcml._recording import ActionCache
+        return ActionCache(self.tmpdir)
+
+    def test_load_missing(self):
+        cache = self._makeOne()
+        self.assertEqual(cache.load('pkg', 'configure.zcml', ()), None)
+
+    def test_store_unpicklable(self):
+        from pyramid_zcml._recording import ZCMLTemplate
+        cache = self._makeOne()
+        template = ZCMLTemplate([lambda *arg: None])
+        with self.assertLogs('pyramid_zcml', 'WARNING') as logs:
+            self.assertFalse(cache.store('pkg', 'configure.zcml', (), [],
+                                         template))
+        self.assertTrue('Cannot cache the ZCML of configure.zcml (pkg)'
+                        in logs.output[0])
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_store_module(self):
+        import pyramid_zcml.tests.fixtureapp as module
+        from pyramid_zcml._recording import ZCMLTemplate
+        cache = self._makeOne()
+        self.assertTrue(cache.store('pkg', 'configure.zcml', (), [],
+                                    ZCMLTemplate([module])))
+        self.assertTrue(cache.load('pkg', 'configure.zcml', ()).records[0]
+                        is module)
+
+    def test_store_and_load(self):
+        from pyramid_zcml._recording import ZCMLTemplate
+        cache = self._makeOne()
+        self.assertTrue(cache.store('pkg', 'configure.zcml', (), [],
+                                    ZCMLTemplate([])))
+        self.assertEqual(cache.load('pkg', 'configure.zcml', ()).records,
+                         [])
+
+    def test_load_wrong_version(self):
+        import pickle
+        cache = self._makeOne()
+        path = cache._path('pkg', 'configure.zcml', ())
+        with open(path, 'wb') as f:
+            pickle.dump((-1, [], [], None), f)
+        self.assertEqual(cache.load('pkg', 'configure.zcml', ()), None)
+
+class TestPZCMLCompileCommand(unittest.TestCase):
+    def _makeOne(self, *args):
+        from pyramid_zcml.scripts.pzcmlcompile import PZCMLCompileCommand
+        from io import StringIO
+        cmd = PZCMLCompileCommand(('pzcml-compile',) + args, quiet=True)
+        cmd.stdout = StringIO()
+        return cmd
+
+    def test_to_stdout(self):
+        cmd = self._makeOne('pyramid_zcml.tests.fixtureapp:configure.zcml',
+                            '-f', 'feature1')
+        self.assertEqual(cmd.run(), 0)
+        source = cmd.stdout.getvalue()
+        self.assertTrue('with features feature1' in source)
+        self.assertTrue(
+            'pyramid_zcml.tests.fixtureapp.views.fixture_view' in source)
+        self.assertTrue("'name': 'feature1'" in source)
+        compile(source, 'compiled.py', 'exec')
+
+    def test_unimportable_reference(self):
+        from pyramid_zcml.scripts import pzcmlcompile
+        from pyramid_zcml._recording import ZCMLTemplate
+        from pyramid_zcml._recording import DirectiveRecord
+        record = DirectiveRecord(lambda *arg: None, {}, None, None, None, ())
+        def record_zcml(config, spec, features, lazy_imports):
+            return ZCMLTemplate([record])
+        cmd = self._makeOne('pyramid_zcml.tests.fixtureapp:configure.zcml')
+        original = pzcmlcompile._record_zcml
+        pzcmlcompile._record_zcml = record_zcml
+        try:
+            self.assertEqual(cmd.run(), 1)
+        finally:
+            pzcmlcompile._record_zcml = original
+
+class TestPZCMLReplayCommand(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        fd, self.filename = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(fd, 'w') as f:
+            f.write('127.0.0.1 - - [17/Oct/2026:10:00:00 +0000] '
+                    '"GET /abc HTTP/1.1" 200 5 "-" "curl/8.0"\n'
+                    '/def\n'
+                    'GET /jkl\n'
+                    '{"url": "/error", "method": "post"}\n')
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def _makeOne(self, *args):
+        from pyramid_zcml.scripts.pzcmlreplay import PZCMLReplayCommand
+        from io import StringIO
+        cmd = PZCMLReplayCommand(('pzcml-replay',) + args, quiet=True)
+        cmd.stdout = StringIO()
+        return cmd
+
+    def test_it(self):
+        cmd = self._makeOne('pyramid_zcml.tests.hybridapp:configure.zcml',
+                            self.filename, '-n', '2', '-w', '1')
+        self.assertEqual(cmd.run(), 0)
+        report = cmd.stdout.getvalue()
+        self.assertTrue(report.startswith('8 requests in '))
+        self.assertTrue('status: 200 x 6, 404 x 2' in report)
+        lines = report.splitlines()
+        route = [line for line in lines if line.startswith('route2 ')]
+        self.assertEqual(route[0].split()[1], '2')
+        view = [line for line in lines if line.startswith(
+            'pyramid_zcml.tests.hybridapp.views.erroneous_view ')]
+        self.assertEqual(view[0].split()[1], '2')
+
+    def test_no_requests(self):
+        from io import StringIO
+        cmd = self._makeOne('pyramid_zcml.tests.hybridapp:configure.zcml',
+                            '-')
+        cmd.stdin = StringIO('# nothing\n')
+        self.assertEqual(cmd.run(), 1)
+
+    def test_bad_setting(self):
+        cmd = self._makeOne('pyramid_zcml.tests.hybridapp:configure.zcml',
+                            self.filename, '-s', 'reload_templates')
+        self.assertEqual(cmd.run(), 2)
+
+class Test_parse_requests(unittest.TestCase):
+    def _callFUT(self, lines):
+        from pyramid_zcml.scripts.pzcmlreplay import parse_requests
+        return parse_requests(lines)
+
+    def test_formats(self):
+        requests = self._callFUT([
+            '10.0.0.1 - bob [17/Oct/2026:10:00:00 +0000] '
+            '"POST /login?next=%2F HTTP/1.1" 302 0 '
+            '"http://example.com/" "Mozilla/5.0 (X11)"',
+            '10.0.0.1 - - [17/Oct/2026:10:00:00 +0000] "GET / HTTP/1.0" 200 -',
+            '',
+            '# a comment',
+            '/a?b=c',
+            'delete /a/1',
+            '{"url": "/a", "method": "put", "headers": {"X-A": "1"}, '
+            '"body": "data"}',
+            '{"method": "GET"}',
+            '{broken',
+            'not a request at all',
+            ])
+        self.assertEqual(requests, [
+            ('POST', '/login?next=%2F',
+             {'Referer': 'http://example.com/',
+              'User-Agent': 'Mozilla/5.0 (X11)'}, None),
+            ('GET', '/', {}, None),
+            ('GET', '/a?b=c', {}, None),
+            ('DELETE', '/a/1', {}, None),
+            ('PUT', '/a', {'X-A': '1'}, b'data'),
+            ])
+
+class Test_percentile(unittest.TestCase):
+    def _callFUT(self, values, fraction):
+        from pyramid_zcml.scripts.pzcmlreplay import percentile
+        return percentile(values, fraction)
+
+    def test_it(self):
+        values = list(range(1, 101))
+        self.assertEqual(self._callFUT(values, 0.5), 50)
+        self.assertEqual(self._callFUT(values, 0.99), 99)
+        self.assertEqual(self._callFUT([3], 0.99), 3)
+        self.assertEqual(self._callFUT([], 0.5), 0.0)
+
+class Test_view_label(unittest.TestCase):
+    def _callFUT(self, view, attr=None):
+        from pyramid_zcml.scripts.pzcmlreplay import view_label
+        return view_label(view, attr)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT(DummyFactory),
+                         __name__ + '.DummyFactory')
+        self.assertEqual(self._callFUT(DummyFactory, 'list'),
+                         __name__ + '.DummyFactory.list')
+        self.assertEqual(self._callFUT(DummyFactory()),
+                         __name__ + '.DummyFactory')
+
+class Test_generate_module(unittest.TestCase):
+    def _callFUT(self, records):
+        from pyramid_zcml.scripts.pzcmlcompile import generate_module
+        from pyramid_zcml._recording import ZCMLTemplate
+        return generate_module(ZCMLTemplate(records), 'spec')
+
+    def _makeRecord(self, **kw):
+        from pyramid_zcml._recording import DirectiveRecord
+        from pyramid_zcml import view
+        return DirectiveRecord(view, kw, 'info', 'pyramid_zcml',
+                               '/not/in/package', ('/not/in/package/a',))
+
+    def test_values(self):
+        import pyramid_zcml.tests
+        source = self._callFUT([self._makeRecord(
+            a=1, b=True, c=None, d=['x', ('y',)], e=pyramid_zcml.tests,
+            f={'g':IDummy})])
+        self.assertTrue("'/not/in/package'" in source)
+        self.assertTrue("'e': pyramid_zcml.tests," in source)
+        self.assertTrue("'d': ['x', ('y',)]" in source)
+        self.assertTrue(
+            "'f': {'g': pyramid_zcml.tests.test_units.IDummy}" in source)
+        self.assertTrue('import pyramid_zcml.tests.test_units' in source)
+
+    def test_unimportable(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._callFUT,
+                          [self._makeRecord(a=object())])
+
+class Test_load_compiled_zcml(unittest.TestCase):
+    def test_it(self):
+        from pyramid.config import Configurator
+        from pyramid_zcml import load_compiled_zcml
+        from pyramid_zcml import utility
+        from pyramid_zcml.tests.fixtureapp.models import IFixture
+        from pyramid_zcml.tests.fixtureapp.models import fixture
+        config = Configurator(autocommit=True)
+        load_compiled_zcml(config, [
+            (utility, {'provides':IFixture, 'component':fixture}, 'info',
+             'pyramid_zcml.tests.fixtureapp', None, ())])
+        self.assertTrue(config.registry.queryUtility(IFixture) is fixture)
+
 class Test_includeme(unittest.TestCase):
     def test_it(self):
         from pyramid.config import Configurator
@@ -1226,12 +4078,34 @@ class DummyFactory(object):
     def __call__(self):
         """ """
         
+class DummyLazyTarget(object):
+    attr = 'attr'
+    def __init__(self, ob):
+        self.ob = ob
+
+def dummy_lazy_view(request):
+    return request
+
+class DummyExecutor(object):
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append((func, args))
+
 class DummyModule:
     __path__ = ["foo"]
     __name__ = "dummy"
     __file__ = ''
     scanned = False
 
+class DummyScanConfig(object):
+    def __init__(self):
+        self.scanned = []
+
+    def scan(self, package, **kw):
+        self.scanned.append((package, kw))
+
 class DummyContext:
     def __init__(self, resolved=DummyModule):
         self.actions = []
@@ -1295,6 +4169,12 @@ class TestMakeApp(unittest.TestCase):
                             Configurator=DummyConfigurator)
         self.assertEqual(app.zcml_file, '2.zcml')
 
+    def test_it_with_warm_caches(self):
+        rootfactory = object()
+        app = self._callFUT(rootfactory, Configurator=DummyConfigurator,
+                            warm_caches=True)
+        self.assertEqual(app.warm_caches, True)
+
 class Test_with_context(unittest.TestCase):
     def test_with_context(self):
         from pyramid_zcml import with_context
@@ -1321,6 +4201,45 @@ class Test_with_context(unittest.TestCase):
         self.assertEqual(newconfig.info, 'info')
         self.assertEqual(newconfig.introspection, True)
 
+    def test_with_context_clones_prototype_per_include_level(self):
+        from pyramid.config import Configurator
+        from pyramid_zcml import with_context
+        registry = Configurator().registry
+        class Dummy(object):
+            pass
+        context = Dummy()
+        context.configurators = {}
+        context.basepath = 'basepath'
+        context.includepath = ('spec',)
+        context.package = 'pyramid_zcml'
+        context.autocommit = False
+        context.registry = registry
+        context.route_prefix = 'buz'
+        context.introspection = True
+        context.info = 'info1'
+        context.config_class = Configurator
+        first = with_context(context)
+        context.info = 'info2'
+        second = with_context(context)
+        self.assertEqual(len(context.configurators), 1)
+        self.assertFalse(first is second)
+        self.assertEqual(first.info, 'info1')
+        self.assertEqual(second.info, 'info2')
+        self.assertEqual(second.registry, registry)
+        self.assertEqual(second.route_prefix, 'buz')
+        self.assertEqual(second.basepath, 'basepath')
+        self.assertEqual(second.includepath, ('spec',))
+        self.assertEqual(second.package_name, 'pyramid_zcml')
+        self.assertEqual(second._ainfo, [])
+        self.assertFalse(first._ainfo is second._ainfo)
+        self.assertFalse(
+            second._ainfo is context.configurators[
+                ('pyramid_zcml', 'basepath', ('spec',))]._ainfo)
+        context.includepath = ('spec', 'other')
+        third = with_context(context)
+        self.assertEqual(len(context.configurators), 2)
+        self.assertEqual(third.includepath, ('spec', 'other'))
+
 class Dummy:
     pass
 
@@ -1343,6 +4262,36 @@ class DummyRequest:
     def copy(self): # pragma: no cover
         return self
 
+class DummyLogger(object):
+    def __init__(self, messages):
+        self.messages = messages
+
+    def info(self, msg, *args):
+        self.messages.append(msg % args)
+
+class DummyDeriverInfo(object):
+    def __init__(self, view, **options):
+        self.original_view = view
+        self.options = options
+
+def dummy_view(context, request):
+    return 'OK'
+
+class DummyPredicate(object):
+    def __init__(self, value, info):
+        self.value = value
+
+    def text(self):
+        return 'dummy %s' % (self.value,)
+
+    phash = text
+
+    def __call__(self, context, request): # pragma: no cover
+        return True
+
+class DummyUnhashable(list):
+    pass
+
 class DummyPackage(object):
     def __init__(self, name):
         self.__name__ = name
@@ -1397,8 +4346,9 @@ class DummyConfigurator(object):
     def include(self, func):
         self.included.append(func)
 
-    def load_zcml(self, filename):
+    def load_zcml(self, filename, warm_caches=None):
         self.zcml_file = filename
+        self.warm_caches = warm_caches
 
     def make_wsgi_app(self):
         return self
@@ -1426,6 +4376,59 @@ class DummyZCMLContext(object):
     def action(self, *arg, **kw):
         self._ctx.action(*arg, **kw)
 
+CACHE_ZCML = """\
+<configure xmlns="http://pylonshq.com/pyramid">
+  <include package="pyramid_zcml" />
+  <utility
+     component="pyramid_zcml.tests.fixtureapp.models.fixture"
+     provides="pyramid_zcml.tests.fixtureapp.models.IFixture"
+     name="%s"
+     />
+</configure>
+"""
+
+GLOB_ZCML = """\
+<configure xmlns="http://pylonshq.com/pyramid">
+  <include package="pyramid_zcml" />
+  <include files="parts/*.zcml" />
+</configure>
+"""
+
+ASYNC_SUBSCRIBER_ZCML = """\
+<configure xmlns="http://pylonshq.com/pyramid">
+  <include package="pyramid_zcml"/>
+  <subscriber
+     handler="pyramid_zcml.tests.test_units.dummy_async_handler"
+     for="zope.interface.Interface"
+     %s
+     />
+</configure>
+"""
+
+def dummy_async_handler(event): # pragma: no cover
+    pass
+
+LAZY_ZCML = """\
+<configure xmlns="http://pylonshq.com/pyramid">
+  <include package="pyramid_zcml" />
+  <view view="pyramid_zcml.tests.missing.view" />
+  <adapter
+     factory="pyramid_zcml.tests.missing.factory"
+     for="zope.interface.Interface"
+     provides="pyramid_zcml.tests.test_units.IDummy"
+     />
+  <subscriber
+     handler="pyramid_zcml.tests.missing.handler"
+     for="zope.interface.Interface"
+     />
+  <subscriber
+     handler="pyramid_zcml.tests.missing.async_handler"
+     for="zope.interface.Interface"
+     async="true"
+     />
+</configure>
+"""
+
 def _execute_actions(actions):
     from pyramid.registry import undefer
     for action in sorted(actions, key=lambda x: x['order']):
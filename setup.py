@@ -84,6 +84,9 @@ setup(name='pyramid_zcml',
       pyramid_starter_zcml=pyramid_zcml.scaffolds:StarterZCMLProjectTemplate
       [pyramid.scaffold]
       pyramid_starter_zcml=pyramid_zcml.scaffolds:StarterZCMLProjectTemplate
+      [console_scripts]
+      pzcml-compile = pyramid_zcml.scripts.pzcmlcompile:main
+      pzcml-replay = pyramid_zcml.scripts.pzcmlreplay:main
       """
       )
 